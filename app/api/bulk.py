@@ -0,0 +1,347 @@
+"""Bulk create-or-update of patients, doctors and clinics.
+
+A request carries a JSON array, or one JSON object per line with
+``Content-Type: application/x-ndjson``. Every item is validated first,
+without touching the database, then the valid items are checked against the
+database and written ``BULK_CHUNK_SIZE`` at a time, each chunk with a few
+``IN`` lookups and ``bulk_create`` calls inside its own transaction. A chunk
+that fails on a concurrent write is checked and written once more.
+
+Users are matched on email and doctors on NPI: existing rows are updated
+with the item's fields, new ones created. Clinics have no natural key and
+are always created. The result of each item, in request order, is either
+``{"index": 0, "status": "created", "id": 12}`` (or ``"updated"``) or
+``{"index": 1, "status": "error", "errors": {...}}``.
+"""
+
+import codecs
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import BaseParser
+from rest_framework.serializers import as_serializer_error
+
+from core.matching import invalidate_matching
+from core.models import City, Clinic, Country, Doctor, Patient, Procedure, State
+from .serializers import (
+    BulkClinicSerializer,
+    BulkDoctorSerializer,
+    BulkPatientSerializer,
+)
+
+User = get_user_model()
+
+BULK_MAX_ITEMS = 10000
+BULK_CHUNK_SIZE = 1000
+
+PATIENT_FIELDS = [
+    "date_of_birth",
+    "address",
+    "phone_number",
+    "ssn_last_four",
+    "gender",
+]
+CLINIC_FIELDS = ["name", "address", "phone_number"]
+
+
+class NDJSONParser(BaseParser):
+    """Newline delimited JSON, parsed into a list of its documents."""
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return []
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        items = []
+        for number, line in enumerate(codecs.getreader(encoding)(stream), 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f"NDJSON parse error on line {number} - {exc}")
+        return items
+
+
+def upsert(model, objects, key, update_fields):
+    """Insert ``objects`` or update the rows with the same ``key``.
+
+    Return ``(pk, created)`` for each object, in order.
+    """
+    attname = model._meta.get_field(key).attname
+    keys = [getattr(obj, attname) for obj in objects]
+    lookup = {f"{attname}__in": keys}
+    existing = set(model.objects.filter(**lookup).values_list(attname, flat=True))
+    model.objects.bulk_create(
+        objects,
+        update_conflicts=True,
+        unique_fields=[key],
+        update_fields=update_fields,
+    )
+    pks = dict(model.objects.filter(**lookup).values_list(attname, "pk"))
+    return [(pks[value], value not in existing) for value in keys]
+
+
+class BulkUpsert:
+    """Validate and write a list of items with ``serializer_class``.
+
+    Subclasses implement ``check(chunk)``, which drops the items that
+    conflict with the database, and ``write(chunk)``.
+    """
+
+    serializer_class = None
+    # Fields that must be unique across the items of a request
+    unique_fields = ()
+
+    def __init__(self, items):
+        self.items = items
+        self.results = [None] * len(items)
+
+    def error(self, index, errors):
+        self.results[index] = {"index": index, "status": "error", "errors": errors}
+
+    def validate(self):
+        valid, seen = [], {field: set() for field in self.unique_fields}
+        # One serializer validates every item: building its fields costs more
+        # than validating an item
+        serializer = self.serializer_class()
+        for index, item in enumerate(self.items):
+            try:
+                data = serializer.run_validation(item)
+            except ValidationError as exc:
+                self.error(index, as_serializer_error(exc))
+                continue
+            duplicates = [field for field in seen if data[field] in seen[field]]
+            if duplicates:
+                self.error(
+                    index,
+                    {field: ["Duplicated in this request."] for field in duplicates},
+                )
+                continue
+            for field in seen:
+                seen[field].add(data[field])
+            valid.append((index, data))
+        return valid
+
+    def check(self, chunk):
+        return chunk
+
+    def write(self, chunk):
+        raise NotImplementedError
+
+    def run(self):
+        valid = self.validate()
+        for start in range(0, len(valid), BULK_CHUNK_SIZE):
+            self.write_chunk(valid[start : start + BULK_CHUNK_SIZE])
+        return self.results
+
+    def write_chunk(self, chunk, retries=1):
+        chunk = self.check(chunk)
+        try:
+            with transaction.atomic():
+                written = self.write([data for _, data in chunk])
+        except IntegrityError:
+            # A concurrent write took one of the keys since the check: check
+            # again, which reports the items it conflicts with, and write the
+            # others
+            if retries:
+                self.write_chunk(chunk, retries - 1)
+                return
+            for index, _ in chunk:
+                self.error(
+                    index,
+                    {"non_field_errors": ["Conflicting write, please retry."]},
+                )
+            return
+        for (index, _), (pk, created) in zip(chunk, written):
+            self.results[index] = {
+                "index": index,
+                "status": "created" if created else "updated",
+                "id": pk,
+            }
+
+
+class UserBulkUpsert(BulkUpsert):
+    """Items that carry the fields of their user, matched on email."""
+
+    unique_fields = ("email", "username")
+
+    def check(self, chunk):
+        emails = [data["email"] for _, data in chunk]
+        usernames = [data["username"] for _, data in chunk]
+        existing = User.objects.filter(
+            Q(email__in=emails) | Q(username__in=usernames)
+        ).values_list("email", "username")
+        known_emails = {email for email, _ in existing}
+        taken = {username for _, username in existing}
+        checked = []
+        for index, data in chunk:
+            if data["email"] not in known_emails and data["username"] in taken:
+                self.error(
+                    index, {"username": ["A user with that username already exists."]}
+                )
+            else:
+                checked.append((index, data))
+        return checked
+
+    def write_users(self, chunk):
+        """Upsert the users of ``chunk``, return their pks by email."""
+        password = make_password(None)
+        User.objects.bulk_create(
+            [
+                User(
+                    email=data["email"],
+                    username=data["username"],
+                    first_name=data["first_name"],
+                    last_name=data["last_name"],
+                    password=password,
+                )
+                for data in chunk
+            ],
+            update_conflicts=True,
+            unique_fields=["email"],
+            update_fields=["first_name", "last_name"],
+        )
+        return dict(
+            User.objects.filter(
+                email__in=[data["email"] for data in chunk]
+            ).values_list("email", "pk")
+        )
+
+
+class PatientBulkUpsert(UserBulkUpsert):
+    """Patients, matched on the email of their user."""
+
+    serializer_class = BulkPatientSerializer
+
+    def write(self, chunk):
+        users = self.write_users(chunk)
+        patients = [
+            Patient(
+                user_id=users[data["email"]],
+                **{field: data[field] for field in PATIENT_FIELDS},
+            )
+            for data in chunk
+        ]
+        return upsert(Patient, patients, "user", PATIENT_FIELDS)
+
+
+class DoctorBulkUpsert(UserBulkUpsert):
+    """Doctors, matched on NPI.
+
+    ``specialties``, when given, replace the doctor's specialties.
+    """
+
+    serializer_class = BulkDoctorSerializer
+    unique_fields = ("email", "username", "npi")
+
+    def check(self, chunk):
+        chunk = super().check(chunk)
+        npis = [data["npi"] for _, data in chunk]
+        emails = [data["email"] for _, data in chunk]
+        doctors = Doctor.objects.filter(
+            Q(npi__in=npis) | Q(user__email__in=emails)
+        ).values_list("npi", "user__email")
+        npi_emails = dict(doctors)
+        email_npis = {email: npi for npi, email in doctors}
+        procedures = set(
+            Procedure.objects.filter(
+                pk__in={pk for _, data in chunk for pk in data.get("specialties", [])}
+            ).values_list("pk", flat=True)
+        )
+        checked = []
+        for index, data in chunk:
+            errors = {}
+            if npi_emails.get(data["npi"], data["email"]) != data["email"]:
+                errors["npi"] = ["Belongs to a doctor with another email."]
+            if email_npis.get(data["email"], data["npi"]) != data["npi"]:
+                errors["email"] = ["Belongs to a doctor with another NPI."]
+            unknown = set(data.get("specialties", [])) - procedures
+            if unknown:
+                errors["specialties"] = [
+                    f"Unknown procedure {pk}." for pk in sorted(unknown)
+                ]
+            if errors:
+                self.error(index, errors)
+            else:
+                checked.append((index, data))
+        return checked
+
+    def write(self, chunk):
+        users = self.write_users(chunk)
+        doctors = [
+            Doctor(
+                user_id=users[data["email"]],
+                npi=data["npi"],
+                phone_number=data.get("phone_number", ""),
+            )
+            for data in chunk
+        ]
+        written = upsert(Doctor, doctors, "npi", ["phone_number"])
+
+        through = Doctor.specialties.through
+        specialties = {
+            pk: set(data["specialties"])
+            for data, (pk, _) in zip(chunk, written)
+            if "specialties" in data
+        }
+        through.objects.filter(doctor_id__in=specialties).delete()
+        through.objects.bulk_create(
+            [
+                through(doctor_id=doctor_id, procedure_id=procedure_id)
+                for doctor_id, procedure_ids in specialties.items()
+                for procedure_id in procedure_ids
+            ]
+        )
+        if specialties:
+            # The through table writes skip the m2m_changed signal
+            invalidate_matching()
+        return written
+
+
+class ClinicBulkUpsert(BulkUpsert):
+    """Clinics, always created."""
+
+    serializer_class = BulkClinicSerializer
+    locations = {"country": Country, "state": State, "city": City}
+
+    def check(self, chunk):
+        known = {
+            field: set(
+                model.objects.filter(
+                    pk__in={data.get(field) for _, data in chunk} - {None}
+                ).values_list("pk", flat=True)
+            )
+            for field, model in self.locations.items()
+        }
+        checked = []
+        for index, data in chunk:
+            errors = {
+                field: [f"Unknown {field} {data[field]}."]
+                for field in self.locations
+                if data.get(field) is not None and data[field] not in known[field]
+            }
+            if errors:
+                self.error(index, errors)
+            else:
+                checked.append((index, data))
+        return checked
+
+    def write(self, chunk):
+        clinics = Clinic.objects.bulk_create(
+            [
+                Clinic(
+                    **{field: data[field] for field in CLINIC_FIELDS},
+                    **{f"{field}_id": data.get(field) for field in self.locations},
+                )
+                for data in chunk
+            ]
+        )
+        return [(clinic.pk, True) for clinic in clinics]
@@ -0,0 +1,235 @@
+"""Streaming import of a clinic's patient roster and visit history from CSV.
+
+Each row holds a patient and, optionally, one of their visits; a patient
+with several visits is repeated on several rows::
+
+    email,first_name,last_name,date_of_birth,address,phone_number,ssn_last_four,gender,visit_date,doctor_npi,procedures,doctor_notes
+
+``username`` is an optional column, and the visit columns may be left
+empty. Rows are imported ``IMPORT_BATCH_SIZE`` at a time as they are read,
+each batch in its own transaction. Users and patients are upserted on email
+as by the bulk API, with an unusable password, and visits and their
+procedures are inserted with ``bulk_create``; a batch that fails on a
+concurrent write is checked and written once more. A visit already stored for
+the same patient, doctor and date is skipped, so a file can be imported
+again once its rejected rows are fixed.
+"""
+
+import csv
+from collections import Counter
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+from core.invites import pending_invites, send_invites
+from core.models import Clinic, Doctor, Procedure, Visit
+from core.stats import refresh_stats
+from .bulk import PatientBulkUpsert
+from .serializers import BulkPatientSerializer, ImportVisitSerializer
+
+IMPORT_BATCH_SIZE = 2000
+
+PATIENT_COLUMNS = [
+    "email",
+    "first_name",
+    "last_name",
+    "date_of_birth",
+    "address",
+    "phone_number",
+    "ssn_last_four",
+    "gender",
+]
+VISIT_COLUMNS = ["visit_date", "doctor_npi", "procedures", "doctor_notes"]
+
+
+class PatientImport:
+    """Import CSV rows into ``clinic``.
+
+    ``on_reject(line, row, errors)`` is called for every row left out.
+    With ``invite``, the users created by each batch are sent an invitation
+    once the batch is committed.
+    """
+
+    def __init__(
+        self, clinic, batch_size=IMPORT_BATCH_SIZE, on_reject=None, invite=False
+    ):
+        self.clinic = clinic
+        self.batch_size = batch_size
+        self.on_reject = on_reject
+        self.invite = invite
+        self.counts = Counter()
+        self.doctors = set()
+        self.procedures = dict(Procedure.objects.values_list("name", "pk"))
+        self.patient_serializer = BulkPatientSerializer()
+        self.visit_serializer = ImportVisitSerializer()
+
+    def reject(self, line, row, errors):
+        self.counts["rejected"] += 1
+        if self.on_reject:
+            self.on_reject(line, row, errors)
+
+    def run(self, lines):
+        """Import the CSV ``lines`` and return the counts of what was done."""
+        reader = csv.DictReader(lines)
+        missing = set(PATIENT_COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+        batch = []
+        for row in reader:
+            batch.append((reader.line_num, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        # bulk_create skips the signals that maintain the stats
+        refresh_stats(Clinic, [self.clinic.pk])
+        refresh_stats(Doctor, self.doctors)
+        return self.counts
+
+    def parse(self, row):
+        """Return the validated ``(patient, visit)`` of a row."""
+        patient = {column: row.get(column) or "" for column in PATIENT_COLUMNS}
+        if row.get("username"):
+            patient["username"] = row["username"]
+        patient = self.patient_serializer.run_validation(patient)
+        visit = None
+        if any(row.get(column) for column in VISIT_COLUMNS):
+            visit = self.visit_serializer.run_validation(
+                {column: row[column] for column in VISIT_COLUMNS if row.get(column)}
+            )
+            names = [
+                name.strip()
+                for name in visit.get("procedures", "").split(";")
+                if name.strip()
+            ]
+            unknown = [name for name in names if name not in self.procedures]
+            if unknown:
+                raise ValidationError(
+                    {"procedures": [f"Unknown procedure {name}." for name in unknown]}
+                )
+            visit["procedure_ids"] = {self.procedures[name] for name in names}
+        return patient, visit
+
+    def import_batch(self, rows):
+        self.counts["rows"] += len(rows)
+        parsed = []
+        for line, row in rows:
+            try:
+                parsed.append((line, row, *self.parse(row)))
+            except ValidationError as exc:
+                self.reject(line, row, as_serializer_error(exc))
+
+        npis = {visit["doctor_npi"] for *_, visit in parsed if visit}
+        doctors = dict(Doctor.objects.filter(npi__in=npis).values_list("npi", "pk"))
+        patients, usernames, accepted = {}, {}, []
+        for line, row, patient, visit in parsed:
+            email, username = patient["email"], patient["username"]
+            if visit and visit["doctor_npi"] not in doctors:
+                self.reject(line, row, {"doctor_npi": ["Unknown doctor."]})
+            elif usernames.setdefault(username, email) != email:
+                self.reject(line, row, {"username": ["Duplicated in this batch."]})
+            else:
+                # The first row of a patient provides its fields
+                patients.setdefault(email, patient)
+                accepted.append((line, row, email, visit))
+
+        upsert = ImportUpsert(self, list(patients.values()), accepted, doctors)
+        if upsert.items:
+            upsert.write_chunk(list(enumerate(upsert.items)))
+        created, updated = [], 0
+        errors = {}
+        for data, result in zip(upsert.items, upsert.results):
+            if result["status"] == "error":
+                errors[data["email"]] = result["errors"]
+            elif result["status"] == "created":
+                created.append(data["email"])
+            else:
+                updated += 1
+        for line, row, email, _ in accepted:
+            if email in errors:
+                self.reject(line, row, errors[email])
+
+        # Counted once the patients, and with them the visits, were written
+        visits, skipped = upsert.visits if created or updated else (0, 0)
+        self.counts["patients_created"] += len(created)
+        self.counts["patients_updated"] += updated
+        self.counts["visits_created"] += visits
+        self.counts["visits_skipped"] += skipped
+        if self.invite and created:
+            self.counts["invited"] += send_invites(
+                pending_invites().filter(email__in=created)
+            )
+
+    def write_visits(self, accepted, patient_ids, updated, doctors):
+        """Insert the new visits of ``accepted``.
+
+        Return how many were inserted and how many were already stored.
+        """
+        # Only patients that already existed can have the visits stored
+        stored = set(
+            Visit.objects.filter(
+                patient_id__in=updated, clinic=self.clinic
+            ).values_list("patient_id", "doctor_id", "visit_date")
+        )
+        visits, procedures, skipped = [], [], 0
+        for _, _, email, visit in accepted:
+            if not visit:
+                continue
+            key = (
+                patient_ids[email],
+                doctors[visit["doctor_npi"]],
+                visit["visit_date"],
+            )
+            if key in stored:
+                skipped += 1
+                continue
+            stored.add(key)
+            visits.append(
+                Visit(
+                    patient_id=key[0],
+                    doctor_id=key[1],
+                    clinic=self.clinic,
+                    visit_date=key[2],
+                    doctor_notes=visit["doctor_notes"],
+                )
+            )
+            procedures.append(visit["procedure_ids"])
+            self.doctors.add(key[1])
+
+        Visit.objects.bulk_create(visits)
+        through = Visit.procedures_done.through
+        through.objects.bulk_create(
+            [
+                through(visit_id=visit.pk, procedure_id=procedure_id)
+                for visit, procedure_ids in zip(visits, procedures)
+                for procedure_id in procedure_ids
+            ]
+        )
+        return len(visits), skipped
+
+
+class ImportUpsert(PatientBulkUpsert):
+    """The patients of a batch, written with the visits of their rows.
+
+    ``write_chunk`` checks the patients again and retries once after a
+    conflicting write, so the rows of the other patients are still imported.
+    """
+
+    def __init__(self, importer, patients, accepted, doctors):
+        super().__init__(patients)
+        self.importer = importer
+        self.accepted = accepted
+        self.doctors = doctors
+        self.visits = (0, 0)
+
+    def write(self, chunk):
+        written = super().write(chunk)
+        patient_ids = {data["email"]: pk for data, (pk, _) in zip(chunk, written)}
+        self.visits = self.importer.write_visits(
+            [entry for entry in self.accepted if entry[2] in patient_ids],
+            patient_ids,
+            [pk for pk, created in written if not created],
+            self.doctors,
+        )
+        return written
@@ -0,0 +1,79 @@
+import csv
+import json
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Clinic
+from api.importer import IMPORT_BATCH_SIZE, PatientImport
+
+
+class Command(BaseCommand):
+    help = "Import a clinic's patients and visit history from a CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="CSV file, or - for standard input")
+        parser.add_argument("--clinic", type=int, required=True, help="Clinic id")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--rejects",
+            help="Write the rejected rows, with their line and errors, to this CSV",
+        )
+        parser.add_argument(
+            "--invite",
+            action="store_true",
+            help="Email the new users a link to choose their password",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            clinic = Clinic.objects.get(pk=options["clinic"])
+        except Clinic.DoesNotExist:
+            raise CommandError(f"Clinic {options['clinic']} does not exist")
+
+        rejects_file = writer = None
+        if options["rejects"]:
+            rejects_file = open(options["rejects"], "w", newline="")
+
+        def on_reject(line, row, errors):
+            nonlocal writer
+            if writer is None and rejects_file:
+                writer = csv.DictWriter(
+                    rejects_file,
+                    ["line", *(key for key in row if key), "errors"],
+                    extrasaction="ignore",
+                )
+                writer.writeheader()
+            if writer:
+                writer.writerow({**row, "line": line, "errors": json.dumps(errors)})
+            else:
+                self.stderr.write(f"Line {line}: {json.dumps(errors)}")
+
+        started = time.perf_counter()
+        importer = PatientImport(
+            clinic, options["batch_size"], on_reject, invite=options["invite"]
+        )
+        try:
+            if options["file"] == "-":
+                counts = importer.run(sys.stdin)
+            else:
+                with open(options["file"], newline="") as file:
+                    counts = importer.run(file)
+        except (ValueError, csv.Error) as exc:
+            raise CommandError(str(exc))
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {counts['rows']} rows in {elapsed:.1f}s "
+                f"({counts['rows'] / elapsed * 60 if elapsed else 0:.0f} rows/min): "
+                f"{counts['patients_created']} patients created, "
+                f"{counts['patients_updated']} updated, "
+                f"{counts['visits_created']} visits created, "
+                f"{counts['visits_skipped']} already stored, "
+                f"{counts['rejected']} rows rejected"
+                + (f", {counts['invited']} invited" if options["invite"] else "")
+            )
+        )
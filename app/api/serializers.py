@@ -1,27 +1,212 @@
+from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from rest_framework import serializers
-from core.models import Patient, Doctor, Clinic
+from core.models import Appointment, Clinic, Doctor, Patient, Visit
 
 
-class PatientSerializer(serializers.ModelSerializer):
+def requested_fields(request):
+    """Return the field names listed in ``?fields=``, or ``None`` for all."""
+    if request is None or not request.query_params.get("fields"):
+        return None
+    return {name.strip() for name in request.query_params["fields"].split(",")}
+
+
+class SparseFieldsMixin:
+    """Serializer that only outputs the fields listed in ``?fields=a,b``.
+
+    ``Meta.select_related`` and ``Meta.prefetch_related`` map field names to
+    the relations they read, so ``optimize`` joins or prefetches only what
+    the requested fields need and defers the columns nobody asked for.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = requested_fields(self.context.get("request"))
+        if requested:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    @classmethod
+    def optimize(cls, queryset, request=None):
+        meta = cls.Meta
+        requested = requested_fields(request) or set(meta.fields)
+        select = getattr(meta, "select_related", {})
+        prefetch = getattr(meta, "prefetch_related", {})
+        queryset = queryset.select_related(
+            *{select[name] for name in requested if name in select}
+        ).prefetch_related(*{prefetch[name] for name in requested if name in prefetch})
+        if requested_fields(request):
+            queryset = queryset.defer(
+                *[
+                    field.name
+                    for field in meta.model._meta.concrete_fields
+                    if not field.is_relation
+                    and not field.primary_key
+                    and field.name not in requested
+                ]
+            )
+        return queryset
+
+
+class PatientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    first_name = serializers.CharField(source="user.first_name", read_only=True)
+    last_name = serializers.CharField(source="user.last_name", read_only=True)
+    email = serializers.EmailField(source="user.email", read_only=True)
+
     class Meta:
         model = Patient
         fields = [
+            "id",
             "user",
+            "first_name",
+            "last_name",
+            "email",
             "date_of_birth",
             "address",
             "phone_number",
             "ssn_last_four",
             "gender",
         ]
+        select_related = {"first_name": "user", "last_name": "user", "email": "user"}
+
 
+class DoctorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    first_name = serializers.CharField(source="user.first_name", read_only=True)
+    last_name = serializers.CharField(source="user.last_name", read_only=True)
+    email = serializers.EmailField(source="user.email", read_only=True)
 
-class DoctorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Doctor
-        fields = ["user", "npi", "specialties"]
+        fields = [
+            "id",
+            "user",
+            "first_name",
+            "last_name",
+            "email",
+            "npi",
+            "specialties",
+        ]
+        select_related = {"first_name": "user", "last_name": "user", "email": "user"}
+        prefetch_related = {"specialties": "specialties"}
 
 
-class ClinicSerializer(serializers.ModelSerializer):
+class ClinicSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Clinic
+        fields = ["id", "name", "address", "phone_number", "country", "state", "city"]
+
+
+class VisitSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Visit
+        fields = [
+            "id",
+            "patient",
+            "doctor",
+            "clinic",
+            "visit_date",
+            "procedures_done",
+            "doctor_notes",
+        ]
+        prefetch_related = {"procedures_done": "procedures_done"}
+
+
+class AppointmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Appointment
+        fields = [
+            "id",
+            "patient",
+            "doctor",
+            "clinic",
+            "procedure",
+            "appointment_date",
+            "booked_date",
+        ]
+
+
+class BulkUserFieldsSerializer(serializers.Serializer):
+    """User fields of a bulk item; the user is matched on ``email``.
+
+    New users get ``username`` (the email by default) and an unusable
+    password. Existing users only have their names updated.
+    """
+
+    email = serializers.EmailField(max_length=254)
+    username = serializers.CharField(
+        max_length=150, required=False, validators=[UnicodeUsernameValidator()]
+    )
+    first_name = serializers.CharField(max_length=150, allow_blank=True)
+    last_name = serializers.CharField(max_length=150, allow_blank=True)
+
+    def validate_email(self, value):
+        return BaseUserManager.normalize_email(value)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if "username" not in attrs:
+            if len(attrs["email"]) > 150:
+                raise serializers.ValidationError(
+                    {"username": ["Required when the email is over 150 characters."]}
+                )
+            attrs["username"] = attrs["email"]
+        return attrs
+
+
+class BulkPatientSerializer(BulkUserFieldsSerializer, serializers.ModelSerializer):
+    class Meta:
+        model = Patient
+        fields = [
+            "email",
+            "username",
+            "first_name",
+            "last_name",
+            "date_of_birth",
+            "address",
+            "phone_number",
+            "ssn_last_four",
+            "gender",
+        ]
+
+
+class BulkDoctorSerializer(BulkUserFieldsSerializer, serializers.ModelSerializer):
+    # Checked for the whole request at once rather than item by item
+    specialties = serializers.ListField(
+        child=serializers.IntegerField(), required=False
+    )
+
+    class Meta:
+        model = Doctor
+        fields = [
+            "email",
+            "username",
+            "first_name",
+            "last_name",
+            "npi",
+            "phone_number",
+            "specialties",
+        ]
+        # NPIs are upserted, not rejected when they already exist
+        extra_kwargs = {"npi": {"validators": []}}
+
+
+class BulkClinicSerializer(serializers.ModelSerializer):
+    country = serializers.IntegerField(required=False, allow_null=True)
+    state = serializers.IntegerField(required=False, allow_null=True)
+    city = serializers.IntegerField(required=False, allow_null=True)
+
     class Meta:
         model = Clinic
         fields = ["name", "address", "phone_number", "country", "state", "city"]
+
+
+class ImportVisitSerializer(serializers.Serializer):
+    """The visit columns of a patient import row."""
+
+    visit_date = serializers.DateTimeField()
+    doctor_npi = serializers.CharField(max_length=20)
+    # Procedure names separated by semicolons, as in the history export
+    procedures = serializers.CharField(allow_blank=True, required=False)
+    doctor_notes = serializers.CharField(
+        allow_blank=True, required=False, default="", trim_whitespace=False
+    )
@@ -1,3 +1,501 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core import mail
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core.models import Appointment, Clinic, Doctor, Patient, Procedure, Visit
+from core.testing import TestCase
+from .bulk import PatientBulkUpsert
+
+User = get_user_model()
+
+
+class ReadApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="apiuser", email="api@example.com"
+        )
+        self.user.user_permissions.set(
+            Permission.objects.filter(codename__startswith="view_")
+        )
+        self.client.force_login(self.user)
+        self.procedure = Procedure.objects.create(name="Teeth Cleaning")
+        self.clinic = Clinic.objects.create(name="Test Clinic", address="1 St")
+        self.count = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            index = self.count = self.count + 1
+            doctor = Doctor.objects.create(
+                user=User.objects.create_user(
+                    username=f"doctor{index}", email=f"doctor{index}@example.com"
+                ),
+                npi=str(index),
+            )
+            doctor.specialties.add(self.procedure)
+            patient = Patient.objects.create(
+                user=User.objects.create_user(
+                    username=f"patient{index}", email=f"patient{index}@example.com"
+                ),
+                date_of_birth="1990-01-01",
+                address="456 Patient St",
+                phone_number="555-555-5555",
+                ssn_last_four="1234",
+                gender="F",
+            )
+            visit = Visit.objects.create(
+                patient=patient,
+                doctor=doctor,
+                clinic=self.clinic,
+                visit_date="2024-09-01T09:00:00Z",
+                doctor_notes="Routine checkup",
+            )
+            visit.procedures_done.add(self.procedure)
+            Appointment.objects.create(
+                patient=patient,
+                doctor=doctor,
+                clinic=self.clinic,
+                procedure=self.procedure,
+                appointment_date="2024-10-01T09:00:00Z",
+            )
+
+    def get(self, name, params=None, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, kwargs=kwargs), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_list_query_counts_do_not_grow(self):
+        """Test every list endpoint runs a fixed number of queries"""
+        names = [
+            "api-patient-list",
+            "api-doctor-list",
+            "api-clinic-list",
+            "api-visit-list",
+            "api-appointment-list",
+        ]
+        self.add_rows(2)
+        baseline = {name: self.get(name)[1] for name in names}
+
+        self.add_rows(8)
+        for name in names:
+            data, queries = self.get(name)
+            self.assertEqual(queries, baseline[name], name)
+            self.assertTrue(data["results"], name)
+
+        data, _ = self.get("api-patient-list")
+        self.assertEqual(data["results"][0]["email"], "patient1@example.com")
+        data, _ = self.get("api-doctor-list")
+        self.assertEqual(data["results"][0]["specialties"], [self.procedure.id])
+
+    def test_detail_endpoints(self):
+        """Test the retrieve endpoints"""
+        self.add_rows(1)
+        visit = Visit.objects.get()
+        for name, pk in [
+            ("api-patient-detail", visit.patient_id),
+            ("api-doctor-detail", visit.doctor_id),
+            ("api-clinic-detail", visit.clinic_id),
+            ("api-visit-detail", visit.pk),
+            ("api-appointment-detail", Appointment.objects.get().pk),
+        ]:
+            data, _ = self.get(name, pk=pk)
+            self.assertEqual(data["id"], pk)
+
+    def test_sparse_fields_skip_joins(self):
+        """Test ?fields= limits the output and the related rows loaded"""
+        self.add_rows(3)
+        data, full = self.get("api-doctor-list")
+        data, sparse = self.get("api-doctor-list", {"fields": "id,npi"})
+        self.assertEqual(set(data["results"][0]), {"id", "npi"})
+        # No specialties prefetch
+        self.assertEqual(sparse, full - 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("api-visit-list"), {"fields": "id,visit_date"})
+        self.assertNotIn("doctor_notes", queries[-1]["sql"])
+
+    def test_cursor_pagination(self):
+        """Test following the next links walks every row once"""
+        self.add_rows(5)
+        ids, url = [], reverse("api-patient-list") + "?page_size=2"
+        while url:
+            data = self.client.get(url).json()
+            ids += [row["id"] for row in data["results"]]
+            url = data["next"]
+        self.assertEqual(
+            ids, list(Patient.objects.order_by("pk").values_list("pk", flat=True))
+        )
+
+    def test_read_requires_view_permission(self):
+        """Test patient data is not readable without the view permission"""
+        self.user.user_permissions.clear()
+        response = self.client.get(reverse("api-patient-list"))
+        self.assertEqual(response.status_code, 403)
+        self.client.logout()
+        response = self.client.get(reverse("api-patient-list"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_clinics_are_public(self):
+        """Test anonymous users can still read clinics under the old names"""
+        self.client.logout()
+        self.assertEqual(reverse("add-clinic"), reverse("api-clinic-list"))
+        response = self.client.get(reverse("get-clinic", args=[self.clinic.id]))
+        self.assertEqual(response.json()["id"], self.clinic.id)
+        response = self.client.get(reverse("api-clinic-list"))
+        self.assertEqual(response.json()["results"][0]["id"], self.clinic.id)
+        response = self.client.post(reverse("add-clinic"), {"name": "New"})
+        self.assertEqual(response.status_code, 403)
+
+
+class BulkApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="bulkuser", email="bulk@example.com"
+        )
+        self.user.user_permissions.set(
+            Permission.objects.filter(codename__regex=r"^(add|change)_")
+        )
+        self.client.force_login(self.user)
+        self.procedure = Procedure.objects.create(name="Teeth Cleaning")
+
+    def patient(self, index, **fields):
+        return {
+            "email": f"patient{index}@example.com",
+            "first_name": "Pat",
+            "last_name": f"Ient{index}",
+            "date_of_birth": "1990-01-01",
+            "address": "456 Patient St",
+            "phone_number": "555-555-5555",
+            "ssn_last_four": "1234",
+            "gender": "F",
+            **fields,
+        }
+
+    def doctor(self, index, **fields):
+        return {
+            "email": f"doctor{index}@example.com",
+            "first_name": "Doc",
+            "last_name": f"Tor{index}",
+            "npi": f"npi{index}",
+            "specialties": [self.procedure.id],
+            **fields,
+        }
+
+    def post(self, name, items, ndjson=False):
+        if ndjson:
+            response = self.client.post(
+                reverse(name),
+                "\n".join(json.dumps(item) for item in items),
+                content_type="application/x-ndjson",
+            )
+        else:
+            response = self.client.post(
+                reverse(name), items, content_type="application/json"
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_patients_are_upserted_on_email(self):
+        """Test new patients are created and known emails updated"""
+        data = self.post("api-patient-bulk", [self.patient(i) for i in range(3)])
+        self.assertEqual((data["created"], data["updated"]), (3, 0))
+
+        data = self.post(
+            "api-patient-bulk",
+            [self.patient(0, address="1 New St"), self.patient(3)],
+            ndjson=True,
+        )
+        self.assertEqual((data["created"], data["updated"]), (1, 1))
+        patient = Patient.objects.get(user__email="patient0@example.com")
+        self.assertEqual(data["results"][0]["id"], patient.pk)
+        self.assertEqual(patient.address, "1 New St")
+        self.assertEqual(patient.user.username, "patient0@example.com")
+        self.assertFalse(patient.user.has_usable_password())
+        self.assertEqual(Patient.objects.count(), 4)
+
+    def test_conflicting_write_is_checked_again(self):
+        """Test a chunk hit by a concurrent write only rejects its conflicts"""
+        check = PatientBulkUpsert.check
+
+        def stale_check(upsert, chunk):
+            checked = check(upsert, chunk)
+            # Another request takes the username once the chunk is checked
+            User.objects.get_or_create(
+                username="patient0@example.com", email="other@example.com"
+            )
+            return checked
+
+        with mock.patch.object(PatientBulkUpsert, "check", stale_check):
+            data = self.post("api-patient-bulk", [self.patient(i) for i in range(3)])
+        self.assertEqual((data["created"], data["errors"]), (2, 1))
+        self.assertIn("username", data["results"][0]["errors"])
+        self.assertEqual(Patient.objects.count(), 2)
+
+        def conflicting_write(upsert, chunk):
+            raise IntegrityError
+
+        with mock.patch.object(PatientBulkUpsert, "write", conflicting_write):
+            data = self.post("api-patient-bulk", [self.patient(3)])
+        self.assertEqual(
+            data["results"][0]["errors"],
+            {"non_field_errors": ["Conflicting write, please retry."]},
+        )
+
+    def test_query_count_does_not_grow_with_items(self):
+        """Test a chunk is written with a fixed number of queries"""
+        with CaptureQueriesContext(connection) as few:
+            self.post("api-doctor-bulk", [self.doctor(i) for i in range(2)])
+        with CaptureQueriesContext(connection) as many:
+            self.post("api-doctor-bulk", [self.doctor(i) for i in range(2, 40)])
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Doctor.objects.filter(specialties=self.procedure).count(), 40)
+
+    def test_doctors_are_upserted_on_npi(self):
+        """Test a known NPI updates the doctor and replaces its specialties"""
+        self.post("api-doctor-bulk", [self.doctor(1)])
+        other = Procedure.objects.create(name="Filling")
+        data = self.post(
+            "api-doctor-bulk",
+            [self.doctor(1, phone_number="555-0000", specialties=[other.id])],
+        )
+        self.assertEqual(data["results"][0]["status"], "updated")
+        doctor = Doctor.objects.get(npi="npi1")
+        self.assertEqual(doctor.phone_number, "555-0000")
+        self.assertEqual(list(doctor.specialties.all()), [other])
+
+    def test_invalid_items_are_reported(self):
+        """Test invalid items fail alone, with their index and errors"""
+        self.post("api-doctor-bulk", [self.doctor(1)])
+        data = self.post(
+            "api-doctor-bulk",
+            [
+                self.doctor(2),
+                self.doctor(3, npi="npi1"),
+                self.doctor(4, specialties=[999]),
+                self.doctor(5, email="doctor2@example.com"),
+                "not an object",
+                self.doctor(6, npi=""),
+            ],
+        )
+        statuses = [result["status"] for result in data["results"]]
+        self.assertEqual(statuses, ["created"] + ["error"] * 5)
+        errors = [result.get("errors", {}) for result in data["results"]]
+        self.assertIn("npi", errors[1])
+        self.assertIn("specialties", errors[2])
+        self.assertIn("email", errors[3])
+        self.assertIn("non_field_errors", errors[4])
+        self.assertIn("npi", errors[5])
+        self.assertEqual(Doctor.objects.count(), 2)
+
+    def test_clinics_are_created(self):
+        """Test clinics are created and unknown locations rejected"""
+        data = self.post(
+            "api-clinic-bulk",
+            [
+                {"name": "North", "address": "1 St", "phone_number": "555"},
+                {"name": "South", "address": "2 St", "phone_number": "555", "city": 9},
+            ],
+        )
+        self.assertEqual(data["results"][0]["id"], Clinic.objects.get().pk)
+        self.assertIn("city", data["results"][1]["errors"])
+
+    def test_bulk_requires_add_and_change_permissions(self):
+        """Test upserting needs both the add and the change permission"""
+        self.user.user_permissions.set(
+            Permission.objects.filter(codename__startswith="add_")
+        )
+        response = self.client.post(
+            reverse("api-clinic-bulk"), [], content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_malformed_bodies_are_rejected(self):
+        """Test non-list and unparsable bodies are a 400"""
+        for body, content_type in [
+            ({"name": "North"}, "application/json"),
+            ('{"name": "North"}\n{oops', "application/x-ndjson"),
+        ]:
+            response = self.client.post(
+                reverse("api-clinic-bulk"), body, content_type=content_type
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+class PatientImportTests(TestCase):
+    HEADER = (
+        "email,first_name,last_name,date_of_birth,address,phone_number,"
+        "ssn_last_four,gender,visit_date,doctor_npi,procedures,doctor_notes\n"
+    )
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="importer", email="importer@example.com"
+        )
+        self.user.user_permissions.set(
+            Permission.objects.filter(
+                codename__in=["add_patient", "change_patient", "add_visit"]
+            )
+        )
+        self.client.force_login(self.user)
+        self.clinic = Clinic.objects.create(name="Test Clinic", address="1 St")
+        self.doctor = Doctor.objects.create(
+            user=User.objects.create_user(
+                username="doctoruser", email="doctor@example.com"
+            ),
+            npi="1234567890",
+        )
+        Procedure.objects.create(name="Teeth Cleaning")
+        Procedure.objects.create(name="Filling")
+
+    def row(self, index, visit_date="", npi="1234567890", procedures="", **fields):
+        values = {
+            "email": f"patient{index}@example.com",
+            "first_name": "Pat",
+            "last_name": f"Ient{index}",
+            "date_of_birth": "1990-01-01",
+            "address": '"1 Main St, Apt 2"',
+            "phone_number": "555-555-5555",
+            "ssn_last_four": "1234",
+            "gender": "F",
+            "visit_date": visit_date,
+            "doctor_npi": npi if visit_date else "",
+            "procedures": procedures,
+            "doctor_notes": '"Notes, with a comma"' if visit_date else "",
+            **fields,
+        }
+        return ",".join(values.values()) + "\n"
+
+    def post(self, body, clinic=None):
+        return self.client.post(
+            reverse("api-patient-import") + f"?clinic={clinic or self.clinic.id}",
+            self.HEADER + body,
+            content_type="text/csv",
+        )
+
+    def test_import_patients_and_visits(self):
+        """Test rows are grouped by patient and visits get their procedures"""
+        body = (
+            self.row(1, "2024-01-10T09:00:00Z", procedures="Filling; Teeth Cleaning")
+            + self.row(1, "2024-03-10T09:00:00Z", procedures="Filling")
+            + self.row(2)
+        )
+        data = self.post(body).json()
+        self.assertEqual(data["rows"], 3)
+        self.assertEqual(data["patients_created"], 2)
+        self.assertEqual(data["visits_created"], 2)
+        patient = Patient.objects.get(user__email="patient1@example.com")
+        self.assertEqual(patient.address, "1 Main St, Apt 2")
+        self.assertFalse(patient.user.has_usable_password())
+        visit = patient.visit_set.order_by("visit_date").first()
+        self.assertEqual(visit.doctor_notes, "Notes, with a comma")
+        self.assertEqual(visit.procedures_done.count(), 2)
+        self.assertEqual(self.clinic.stats.visits_this_month, 0)
+        self.assertEqual(self.clinic.stats.num_patients, 1)
+
+        # Importing the same file again only updates
+        data = self.post(body).json()
+        self.assertEqual(data["patients_updated"], 2)
+        self.assertEqual((data["visits_created"], data["visits_skipped"]), (0, 2))
+        self.assertEqual(Visit.objects.count(), 2)
+
+    def test_rejected_rows_are_reported(self):
+        """Test invalid rows are rejected with their line, the rest imported"""
+        body = (
+            self.row(1)
+            + self.row(2, gender="X")
+            + self.row(3, "2024-01-10T09:00:00Z", npi="999")
+            + self.row(4, "2024-01-10T09:00:00Z", procedures="Braces")
+            + self.row(5, "not a date")
+        )
+        data = self.post(body).json()
+        self.assertEqual(data["patients_created"], 1)
+        self.assertEqual(data["rejected"], 4)
+        self.assertEqual(
+            sorted(
+                (reject["line"], list(reject["errors"])) for reject in data["rejects"]
+            ),
+            [
+                (3, ["gender"]),
+                (4, ["doctor_npi"]),
+                (5, ["procedures"]),
+                (6, ["visit_date"]),
+            ],
+        )
+
+    def test_conflicting_write_is_checked_again(self):
+        """Test a concurrent write only rejects the rows it conflicts with"""
+        check = PatientBulkUpsert.check
+
+        def stale_check(upsert, chunk):
+            checked = check(upsert, chunk)
+            # Another request takes the username once the batch is checked
+            User.objects.get_or_create(
+                username="patient1@example.com", email="other@example.com"
+            )
+            return checked
+
+        body = self.row(1, "2024-01-10T09:00:00Z") + self.row(2, "2024-01-10T09:00:00Z")
+        with mock.patch.object(PatientBulkUpsert, "check", stale_check):
+            data = self.post(body).json()
+        self.assertEqual(data["patients_created"], 1)
+        self.assertEqual(data["visits_created"], 1)
+        self.assertEqual(
+            [(reject["line"], list(reject["errors"])) for reject in data["rejects"]],
+            [(2, ["username"])],
+        )
+        self.assertEqual(Visit.objects.get().patient.user.email, "patient2@example.com")
+
+    def test_batches_use_a_fixed_number_of_queries(self):
+        """Test queries do not grow with the rows of a batch"""
+        with CaptureQueriesContext(connection) as few:
+            self.post(self.row(1, "2024-01-10T09:00:00Z", procedures="Filling"))
+        body = "".join(
+            self.row(i, "2024-01-10T09:00:00Z", procedures="Filling")
+            for i in range(2, 50)
+        )
+        with CaptureQueriesContext(connection) as many:
+            self.post(body)
+        self.assertEqual(len(few), len(many))
+
+    def test_import_requirements(self):
+        """Test missing columns, clinics and permissions are rejected"""
+        response = self.client.post(
+            reverse("api-patient-import") + f"?clinic={self.clinic.id}",
+            "email,first_name\n",
+            content_type="text/csv",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post(self.row(1), clinic=999).status_code, 404)
+        self.user.user_permissions.remove(Permission.objects.get(codename="add_visit"))
+        self.assertEqual(self.post(self.row(1)).status_code, 403)
+
+    def test_import_command_writes_rejects_and_invites(self):
+        """Test the command imports a file, saves rejects and sends invites"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "roster.csv")
+            rejects = os.path.join(directory, "rejects.csv")
+            with open(path, "w") as file:
+                file.write(self.HEADER + self.row(1) + self.row(2, gender="X"))
+            call_command(
+                "import_patients",
+                path,
+                clinic=self.clinic.id,
+                rejects=rejects,
+                invite=True,
+                stdout=StringIO(),
+            )
+            with open(rejects, newline="") as file:
+                rows = list(csv.DictReader(file))
+        self.assertEqual([row["email"] for row in rows], ["patient2@example.com"])
+        self.assertIn("gender", rows[0]["errors"])
+        self.assertEqual([m.to for m in mail.outbox], [["patient1@example.com"]])
@@ -1,9 +1,47 @@
 from django.urls import path
-from .views import AddPatientView, AddDoctorView, AddClinicView, GetClinicView
+from .views import (
+    AppointmentDetailView,
+    AppointmentListView,
+    ClinicBulkView,
+    ClinicDetailView,
+    ClinicListView,
+    DoctorBulkView,
+    DoctorDetailView,
+    DoctorListView,
+    PatientBulkView,
+    PatientDetailView,
+    PatientImportView,
+    PatientListView,
+    VisitDetailView,
+    VisitListView,
+)
 
 urlpatterns = [
-    path("patients/", AddPatientView.as_view(), name="add-patient"),
-    path("doctors/", AddDoctorView.as_view(), name="add-doctor"),
-    path("clinics/", AddClinicView.as_view(), name="add-clinic"),
-    path("clinics/<int:id>/", GetClinicView.as_view(), name="get-clinic"),
+    path("patients/", PatientListView.as_view(), name="api-patient-list"),
+    path("patients/bulk/", PatientBulkView.as_view(), name="api-patient-bulk"),
+    path("patients/import/", PatientImportView.as_view(), name="api-patient-import"),
+    path("patients/<int:pk>/", PatientDetailView.as_view(), name="api-patient-detail"),
+    path("doctors/", DoctorListView.as_view(), name="api-doctor-list"),
+    path("doctors/bulk/", DoctorBulkView.as_view(), name="api-doctor-bulk"),
+    path("doctors/<int:pk>/", DoctorDetailView.as_view(), name="api-doctor-detail"),
+    path("clinics/", ClinicListView.as_view(), name="api-clinic-list"),
+    path("clinics/bulk/", ClinicBulkView.as_view(), name="api-clinic-bulk"),
+    path("clinics/<int:pk>/", ClinicDetailView.as_view(), name="api-clinic-detail"),
+    path("visits/", VisitListView.as_view(), name="api-visit-list"),
+    path("visits/<int:pk>/", VisitDetailView.as_view(), name="api-visit-detail"),
+    path("appointments/", AppointmentListView.as_view(), name="api-appointment-list"),
+    path(
+        "appointments/<int:pk>/",
+        AppointmentDetailView.as_view(),
+        name="api-appointment-detail",
+    ),
+    # The names of the first endpoints, kept for existing reverse() callers
+    path("patients/", PatientListView.as_view(), name="add-patient"),
+    path("doctors/", DoctorListView.as_view(), name="add-doctor"),
+    path("clinics/", ClinicListView.as_view(), name="add-clinic"),
+    path(
+        "clinics/<int:id>/",
+        ClinicDetailView.as_view(lookup_url_kwarg="id"),
+        name="get-clinic",
+    ),
 ]
@@ -1,33 +1,235 @@
+import codecs
+import csv
+from collections import Counter
+
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
 from rest_framework import generics
-from rest_framework.permissions import DjangoModelPermissionsOrAnonReadOnly
-from core.models import Patient, Doctor, Clinic
-from .serializers import PatientSerializer, DoctorSerializer, ClinicSerializer
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import CursorPagination
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import (
+    DjangoModelPermissions,
+    DjangoModelPermissionsOrAnonReadOnly,
+)
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from core.models import Appointment, Clinic, Doctor, Patient, Visit
+from .bulk import (
+    BULK_MAX_ITEMS,
+    ClinicBulkUpsert,
+    DoctorBulkUpsert,
+    NDJSONParser,
+    PatientBulkUpsert,
+)
+from .importer import PatientImport
+from .serializers import (
+    AppointmentSerializer,
+    ClinicSerializer,
+    DoctorSerializer,
+    PatientSerializer,
+    VisitSerializer,
+)
+
+
+class ApiCursorPagination(CursorPagination):
+    # Ordered by primary key so each page is an index range scan, however
+    # deep into the table it is
+    ordering = "pk"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class ModelViewPermissions(DjangoModelPermissions):
+    """Model permissions that also require the view permission to read."""
+
+    perms_map = {
+        **DjangoModelPermissions.perms_map,
+        "GET": ["%(app_label)s.view_%(model_name)s"],
+        "HEAD": ["%(app_label)s.view_%(model_name)s"],
+    }
+
+
+class BulkUpsertPermissions(DjangoModelPermissions):
+    """A bulk upsert both adds and changes rows."""
+
+    perms_map = {
+        **DjangoModelPermissions.perms_map,
+        "POST": [
+            "%(app_label)s.add_%(model_name)s",
+            "%(app_label)s.change_%(model_name)s",
+        ],
+    }
+
+
+class OptimizedQuerysetMixin:
+    """Load only the relations the serializer needs for the requested fields."""
+
+    pagination_class = ApiCursorPagination
+    permission_classes = [ModelViewPermissions]
+    # GET requests may read from a replica, see core.replicas
+    replica_reads = True
+
+    def get_queryset(self):
+        return self.get_serializer_class().optimize(
+            super().get_queryset(), self.request
+        )
+
 
+# List or add patients (CBV)
+class PatientListView(OptimizedQuerysetMixin, generics.ListCreateAPIView):
+    queryset = Patient.objects.all()
+    serializer_class = PatientSerializer
 
-# Add a new patient (CBV)
-class AddPatientView(generics.CreateAPIView):
+
+class PatientDetailView(OptimizedQuerysetMixin, generics.RetrieveAPIView):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
-    permission_classes = [DjangoModelPermissionsOrAnonReadOnly]  # Permissions
 
 
-# Add a new doctor (CBV)
-class AddDoctorView(generics.CreateAPIView):
+# List or add doctors (CBV)
+class DoctorListView(OptimizedQuerysetMixin, generics.ListCreateAPIView):
+    queryset = Doctor.objects.all()
+    serializer_class = DoctorSerializer
+
+
+class DoctorDetailView(OptimizedQuerysetMixin, generics.RetrieveAPIView):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
-    permission_classes = [DjangoModelPermissionsOrAnonReadOnly]
 
 
-# Add a new clinic (CBV)
-class AddClinicView(generics.CreateAPIView):
+# List or add clinics (CBV)
+class ClinicListView(OptimizedQuerysetMixin, generics.ListCreateAPIView):
     queryset = Clinic.objects.all()
     serializer_class = ClinicSerializer
+    # Clinics are public, as they always were
     permission_classes = [DjangoModelPermissionsOrAnonReadOnly]
 
 
 # Get clinic information (CBV)
-class GetClinicView(generics.RetrieveAPIView):
+class ClinicDetailView(OptimizedQuerysetMixin, generics.RetrieveAPIView):
     queryset = Clinic.objects.all()
     serializer_class = ClinicSerializer
+    # Clinics are public, as they always were
     permission_classes = [DjangoModelPermissionsOrAnonReadOnly]
-    lookup_field = "id"
+
+
+class VisitListView(OptimizedQuerysetMixin, generics.ListAPIView):
+    queryset = Visit.objects.all()
+    serializer_class = VisitSerializer
+
+
+class VisitDetailView(OptimizedQuerysetMixin, generics.RetrieveAPIView):
+    queryset = Visit.objects.all()
+    serializer_class = VisitSerializer
+
+
+class AppointmentListView(OptimizedQuerysetMixin, generics.ListAPIView):
+    queryset = Appointment.objects.all()
+    serializer_class = AppointmentSerializer
+
+
+class AppointmentDetailView(OptimizedQuerysetMixin, generics.RetrieveAPIView):
+    queryset = Appointment.objects.all()
+    serializer_class = AppointmentSerializer
+
+
+class BulkUpsertView(generics.GenericAPIView):
+    """Create or update many items from a JSON array or NDJSON body."""
+
+    parser_classes = [JSONParser, NDJSONParser]
+    permission_classes = [BulkUpsertPermissions]
+    bulk_class = None
+
+    def get_serializer_class(self):
+        return self.bulk_class.serializer_class
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise ParseError("Expected a list of items.")
+        if len(items) > BULK_MAX_ITEMS:
+            raise ParseError(f"At most {BULK_MAX_ITEMS} items per request.")
+        results = self.bulk_class(items).run()
+        counts = Counter(result["status"] for result in results)
+        return Response(
+            {
+                "created": counts["created"],
+                "updated": counts["updated"],
+                "errors": counts["error"],
+                "results": results,
+            }
+        )
+
+
+class PatientBulkView(BulkUpsertView):
+    queryset = Patient.objects.all()
+    bulk_class = PatientBulkUpsert
+
+    @swagger_auto_schema(request_body=PatientBulkUpsert.serializer_class(many=True))
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+
+class DoctorBulkView(BulkUpsertView):
+    queryset = Doctor.objects.all()
+    bulk_class = DoctorBulkUpsert
+
+    @swagger_auto_schema(request_body=DoctorBulkUpsert.serializer_class(many=True))
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+
+class ClinicBulkView(BulkUpsertView):
+    queryset = Clinic.objects.all()
+    bulk_class = ClinicBulkUpsert
+
+    @swagger_auto_schema(request_body=ClinicBulkUpsert.serializer_class(many=True))
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+
+class PatientImportView(APIView):
+    """Import a CSV of patients and their visits into ``?clinic=``.
+
+    The body is read and imported as it streams in; see ``api.importer``
+    for the columns. The response counts what was imported and lists the
+    first ``MAX_REJECTS`` rejected rows.
+    """
+
+    queryset = Patient.objects.all()
+    permission_classes = [BulkUpsertPermissions]
+    MAX_REJECTS = 1000
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "clinic", openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=True
+            )
+        ],
+        consumes=["text/csv"],
+    )
+    def post(self, request, *args, **kwargs):
+        if not request.user.has_perm("core.add_visit"):
+            raise PermissionDenied
+        clinic_id = request.query_params.get("clinic", "")
+        if not clinic_id.isdigit():
+            raise ParseError("Expected a clinic id in ?clinic=.")
+        clinic = get_object_or_404(Clinic, pk=clinic_id)
+
+        rejects = []
+
+        def on_reject(line, row, errors):
+            if len(rejects) < self.MAX_REJECTS:
+                rejects.append({"line": line, "errors": errors})
+
+        stream = request.stream
+        lines = codecs.getreader("utf-8")(stream) if stream else []
+        try:
+            counts = PatientImport(clinic, on_reject=on_reject).run(lines)
+        except (ValueError, csv.Error) as exc:
+            raise ParseError(str(exc))
+        return Response({**counts, "rejects": rejects})
@@ -0,0 +1,27 @@
+"""Standalone benchmarks, run from the ``app`` directory as modules::
+
+    python -m benchmarks.load_data --cities 1000000
+
+Unless ``SQL_DATABASE`` (and friends) point to a database, each benchmark
+runs against a fresh, migrated SQLite file in a temporary directory, so it
+never touches development data.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+
+def setup_django():
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dental_management.settings")
+    if "SQL_DATABASE" not in os.environ:
+        directory = tempfile.mkdtemp(prefix="dental-bench-")
+        os.environ["SQL_DATABASE"] = os.path.join(directory, "bench.sqlite3")
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command("migrate", verbosity=0)
@@ -0,0 +1,169 @@
+"""Concurrent AJAX throughput of sync workers against one ASGI event loop.
+
+Every query is slowed down by ``--delay-ms``, as on a loaded or distant
+database. ``--requests`` requests are then sent ``--concurrency`` at a time
+to each AJAX lookup, served two ways:
+
+* ``wsgi``: ``--workers`` sync workers (gunicorn's default worker class),
+  each handling one request at a time.
+* ``asgi``: the ASGI application in a single event loop, as under a uvicorn
+  worker, where a request waiting on the database does not block the others.
+
+Django runs its ``MiddlewareMixin`` middleware in a thread under ASGI, so an
+ASGI request costs more CPU: the event loop pays off once database waits,
+not Python, dominate the latency::
+
+    python -m benchmarks.async_views --workers 4 --concurrency 50 --delay-ms 50
+"""
+
+import argparse
+import asyncio
+import io
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks import setup_django
+
+
+def slow_queries(delay):
+    from django.db.backends.signals import connection_created
+
+    def slow(execute, sql, params, many, context):
+        time.sleep(delay)
+        return execute(sql, params, many, context)
+
+    def receiver(connection, **kwargs):
+        connection.execute_wrappers.append(slow)
+
+    connection_created.connect(receiver, weak=False)
+
+
+def requests_for(name, count):
+    from django.urls import reverse
+    from core.models import DoctorClinicAffiliation
+
+    affiliations = list(
+        DoctorClinicAffiliation.objects.filter(doctor__specialties__isnull=False)
+        .values_list("clinic_id", "doctor_id", "doctor__specialties")
+        .order_by("pk")[:50]
+    )
+    path = reverse(name)
+    return [
+        (path, {"clinic_id": clinic, "doctor_id": doctor, "procedure_id": procedure})
+        for clinic, doctor, procedure in (
+            affiliations[index % len(affiliations)] for index in range(count)
+        )
+    ]
+
+
+def run_wsgi(requests, workers):
+    from django.test import Client
+
+    local = threading.local()
+
+    def get(request):
+        if not hasattr(local, "client"):
+            local.client = Client()
+        started = time.perf_counter()
+        response = local.client.get(*request)
+        assert response.status_code == 200, response.status_code
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(get, requests))
+
+
+async def asgi_get(application, path, query):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(query).encode(),
+        "root_path": "",
+        "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    }
+    body_sent = False
+    messages = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # The client stays connected until the response is sent
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    return messages[0]["status"]
+
+
+async def run_asgi(requests, concurrency):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(request):
+        async with semaphore:
+            started = time.perf_counter()
+            status = await asgi_get(application, *request)
+            assert status == 200, status
+            return (time.perf_counter() - started) * 1000
+
+    return await asyncio.gather(*(get(request) for request in requests))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--delay-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+
+    call_command(
+        "generate_data",
+        seed=args.seed,
+        clinics=20,
+        doctors=100,
+        patients=100,
+        years=1,
+        stdout=io.StringIO(),
+    )
+    slow_queries(args.delay_ms / 1000)
+
+    print(f"{'route':24} {'server':6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for name in ["ajax_load_clinics", "ajax_load_doctors", "ajax_booking_options"]:
+        requests = requests_for(name, args.requests)
+        for server in ["wsgi", "asgi"]:
+            started = time.perf_counter()
+            if server == "wsgi":
+                timings = run_wsgi(requests, args.workers)
+            else:
+                timings = asyncio.run(run_asgi(requests, args.concurrency))
+            rate = len(requests) / (time.perf_counter() - started)
+            p95 = statistics.quantiles(timings, n=20)[18]
+            print(
+                f"{name:24} {server:6} {rate:>8.1f} "
+                f"{statistics.median(timings):>9.1f} {p95:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
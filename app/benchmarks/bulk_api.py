@@ -0,0 +1,81 @@
+"""Throughput of the bulk patient endpoint against one patient per request.
+
+Patients are posted through the test client, as JSON arrays and NDJSON
+bodies of ``--batch`` items and, for comparison, one item per request::
+
+    python -m benchmarks.bulk_api --patients 20000 --batch 1000
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks import setup_django
+
+
+def patients(prefix, count):
+    for index in range(count):
+        yield {
+            "email": f"{prefix}{index}@example.com",
+            "first_name": "Bench",
+            "last_name": f"Patient{index}",
+            "date_of_birth": "1990-01-01",
+            "address": "1 Bench St",
+            "phone_number": "555-555-5555",
+            "ssn_last_four": "1234",
+            "gender": "F",
+        }
+
+
+def post_all(client, items, batch, ndjson=False):
+    """Post ``items`` ``batch`` at a time, return (seconds, items written)."""
+    from django.urls import reverse
+
+    url, items, written = reverse("api-patient-bulk"), list(items), 0
+    started = time.perf_counter()
+    for start in range(0, len(items), batch):
+        chunk = items[start : start + batch]
+        if ndjson:
+            body = "\n".join(json.dumps(item) for item in chunk)
+            response = client.post(url, body, content_type="application/x-ndjson")
+        else:
+            response = client.post(url, chunk, content_type="application/json")
+        data = response.json()
+        written += data["created"] + data["updated"]
+    return time.perf_counter() - started, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patients", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument(
+        "--single", type=int, default=500, help="Patients posted one per request"
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.models import Permission
+    from django.test import Client
+
+    user, _ = get_user_model().objects.get_or_create(
+        username="bench-bulk", email="bench-bulk@example.com"
+    )
+    user.user_permissions.set(Permission.objects.filter(codename__endswith="patient"))
+    client = Client()
+    client.force_login(user)
+
+    print(f"{'mode':10} {'items':>7} {'seconds':>8} {'items/s':>9}")
+    for mode, items, batch, ndjson in (
+        ("single", patients("single", args.single), 1, False),
+        ("json", patients("json", args.patients), args.batch, False),
+        ("ndjson", patients("ndjson", args.patients), args.batch, True),
+        ("update", patients("json", args.patients), args.batch, False),
+    ):
+        seconds, written = post_all(client, items, batch, ndjson)
+        print(f"{mode:10} {written:>7} {seconds:>8.2f} {written / seconds:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""AJAX latency with a connection per request, persistent connections or a pool.
+
+Each AJAX lookup is requested ``--requests`` times by ``--workers`` threads
+through the WSGI application, and ``--concurrency`` at a time through the
+ASGI application, once per connection mode:
+
+* ``per-request``: ``CONN_MAX_AGE = 0``, the default without a pool.
+* ``persistent``: ``CONN_MAX_AGE`` and ``CONN_HEALTH_CHECKS``.
+* ``pool``: a psycopg pool, the default when ``SQL_ENGINE`` is PostgreSQL
+  (``SQL_POOL=False`` measures the other two modes instead).
+
+On SQLite, opening a connection is made ``--connect-ms`` slower to stand in
+for the network round trips and authentication of a PostgreSQL connection::
+
+    python -m benchmarks.connections --workers 4 --connect-ms 5
+
+The checkouts and reuses per request come from ``core.connection_metrics``.
+"""
+
+import argparse
+import asyncio
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks import setup_django
+from benchmarks.async_views import asgi_get, requests_for
+
+ROUTES = ["ajax_load_clinics", "ajax_load_doctors", "ajax_load_timeslots"]
+
+
+def slow_connects(delay):
+    from django.db import connections
+
+    backend = type(connections["default"])
+    get_new_connection = backend.get_new_connection
+
+    def slow(self, conn_params):
+        time.sleep(delay)
+        return get_new_connection(self, conn_params)
+
+    backend.get_new_connection = slow
+
+
+def wsgi_get(application, path, query):
+    environ = {}
+    setup_testing_defaults(environ)
+    environ.update(PATH_INFO=path, QUERY_STRING=urlencode(query))
+    statuses = []
+    result = application(environ, lambda status, headers: statuses.append(status))
+    try:
+        b"".join(result)
+    finally:
+        # Sends request_finished, which closes the expired connections
+        result.close()
+    return int(statuses[0].split()[0])
+
+
+def run_wsgi(requests, workers):
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+
+    def get(request):
+        started = time.perf_counter()
+        status = wsgi_get(application, *request)
+        assert status == 200, status
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(get, requests))
+
+
+async def run_asgi(requests, concurrency):
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(request):
+        async with semaphore:
+            started = time.perf_counter()
+            status = await asgi_get(application, *request)
+            assert status == 200, status
+            return (time.perf_counter() - started) * 1000
+
+    return await asyncio.gather(*(get(request) for request in requests))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--connect-ms", type=float, default=5)
+    parser.add_argument("--max-age", type=int, default=60)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.db import connections
+    from core.connection_metrics import connection_stats, reset_connection_stats
+
+    call_command(
+        "generate_data",
+        seed=args.seed,
+        clinics=20,
+        doctors=100,
+        patients=100,
+        years=1,
+        stdout=io.StringIO(),
+    )
+    settings_dict = connections.settings["default"]
+    modes = {
+        "per-request": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False},
+        "persistent": {"CONN_MAX_AGE": args.max_age, "CONN_HEALTH_CHECKS": True},
+    }
+    if settings_dict["OPTIONS"].get("pool"):
+        modes = {"pool": {"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False}}
+    elif settings_dict["ENGINE"].endswith("sqlite3"):
+        slow_connects(args.connect_ms / 1000)
+    connections.close_all()
+
+    print(
+        f"{'route':22} {'server':6} {'mode':12} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'checkouts/req':>14} {'reused/req':>11}"
+    )
+    for name in ROUTES:
+        requests = requests_for(name, args.requests)
+        for server in ["wsgi", "asgi"]:
+            for mode, options in modes.items():
+                settings_dict.update(options)
+                reset_connection_stats()
+                if server == "wsgi":
+                    timings = run_wsgi(requests, args.workers)
+                else:
+                    timings = asyncio.run(run_asgi(requests, args.concurrency))
+                stats = connection_stats()[0]
+                p95 = statistics.quantiles(timings, n=20)[18]
+                print(
+                    f"{name:22} {server:6} {mode:12} "
+                    f"{statistics.median(timings):>8.1f} {p95:>8.1f} "
+                    f"{stats['checkouts'] / len(requests):>14.2f} "
+                    f"{stats['reused'] / len(requests):>11.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
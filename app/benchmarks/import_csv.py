@@ -0,0 +1,106 @@
+"""Rows per minute of ``import_patients`` on a synthetic legacy roster.
+
+Doctors and procedures come from ``generate_data``; the CSV has
+``--patients`` patients with ``--visits`` visits each, one row per visit::
+
+    python -m benchmarks.import_csv --patients 10000 --visits 4
+"""
+
+import argparse
+import csv
+import io
+import os
+import tempfile
+import time
+
+from benchmarks import setup_django
+
+
+def write_roster(path, patients, visits, npis, procedures):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(
+            [
+                "email",
+                "first_name",
+                "last_name",
+                "date_of_birth",
+                "address",
+                "phone_number",
+                "ssn_last_four",
+                "gender",
+                "visit_date",
+                "doctor_npi",
+                "procedures",
+                "doctor_notes",
+            ]
+        )
+        for index in range(patients):
+            patient = [
+                f"legacy{index}@example.com",
+                "Legacy",
+                f"Patient{index}",
+                "1980-05-17",
+                f"{index} Legacy Rd",
+                "555-555-5555",
+                f"{index % 10000:04d}",
+                "FM"[index % 2],
+            ]
+            for visit in range(visits):
+                writer.writerow(
+                    patient
+                    + [
+                        f"2020-{visit % 12 + 1:02d}-{index % 28 + 1:02d}T09:00:00Z",
+                        npis[(index + visit) % len(npis)],
+                        procedures[visit % len(procedures)],
+                        "Imported from the legacy system",
+                    ]
+                )
+    return patients * visits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--patients", type=int, default=10000)
+    parser.add_argument("--visits", type=int, default=4, help="Per patient")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from core.models import Clinic, Doctor, Procedure
+
+    call_command(
+        "generate_data",
+        seed=args.seed,
+        clinics=1,
+        doctors=20,
+        patients=0,
+        skip_availability=True,
+        stdout=io.StringIO(),
+    )
+    npis = list(Doctor.objects.values_list("npi", flat=True))
+    procedures = list(Procedure.objects.values_list("name", flat=True))
+    path = os.path.join(tempfile.mkdtemp(prefix="dental-bench-"), "roster.csv")
+    rows = write_roster(path, args.patients, args.visits, npis, procedures)
+
+    clinic = Clinic.objects.order_by("-pk").first()
+    for label in ("first import", "re-import"):
+        started = time.perf_counter()
+        call_command(
+            "import_patients",
+            path,
+            clinic=clinic.pk,
+            batch_size=args.batch_size,
+            stdout=io.StringIO(),
+        )
+        elapsed = time.perf_counter() - started
+        print(
+            f"{label:13} {rows} rows in {elapsed:.1f}s"
+            f" ({rows / elapsed * 60:,.0f} rows/min)"
+        )
+
+
+if __name__ == "__main__":
+    main()
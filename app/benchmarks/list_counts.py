@@ -0,0 +1,119 @@
+"""Clinic and doctor list latency as visit and appointment history grows.
+
+A ``generate_data`` dataset is doubled a few times by copying its visits and
+appointments into later weeks, and the first page of each list is timed with
+the counters read from the stats tables, as the views do, and with the
+former single ``Count`` over the visit and appointment joins::
+
+    python -m benchmarks.list_counts --patients 2000 --doublings 3
+"""
+
+import argparse
+import io
+import statistics
+import time
+from datetime import timedelta
+
+from benchmarks import setup_django
+
+
+def legacy_counts(queryset, key):
+    from django.db.models import Count, F, Q
+
+    return queryset.annotate(
+        legacy_patients=Count(
+            "visit__patient",
+            filter=Q(**{f"visit__{key}": F("pk")})
+            | Q(**{f"appointment__{key}": F("pk")}),
+            distinct=True,
+        )
+    )
+
+
+def double_history(weeks):
+    """Copy every visit and appointment ``weeks`` weeks later."""
+    from django.db import transaction
+    from core.models import Appointment, Visit
+    from core.stats import rebuild_stats
+
+    shift = timedelta(weeks=weeks)
+    with transaction.atomic():
+        visits = list(Visit.objects.all())
+        for visit in visits:
+            visit.pk, visit.visit_date = None, visit.visit_date + shift
+        Visit.objects.bulk_create(visits, batch_size=5000)
+        appointments = list(Appointment.objects.all())
+        for appointment in appointments:
+            appointment.pk = None
+            appointment.appointment_date += shift
+        Appointment.objects.bulk_create(appointments, batch_size=5000)
+    # bulk_create skips the signals that maintain the stats
+    rebuild_stats()
+
+
+def timed(queryset, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset.all())  # a fresh clone, not the cached results
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clinics", type=int, default=50)
+    parser.add_argument("--doctors", type=int, default=200)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--doublings", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--skip-legacy",
+        action="store_true",
+        help="Only time the current queries (the legacy ones grow quadratically)",
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test import RequestFactory
+    from core.models import Appointment, Visit
+    from core.views import ClinicListView, DoctorListView
+
+    call_command(
+        "generate_data",
+        clinics=args.clinics,
+        doctors=args.doctors,
+        patients=args.patients,
+        skip_availability=True,
+        stdout=io.StringIO(),
+    )
+
+    def first_page(view_class, legacy_key=None):
+        view = view_class()
+        view.setup(RequestFactory().get("/"))
+        queryset = view.get_queryset()
+        if legacy_key:
+            queryset = legacy_counts(view.model.objects.all(), legacy_key)
+        return queryset.order_by(*view.keyset_fields)[: view.paginate_by]
+
+    print(f"{'visits':>9} {'appts':>9} {'list':8} {'current ms':>11} {'legacy ms':>10}")
+    for step in range(args.doublings + 1):
+        if step:
+            double_history(weeks=52 * 2**step)
+        visits, appointments = Visit.objects.count(), Appointment.objects.count()
+        for label, view_class, key in (
+            ("clinics", ClinicListView, "clinic"),
+            ("doctors", DoctorListView, "doctor"),
+        ):
+            current = timed(first_page(view_class), args.repeat)
+            legacy = "-"
+            if not args.skip_legacy:
+                legacy = f"{timed(first_page(view_class, key), args.repeat):.1f}"
+            print(
+                f"{visits:>9} {appointments:>9} {label:8} {current:>11.1f} {legacy:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
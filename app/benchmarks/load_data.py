@@ -0,0 +1,65 @@
+"""Throughput of ``load_data --bulk`` on a synthetic world-sized geo file."""
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+from benchmarks import setup_django
+
+
+def write_synthetic_file(path, countries, states, cities):
+    """Write ``countries`` x ``states`` states with ``cities`` cities in total."""
+    per_state = max(1, cities // (countries * states))
+    with open(path, "w") as file:
+        file.write("[")
+        for c in range(countries):
+            country = {
+                "name": f"Country {c}",
+                "states": [
+                    {
+                        "name": f"State {c}-{s}",
+                        "cities": [
+                            {"name": f"City {c}-{s}-{i}"} for i in range(per_state)
+                        ],
+                    }
+                    for s in range(states)
+                ],
+            }
+            file.write(("," if c else "") + json.dumps(country))
+        file.write("]")
+    return countries * states * per_state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--countries", type=int, default=200)
+    parser.add_argument("--states", type=int, default=25)
+    parser.add_argument("--cities", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+
+    path = os.path.join(tempfile.mkdtemp(prefix="geo-"), "geo_data.json")
+    cities = write_synthetic_file(path, args.countries, args.states, args.cities)
+    print(f"Synthetic file: {cities} cities, {os.path.getsize(path) >> 20} MiB")
+
+    for run in ("initial load", "reload (nothing new)"):
+        started = time.perf_counter()
+        call_command(
+            "load_data",
+            file=path,
+            bulk=True,
+            batch_size=args.batch_size,
+            stdout=io.StringIO(),
+        )
+        elapsed = time.perf_counter() - started
+        print(f"{run}: {elapsed:.1f}s, {cities / elapsed:,.0f} cities/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Login throughput and latency of ``EmailBackend`` under concurrent load.
+
+``--threads`` workers authenticate ``--logins`` times between them with a
+mix of right passwords, wrong passwords and unknown emails, against the
+current backend and the former one (an email query, then a username query,
+and no password hash for unknown users)::
+
+    python -m benchmarks.login --users 10000 --logins 400 --threads 8
+
+Similar p50s across the three kinds mean a failed login does not tell
+whether the account exists.
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_django
+
+KINDS = ("valid", "wrong password", "unknown")
+
+
+def legacy_authenticate(username, password):
+    from django.contrib.auth import get_user_model
+
+    UserModel = get_user_model()
+    user = UserModel.objects.filter(email=username).first()
+    if not user:
+        user = UserModel.objects.filter(username=username).first()
+    if user and user.check_password(password):
+        return user
+    return None
+
+
+def attempt(authenticate, index, users):
+    from django.db import connection
+
+    kind = KINDS[index % len(KINDS)]
+    email = f"login{index % users}@example.com"
+    password = "wrong" if kind == "wrong password" else "benchmark-password"
+    if kind == "unknown":
+        email = f"nobody{index}@example.com"
+    started = time.perf_counter()
+    user = authenticate(email, password)
+    elapsed = (time.perf_counter() - started) * 1000
+    connection.close()
+    assert (user is not None) == (kind == "valid"), kind
+    return kind, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--logins", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth import authenticate, get_user_model
+    from django.contrib.auth.hashers import make_password
+
+    User = get_user_model()
+    password = make_password("benchmark-password")
+    User.objects.bulk_create(
+        [
+            User(
+                username=f"login{index}",
+                email=f"login{index}@example.com",
+                password=password,
+            )
+            for index in range(args.users)
+        ],
+        batch_size=2000,
+        ignore_conflicts=True,
+    )
+
+    backends = {
+        "current": lambda email, password: authenticate(
+            username=email, password=password
+        ),
+        "legacy": legacy_authenticate,
+    }
+    print(
+        f"{'backend':8} {'logins/s':>9} "
+        + " ".join(f"{f'p50 {kind} ms':>22}" for kind in KINDS)
+    )
+    for name, backend in backends.items():
+        timings = {kind: [] for kind in KINDS}
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            for kind, elapsed in pool.map(
+                lambda index: attempt(backend, index, args.users), range(args.logins)
+            ):
+                timings[kind].append(elapsed)
+        rate = args.logins / (time.perf_counter() - started)
+        print(
+            f"{name:8} {rate:>9.1f} "
+            + " ".join(f"{statistics.median(timings[kind]):>22.1f}" for kind in KINDS)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Clinic and doctor lookups by procedure: ORM joins against the index.
+
+For every procedure (and every clinic of a procedure), finds the clinics
+and doctors able to perform it the way ``ajax_load_clinics`` and
+``ajax_load_doctors`` used to, with a join of the affiliations and the
+specialties and ``DISTINCT``, and with ``core.matching``::
+
+    python -m benchmarks.matching --clinics 50 --doctors 500 --repeat 20
+
+Also reports how long building the index takes, from the database and from
+the shared cache.
+"""
+
+import argparse
+import io
+import statistics
+import time
+
+from benchmarks import setup_django
+
+
+def orm_clinics(procedure_id):
+    from core.models import Clinic
+
+    return set(
+        Clinic.objects.filter(
+            doctorclinicaffiliation__doctor__specialties__id=procedure_id
+        )
+        .distinct()
+        .values_list("id", flat=True)
+    )
+
+
+def orm_doctors(procedure_id, clinic_id):
+    from core.models import Doctor
+
+    return set(
+        Doctor.objects.filter(clinics__id=clinic_id, specialties__id=procedure_id)
+        .distinct()
+        .values_list("id", flat=True)
+    )
+
+
+def index_clinics(procedure_id):
+    from core.matching import matching_options
+
+    return set(matching_options(procedure_id))
+
+
+def index_doctors(procedure_id, clinic_id):
+    from core.matching import matching_options
+
+    return set(matching_options(procedure_id, clinic_id).get(clinic_id, ()))
+
+
+def timed(function, calls, repeat):
+    timings = []
+    for _ in range(repeat):
+        for args in calls:
+            started = time.perf_counter()
+            function(*args)
+            timings.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(timings), statistics.quantiles(timings, n=20)[18]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--clinics", type=int, default=50)
+    parser.add_argument("--doctors", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from core import matching
+
+    call_command(
+        "generate_data",
+        seed=args.seed,
+        clinics=args.clinics,
+        doctors=args.doctors,
+        patients=100,
+        years=1,
+        stdout=io.StringIO(),
+    )
+
+    started = time.perf_counter()
+    matching.invalidate_matching()
+    index = matching.matching_index()
+    cold = (time.perf_counter() - started) * 1000
+    matching._index.cache_clear()
+    started = time.perf_counter()
+    matching.matching_index()
+    warm = (time.perf_counter() - started) * 1000
+    triples = sum(
+        len(doctors)
+        for clinics in index.clinics.values()
+        for doctors in clinics.values()
+    )
+    print(
+        f"Index of {triples} triples built in {cold:.1f} ms from the database, "
+        f"{warm:.1f} ms from the cache"
+    )
+
+    clinic_calls = [(procedure,) for procedure in index.clinics]
+    doctor_calls = [
+        (procedure, clinic)
+        for procedure, clinics in index.clinics.items()
+        for clinic in clinics
+    ]
+    for procedure, clinic in doctor_calls:
+        assert orm_doctors(procedure, clinic) == index_doctors(procedure, clinic)
+    for (procedure,) in clinic_calls:
+        assert orm_clinics(procedure) == index_clinics(procedure)
+
+    print(f"{'lookup':10} {'path':6} {'p50 us':>9} {'p95 us':>9}")
+    for name, calls, paths in [
+        ("clinics", clinic_calls, {"orm": orm_clinics, "index": index_clinics}),
+        ("doctors", doctor_calls, {"orm": orm_doctors, "index": index_doctors}),
+    ]:
+        for path, function in paths.items():
+            p50, p95 = timed(function, calls, args.repeat)
+            print(f"{name:10} {path:6} {p50:>9.1f} {p95:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
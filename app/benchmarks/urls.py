@@ -0,0 +1,167 @@
+"""Latency and query counts of every page and endpoint on a synthetic dataset.
+
+Each GET route of ``core.urls`` and ``api.urls`` is requested ``--repeat``
+times through the test client as a logged-in superuser, and the p50/p95
+latency and the number of queries of the last request are reported::
+
+    python -m benchmarks.urls --patients 20000 --repeat 20
+
+The dataset comes from the ``generate_data`` command. Point ``SQL_ENGINE``,
+``SQL_DATABASE`` and friends at a local Postgres to benchmark it instead of
+a temporary SQLite file.
+"""
+
+import argparse
+import io
+import statistics
+import time
+
+from benchmarks import setup_django
+
+# Routes that change data on GET, only accept POST, stream whole tables or
+# need a token
+SKIPPED = {
+    "logout",
+    "invite-accept",
+    "delete-affiliation",
+    "export-history",
+    "api-patient-bulk",
+    "api-doctor-bulk",
+    "api-clinic-bulk",
+    "api-patient-import",
+}
+
+
+def iter_routes(patterns):
+    from django.urls import URLPattern, URLResolver
+
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name, list(pattern.pattern.converters)
+
+
+def sample_objects():
+    from django.utils import timezone
+    from core.models import Appointment, Visit
+
+    appointment = (
+        Appointment.objects.filter(appointment_date__gte=timezone.now())
+        .select_related("patient", "doctor", "clinic", "procedure")
+        .order_by("pk")
+        .first()
+    )
+    visit = Visit.objects.select_related("patient").order_by("pk").first()
+    affiliation = appointment.doctor.doctorclinicaffiliation_set.get(
+        clinic=appointment.clinic
+    )
+    return appointment, visit, affiliation
+
+
+def route_request(name, kwargs, appointment, visit, affiliation):
+    """Return the ``(path, query)`` to benchmark for a named route."""
+    from django.urls import reverse
+    from django.utils import timezone
+
+    objects = {
+        "clinic": appointment.clinic_id,
+        "patient": visit.patient_id,
+        "doctor": appointment.doctor_id,
+        "visit": visit.pk,
+        "appointment": appointment.pk,
+    }
+    values = {
+        "clinic_id": appointment.clinic_id,
+        "patient_id": visit.patient_id,
+        "affiliation_id": affiliation.pk,
+    }
+    if "pk" in kwargs:
+        values["pk"] = objects[name.removeprefix("api-").split("-")[0]]
+    path = reverse(name, kwargs={key: values[key] for key in kwargs})
+
+    query = {}
+    if name.startswith("ajax_"):
+        # Every AJAX view ignores the parameters it does not use
+        query = {
+            "country_id": 1,
+            "state_id": 1,
+            "procedure_id": appointment.procedure_id,
+            "clinic_id": appointment.clinic_id,
+            "doctor_id": appointment.doctor_id,
+            "start": timezone.localdate().isoformat(),
+        }
+    return path, query
+
+
+def measure(client, path, query, repeat):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(path, query)
+            timings.append((time.perf_counter() - started) * 1000)
+    if len(timings) > 1:
+        cuts = statistics.quantiles(timings, n=20, method="inclusive")
+        p50, p95 = statistics.median(timings), cuts[18]
+    else:
+        p50 = p95 = timings[0]
+    return response.status_code, p50, p95, len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--clinics", type=int, default=20)
+    parser.add_argument("--doctors", type=int, default=100)
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--skip-generate",
+        action="store_true",
+        help="Benchmark the data already in the database",
+    )
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test import Client
+    from users.models import User
+
+    if not args.skip_generate:
+        started = time.perf_counter()
+        call_command(
+            "generate_data",
+            seed=args.seed,
+            clinics=args.clinics,
+            doctors=args.doctors,
+            patients=args.patients,
+            years=args.years,
+            stdout=io.StringIO(),
+        )
+        print(f"Dataset generated in {time.perf_counter() - started:.1f}s")
+
+    import core.urls
+
+    user, _ = User.objects.get_or_create(
+        username="benchmark-admin", defaults={"is_staff": True, "is_superuser": True}
+    )
+    client = Client()
+    client.force_login(user)
+    samples = sample_objects()
+
+    print(f"{'route':32} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8}")
+    for name, kwargs in iter_routes(core.urls.urlpatterns):
+        if name in SKIPPED:
+            continue
+        path, query = route_request(name, kwargs, *samples)
+        status, p50, p95, queries = measure(client, path, query, args.repeat)
+        print(f"{name:32} {status:>6} {p50:>9.1f} {p95:>9.1f} {queries:>8}")
+
+
+if __name__ == "__main__":
+    main()
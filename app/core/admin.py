@@ -44,7 +44,7 @@ class CityAdmin(admin.ModelAdmin):
 
 @admin.register(Procedure)
 class ProcedureAdmin(admin.ModelAdmin):
-    list_display = ["name"]
+    list_display = ["name", "duration_minutes"]
     search_fields = ["name"]
 
 
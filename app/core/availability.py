@@ -0,0 +1,358 @@
+"""Availability engine for doctor/clinic working schedules.
+
+A ``DoctorClinicAffiliation.working_schedule`` is a list of entries of three
+kinds:
+
+* one-off shifts, as saved by the affiliation calendar::
+
+    {"start": "2024-09-26T09:00:00", "end": "2024-09-26T13:00:00"}
+
+* weekly rules, with optional breaks (weekdays are Monday=0 ... Sunday=6)::
+
+    {"days": [0, 1, 2, 3, 4], "start": "09:00", "end": "17:00",
+     "breaks": [{"start": "12:00", "end": "13:00"}]}
+
+* exceptions that close a whole day or a period::
+
+    {"closed": true, "date": "2024-12-25"}
+    {"closed": true, "start": "2024-12-24T13:00:00", "end": "2024-12-24T17:00:00"}
+
+Naive datetimes and weekly rule times are read in the current time zone.
+Booked appointments are loaded once into a ``BookedIntervals`` index and
+subtracted from the working intervals; the free windows left are cut into
+slots of the procedure duration.
+
+Free windows for the next ``AVAILABILITY_HORIZON_DAYS`` are materialized per
+affiliation and day in ``AvailabilitySlot``. They are rebuilt from the
+signal handlers in ``core.signals`` when a schedule or an appointment changes
+and by the ``rebuild_availability`` command, which should run daily to roll
+the horizon forward.
+"""
+
+import json
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Appointment,
+    AvailabilitySlot,
+    DoctorClinicAffiliation,
+    Procedure,
+)
+
+Slot = namedtuple("Slot", ["start", "end"])
+
+MAX_AVAILABILITY_DAYS = 92
+
+# Appointments starting this long before the range may still run into it
+BOOKING_LOOKBACK = timedelta(days=1)
+
+# How far ahead free windows are materialized in AvailabilitySlot
+AVAILABILITY_HORIZON_DAYS = getattr(settings, "AVAILABILITY_HORIZON_DAYS", 365)
+
+
+def normalize_schedule(working_schedule):
+    """Return the schedule as a list of dict entries, whatever was stored."""
+    if isinstance(working_schedule, str):
+        try:
+            working_schedule = json.loads(working_schedule)
+        except ValueError:
+            return []
+    if not isinstance(working_schedule, list):
+        return []
+    return [entry for entry in working_schedule if isinstance(entry, dict)]
+
+
+def _aware(value, tz):
+    if timezone.is_naive(value):
+        return timezone.make_aware(value, tz)
+    return value
+
+
+def _parse_datetime(value, tz):
+    return _aware(datetime.fromisoformat(value), tz)
+
+
+def _parse_time(value):
+    return time.fromisoformat(value)
+
+
+def _at(day, moment, tz):
+    return timezone.make_aware(datetime.combine(day, moment), tz)
+
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _subtract(intervals, blocks):
+    """Remove ``blocks`` from a sorted list of ``(start, end)`` intervals."""
+    blocks = _merge(blocks)
+    block_ends = [end for _, end in blocks]
+    result = []
+    for start, end in intervals:
+        index = bisect_right(block_ends, start)
+        while index < len(blocks) and blocks[index][0] < end:
+            block_start, block_end = blocks[index]
+            if block_start > start:
+                result.append((start, block_start))
+            start = max(start, block_end)
+            index += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def working_intervals(schedule, range_start, range_end, tz=None):
+    """Return sorted open intervals of ``schedule`` within the given range."""
+    tz = tz or timezone.get_current_timezone()
+    intervals, blocks = [], []
+
+    for entry in schedule:
+        try:
+            if entry.get("closed"):
+                if "date" in entry:
+                    day = datetime.fromisoformat(entry["date"]).date()
+                    blocks.append(
+                        (
+                            _at(day, time.min, tz),
+                            _at(day + timedelta(days=1), time.min, tz),
+                        )
+                    )
+                else:
+                    blocks.append(
+                        (
+                            _parse_datetime(entry["start"], tz),
+                            _parse_datetime(entry["end"], tz),
+                        )
+                    )
+            elif "days" in entry:
+                days = {int(day) for day in entry["days"]}
+                start_time = _parse_time(entry["start"])
+                end_time = _parse_time(entry["end"])
+                breaks = [
+                    (_parse_time(b["start"]), _parse_time(b["end"]))
+                    for b in entry.get("breaks", [])
+                ]
+                day = timezone.localtime(range_start, tz).date()
+                last_day = timezone.localtime(range_end, tz).date()
+                while day <= last_day:
+                    if day.weekday() in days:
+                        shift = [(_at(day, start_time, tz), _at(day, end_time, tz))]
+                        pauses = [
+                            (_at(day, b[0], tz), _at(day, b[1], tz)) for b in breaks
+                        ]
+                        intervals.extend(_subtract(shift, pauses))
+                    day += timedelta(days=1)
+            else:
+                intervals.append(
+                    (
+                        _parse_datetime(entry["start"], tz),
+                        _parse_datetime(entry["end"], tz),
+                    )
+                )
+        except (KeyError, TypeError, ValueError):
+            # Skip malformed entries rather than failing the whole schedule
+            continue
+
+    intervals = [
+        (max(start, range_start), min(end, range_end))
+        for start, end in intervals
+        if start < range_end and end > range_start
+    ]
+    return _subtract(_merge(intervals), blocks)
+
+
+class BookedIntervals:
+    """Sorted index of booked ``(start, end)`` intervals.
+
+    Bookings are merged into disjoint intervals ordered by start (and hence by
+    end), so both ``overlaps`` and ``subtract_from`` locate the relevant
+    bookings with a binary search instead of scanning them all.
+    """
+
+    def __init__(self, intervals):
+        self.intervals = _merge(intervals)
+        self.ends = [end for _, end in self.intervals]
+
+    def overlaps(self, start, end):
+        index = bisect_right(self.ends, start)
+        return index < len(self.intervals) and self.intervals[index][0] < end
+
+    def subtract_from(self, intervals):
+        return _subtract(intervals, self.intervals)
+
+
+def generate_slots(intervals, duration):
+    """Cut free intervals into consecutive slots of ``duration``."""
+    slots = []
+    for start, end in intervals:
+        while start + duration <= end:
+            slots.append(Slot(start, start + duration))
+            start += duration
+    return slots
+
+
+def booked_intervals(doctor_id, range_start, range_end):
+    """Load the doctor's appointments around the range into an index."""
+    rows = Appointment.objects.filter(
+        doctor_id=doctor_id,
+        appointment_date__lt=range_end,
+        appointment_date__gt=range_start - BOOKING_LOOKBACK,
+    ).values_list("appointment_date", "procedure__duration_minutes")
+    return BookedIntervals(
+        (start, start + timedelta(minutes=minutes)) for start, minutes in rows
+    )
+
+
+def free_intervals(affiliation, range_start, range_end, tz=None):
+    """Working intervals of ``affiliation`` minus the doctor's bookings."""
+    intervals = working_intervals(
+        normalize_schedule(affiliation.working_schedule), range_start, range_end, tz
+    )
+    booked = booked_intervals(affiliation.doctor_id, range_start, range_end)
+    return booked.subtract_from(intervals)
+
+
+def _split_days(intervals, tz):
+    """Cut intervals at local midnight so each piece belongs to one day."""
+    for start, end in intervals:
+        while start < end:
+            day = timezone.localtime(start, tz).date()
+            midnight = _at(day + timedelta(days=1), time.min, tz)
+            yield day, start, min(end, midnight)
+            start = midnight
+
+
+def horizon_end():
+    return timezone.localdate() + timedelta(days=AVAILABILITY_HORIZON_DAYS)
+
+
+def rebuild_availability(affiliation, start_date=None, end_date=None):
+    """Recompute the stored free windows of ``affiliation`` for a date range.
+
+    The range defaults to the whole horizon, from today to
+    ``AVAILABILITY_HORIZON_DAYS`` ahead. Rows in ``[start_date, end_date)``
+    are replaced in one transaction, and ``availability_until`` is moved
+    forward when the range extends the contiguous materialized window.
+    """
+    tz = timezone.get_current_timezone()
+    today = timezone.localdate()
+    start_date = start_date or today
+    end_date = end_date or horizon_end()
+    if start_date >= end_date:
+        return
+
+    windows = free_intervals(
+        affiliation, _at(start_date, time.min, tz), _at(end_date, time.min, tz), tz
+    )
+    covered_until = max(affiliation.availability_until or today, today)
+    with transaction.atomic():
+        AvailabilitySlot.objects.filter(
+            affiliation=affiliation, date__gte=start_date, date__lt=end_date
+        ).delete()
+        AvailabilitySlot.objects.bulk_create(
+            AvailabilitySlot(affiliation=affiliation, date=day, start=start, end=end)
+            for day, start, end in _split_days(windows, tz)
+        )
+        if start_date <= covered_until < end_date:
+            DoctorClinicAffiliation.objects.filter(pk=affiliation.pk).update(
+                availability_until=end_date
+            )
+            affiliation.availability_until = end_date
+
+
+def extend_availability(affiliation):
+    """Roll the materialized window forward to the horizon and drop past days."""
+    today = timezone.localdate()
+    AvailabilitySlot.objects.filter(affiliation=affiliation, date__lt=today).delete()
+    until = affiliation.availability_until
+    rebuild_availability(affiliation, max(until, today) if until else today)
+
+
+def refresh_doctor_availability(doctor_id, start, end):
+    """Rebuild the days touched by a booking in every clinic of the doctor."""
+    tz = timezone.get_current_timezone()
+    start_date = max(timezone.localtime(start, tz).date(), timezone.localdate())
+    end_date = timezone.localtime(end, tz).date() + timedelta(days=1)
+    for affiliation in DoctorClinicAffiliation.objects.filter(doctor_id=doctor_id):
+        if affiliation.availability_until:
+            rebuild_availability(
+                affiliation, start_date, min(end_date, affiliation.availability_until)
+            )
+
+
+def get_availabilities(affiliations, start_date, days=1, procedure=None):
+    """Return ``{affiliation_id: {date: [Slot, ...]}}``, see ``get_availability``.
+
+    The materialized windows of all the affiliations are read with a single
+    query.
+    """
+    days = max(1, min(days, MAX_AVAILABILITY_DAYS))
+    tz = timezone.get_current_timezone()
+    end_date = start_date + timedelta(days=days)
+    minutes = (
+        procedure.duration_minutes
+        if procedure is not None
+        else Procedure.DEFAULT_DURATION_MINUTES
+    )
+
+    # Dates inside the materialized horizon are a single range scan over
+    # AvailabilitySlot; anything else (past dates, not yet built) is computed.
+    windows, stored = {}, []
+    for affiliation in affiliations:
+        if (
+            affiliation.availability_until
+            and timezone.localdate() <= start_date
+            and end_date <= affiliation.availability_until
+        ):
+            windows[affiliation.pk] = []
+            stored.append(affiliation.pk)
+        else:
+            windows[affiliation.pk] = free_intervals(
+                affiliation,
+                _at(start_date, time.min, tz),
+                _at(end_date, time.min, tz),
+                tz,
+            )
+    if stored:
+        for affiliation_id, start, end in (
+            AvailabilitySlot.objects.filter(
+                affiliation__in=stored, date__gte=start_date, date__lt=end_date
+            )
+            .order_by("affiliation", "date", "start")
+            .values_list("affiliation_id", "start", "end")
+        ):
+            windows[affiliation_id].append((start, end))
+
+    availabilities = {}
+    for affiliation_id, intervals in windows.items():
+        availability = {
+            start_date + timedelta(days=offset): [] for offset in range(days)
+        }
+        for slot in generate_slots(intervals, timedelta(minutes=minutes)):
+            availability[timezone.localtime(slot.start, tz).date()].append(slot)
+        availabilities[affiliation_id] = availability
+    return availabilities
+
+
+def get_availability(affiliation, start_date, days=1, procedure=None):
+    """Return ``{date: [Slot, ...]}`` for ``days`` days from ``start_date``.
+
+    Slots last ``procedure.duration_minutes`` (or the default duration) and
+    exclude any overlap with the doctor's existing appointments, in any clinic.
+    """
+    return get_availabilities([affiliation], start_date, days, procedure)[
+        affiliation.pk
+    ]
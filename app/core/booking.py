@@ -0,0 +1,141 @@
+"""Atomic appointment booking.
+
+Bookings for a doctor are serialized while the overlap check and the insert
+run in one transaction, so two front-desk users cannot both take the same
+slot, nor overlapping ones, while bookings for other doctors proceed in
+parallel. PostgreSQL locks the doctor's row with ``SELECT ... FOR UPDATE``.
+SQLite has no row locks and ignores ``FOR UPDATE``, so there a no-op write to
+the doctor's row takes the database write lock before the check instead. The
+``unique_doctor_slot`` constraint is only a last line of defence: it rejects
+a second booking with the same start, not an overlapping one.
+"""
+
+from datetime import timedelta
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .availability import BOOKING_LOOKBACK, BookedIntervals, get_availabilities
+from .matching import matching_options
+from .models import Appointment, Clinic, Doctor, DoctorClinicAffiliation
+
+# Days of free slots sent with the booking options
+BOOKING_OPTION_DAYS = 7
+
+
+class BookingConflict(Exception):
+    """The requested slot overlaps an existing appointment of the doctor."""
+
+
+def lock_doctor(doctor_id):
+    """Hold off other bookings of the doctor until the transaction ends."""
+    doctor = Doctor.objects.filter(pk=doctor_id)
+    if connections[doctor.db].vendor == "sqlite":
+        # Deferred transactions only take the write lock at their first
+        # write, after the overlap check has read stale data
+        doctor.update(user_id=F("user_id"))
+    else:
+        doctor.select_for_update().exists()
+
+
+def book_appointment(appointment):
+    """Save ``appointment`` unless it overlaps another one of the same doctor."""
+    start = appointment.appointment_date
+    end = start + timedelta(minutes=appointment.procedure.duration_minutes)
+
+    with transaction.atomic():
+        lock_doctor(appointment.doctor_id)
+        existing = (
+            Appointment.objects.filter(
+                doctor_id=appointment.doctor_id,
+                appointment_date__lt=end,
+                appointment_date__gt=start - BOOKING_LOOKBACK,
+            )
+            .exclude(pk=appointment.pk)
+            .values_list("appointment_date", "procedure__duration_minutes")
+        )
+        booked = BookedIntervals(
+            (booked_start, booked_start + timedelta(minutes=minutes))
+            for booked_start, minutes in existing
+        )
+        if booked.overlaps(start, end):
+            raise BookingConflict
+        try:
+            with transaction.atomic():
+                appointment.save()
+        except IntegrityError:
+            raise BookingConflict
+    return appointment
+
+
+def booking_options(
+    procedure, clinic_id=None, doctor_id=None, start_date=None, days=None
+):
+    """Everything the booking form needs once ``procedure`` is picked.
+
+    Return the clinics and doctors that can perform it (narrowed down to
+    ``clinic_id`` and ``doctor_id`` when given) with the free slots of each
+    pair for ``days`` days from ``start_date``, as local start times::
+
+        {"procedure": {"id": 1, "name": "Filling", "duration_minutes": 45},
+         "clinics": [{"id": 3, "name": "North", "doctors": [12, 15]}],
+         "doctors": [{"id": 12, "name": "Ana Lopez"}, ...],
+         "availability": {3: {12: {"2024-10-01": ["09:00", "09:45"]}}}}
+
+    The matches come from the precomputed ``core.matching`` triples, so the
+    number of queries does not depend on how many clinics and doctors match.
+    """
+    start_date = start_date or timezone.localdate()
+    tz = timezone.get_current_timezone()
+    options = matching_options(procedure.pk, clinic_id, doctor_id)
+    doctor_ids = set().union(*options.values())
+
+    doctors = [
+        {"id": pk, "name": f"{first_name} {last_name}".strip()}
+        for pk, first_name, last_name in Doctor.objects.filter(pk__in=doctor_ids)
+        .order_by("user__last_name", "user__first_name")
+        .values_list("pk", "user__first_name", "user__last_name")
+    ]
+    order = {doctor["id"]: index for index, doctor in enumerate(doctors)}
+    clinics = [
+        {
+            "id": pk,
+            "name": name,
+            "doctors": sorted(options[pk], key=order.__getitem__),
+        }
+        for pk, name in Clinic.objects.filter(pk__in=options)
+        .order_by("name")
+        .values_list("pk", "name")
+    ]
+
+    affiliations = [
+        affiliation
+        for affiliation in DoctorClinicAffiliation.objects.filter(
+            clinic_id__in=options, doctor_id__in=doctor_ids
+        ).only("doctor_id", "clinic_id", "working_schedule", "availability_until")
+        if affiliation.doctor_id in options[affiliation.clinic_id]
+    ]
+    availabilities = get_availabilities(
+        affiliations, start_date, days or BOOKING_OPTION_DAYS, procedure
+    )
+    availability = {}
+    for affiliation in affiliations:
+        availability.setdefault(affiliation.clinic_id, {})[affiliation.doctor_id] = {
+            day.isoformat(): [
+                timezone.localtime(slot.start, tz).strftime("%H:%M") for slot in slots
+            ]
+            for day, slots in availabilities[affiliation.pk].items()
+            if slots
+        }
+
+    return {
+        "procedure": {
+            "id": procedure.pk,
+            "name": procedure.name,
+            "duration_minutes": procedure.duration_minutes,
+        },
+        "clinics": clinics,
+        "doctors": doctors,
+        "availability": availability,
+    }
@@ -0,0 +1,84 @@
+"""Database connection metrics of this worker process.
+
+For every database, counts the connections checked out by Django (opened,
+or taken from the psycopg pool when ``OPTIONS`` has ``"pool"``) and the
+requests that found their thread's persistent connection still open, and
+reports the age of the connections held now. Pooled databases add the
+pool's own numbers: its size, idle connections and the requests that had to
+wait for one. The numbers belong to the process that reports them.
+"""
+
+import threading
+import time
+import weakref
+from collections import Counter
+
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_lock = threading.Lock()
+_checkouts = Counter()
+_reused = Counter()
+# Connection wrapper: when it got its current connection
+_checked_out_at = weakref.WeakKeyDictionary()
+
+
+@receiver(connection_created)
+def count_checkout(sender, connection, **kwargs):
+    with _lock:
+        _checkouts[connection.alias] += 1
+        _checked_out_at[connection] = time.monotonic()
+
+
+@receiver(request_started)
+def count_reuse(sender, **kwargs):
+    # Django's own receiver has already closed the expired connections
+    with _lock:
+        for wrapper in connections.all(initialized_only=True):
+            if wrapper.connection is not None:
+                _reused[wrapper.alias] += 1
+
+
+def connection_mode(settings_dict):
+    if settings_dict.get("OPTIONS", {}).get("pool"):
+        return "pool"
+    if settings_dict.get("CONN_MAX_AGE") == 0:
+        return "per-request"
+    return "persistent"
+
+
+def connection_stats():
+    """Return the connection numbers of every database of this process."""
+    now = time.monotonic()
+    ages = {}
+    with _lock:
+        for wrapper, checked_out_at in list(_checked_out_at.items()):
+            if wrapper.connection is not None:
+                ages.setdefault(wrapper.alias, []).append(now - checked_out_at)
+        checkouts, reused = dict(_checkouts), dict(_reused)
+
+    report = []
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        held = ages.get(alias, [])
+        row = {
+            "alias": alias,
+            "mode": connection_mode(settings_dict),
+            "checkouts": checkouts.get(alias, 0),
+            "reused": reused.get(alias, 0),
+            "held": len(held),
+            "oldest_held_seconds": round(max(held, default=0), 3),
+        }
+        if row["mode"] == "pool":
+            # size, available, waiting, wait time and errors, see psycopg_pool
+            row["pool"] = connections[alias].pool.get_stats()
+        report.append(row)
+    return report
+
+
+def reset_connection_stats():
+    with _lock:
+        _checkouts.clear()
+        _reused.clear()
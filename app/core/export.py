@@ -0,0 +1,192 @@
+"""Visit and appointment history exports, streamed as CSV or NDJSON.
+
+Rows are read with ``QuerySet.iterator()``, which uses a server-side cursor
+on PostgreSQL, and written out as they arrive, so memory use does not
+depend on the size of the export. Visits get their procedures with one
+query per ``EXPORT_CHUNK_SIZE`` rows.
+"""
+
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Concat, Trim
+
+from .models import Appointment, Visit
+
+EXPORT_CHUNK_SIZE = 2000
+# Rows are joined into writes of about this many characters
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+COMMON_COLUMNS = [
+    "id",
+    "date",
+    "patient_id",
+    "patient_name",
+    "doctor_id",
+    "doctor_name",
+    "doctor_npi",
+    "clinic_id",
+    "clinic_name",
+]
+
+
+def _full_name(relation):
+    return Trim(
+        Concat(
+            f"{relation}__user__first_name",
+            Value(" "),
+            f"{relation}__user__last_name",
+            output_field=CharField(),
+        )
+    )
+
+
+def _rows(queryset, date_field, **fields):
+    return queryset.values(
+        "id",
+        "patient_id",
+        "doctor_id",
+        "clinic_id",
+        date=F(date_field),
+        patient_name=_full_name("patient"),
+        doctor_name=_full_name("doctor"),
+        doctor_npi=F("doctor__npi"),
+        clinic_name=F("clinic__name"),
+        **fields,
+    )
+
+
+def _visits(queryset):
+    return _rows(queryset, "visit_date", notes=F("doctor_notes"))
+
+
+def _appointments(queryset):
+    return _rows(
+        queryset,
+        "appointment_date",
+        procedure_name=F("procedure__name"),
+        booked=F("booked_date"),
+    )
+
+
+def _add_procedures(rows):
+    through = Visit.procedures_done.through
+    names = defaultdict(list)
+    for visit_id, name in (
+        through.objects.filter(visit_id__in=[row["id"] for row in rows])
+        .order_by("procedure__name")
+        .values_list("visit_id", "procedure__name")
+    ):
+        names[visit_id].append(name)
+    for row in rows:
+        row["procedures"] = names[row["id"]]
+
+
+# Kind: (model, date field, rows of a queryset, columns, per chunk step)
+EXPORTS = {
+    "visits": (
+        Visit,
+        "visit_date",
+        _visits,
+        [*COMMON_COLUMNS, "procedures", "notes"],
+        _add_procedures,
+    ),
+    "appointments": (
+        Appointment,
+        "appointment_date",
+        _appointments,
+        [*COMMON_COLUMNS, "procedure_name", "booked"],
+        None,
+    ),
+}
+
+
+def export_rows(kind, start=None, end=None, clinic=None):
+    """Yield the rows of ``kind`` as dicts, in primary key order.
+
+    ``start`` and ``end`` are aware datetimes bounding the visit or
+    appointment date, ``end`` excluded.
+    """
+    model, date_field, rows, _, step = EXPORTS[kind]
+    queryset = model.objects.all()
+    if start:
+        queryset = queryset.filter(**{f"{date_field}__gte": start})
+    if end:
+        queryset = queryset.filter(**{f"{date_field}__lt": end})
+    if clinic:
+        queryset = queryset.filter(clinic=clinic)
+    iterator = rows(queryset.order_by("pk")).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    while chunk := list(islice(iterator, EXPORT_CHUNK_SIZE)):
+        if step:
+            step(chunk)
+        yield from chunk
+
+
+class Echo:
+    """File-like object whose ``write`` returns what it is given."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, list):
+        return "; ".join(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(kind, rows):
+    columns = EXPORTS[kind][3]
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[column]) for column in columns])
+
+
+def ndjson_lines(kind, rows):
+    columns = EXPORTS[kind][3]
+    for row in rows:
+        yield json.dumps(
+            {column: row[column] for column in columns}, cls=DjangoJSONEncoder
+        ) + "\n"
+
+
+# Format: (content type, line renderer)
+FORMATS = {
+    "csv": ("text/csv", csv_lines),
+    "ndjson": ("application/x-ndjson", ndjson_lines),
+}
+
+
+def stream_export(kind, format, **filters):
+    """Yield the export as strings of about ``EXPORT_BUFFER_SIZE``."""
+    lines = FORMATS[format][1](kind, export_rows(kind, **filters))
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_BUFFER_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+async def aiter_chunks(chunks):
+    """Serve the sync iterator ``chunks`` to an ASGI server as they come.
+
+    Django reads a sync ``StreamingHttpResponse`` whole before sending it
+    under ASGI. Each chunk is pulled instead from the request's sync thread,
+    the one holding the queryset's cursor.
+    """
+    chunks = iter(chunks)
+    pull = sync_to_async(next)
+    while (chunk := await pull(chunks, None)) is not None:
+        yield chunk
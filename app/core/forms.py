@@ -1,6 +1,8 @@
 import json
 from django import forms
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.urls import reverse
 from .models import (
     Patient,
     Doctor,
@@ -357,3 +359,90 @@ class DoctorClinicAffiliationForm(forms.ModelForm):
                 raise forms.ValidationError("Invalid working schedule format")
 
         return schedule_data
+
+
+class LookupWidget(forms.Widget):
+    """A search box for a ``ModelChoiceField`` with too many rows to list.
+
+    Only the selected row is read to render it; ``lookup.js`` lists the
+    matches of what is typed from the ``url_name`` endpoint and submits the
+    ID of the picked one.
+    """
+
+    template_name = "core/widgets/lookup.html"
+
+    def __init__(self, url_name, attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        field = self.choices.field
+        try:
+            selected = field.to_python(value)
+        except ValidationError:
+            selected = None
+        context["widget"]["url"] = reverse(self.url_name)
+        context["widget"]["label"] = (
+            field.label_from_instance(selected) if selected else ""
+        )
+        return context
+
+
+def clinic_lookup():
+    return forms.ModelChoiceField(
+        queryset=Clinic.objects.all(),
+        required=False,
+        widget=LookupWidget("ajax_search_clinics"),
+    )
+
+
+def doctor_lookup():
+    return forms.ModelChoiceField(
+        queryset=Doctor.objects.select_related("user"),
+        required=False,
+        widget=LookupWidget("ajax_search_doctors"),
+    )
+
+
+class PatientFilterForm(forms.Form):
+    q = forms.CharField(
+        required=False,
+        label="Last name starts with",
+        widget=forms.TextInput(attrs={"class": "form-control"}),
+    )
+    clinic = clinic_lookup()
+    doctor = doctor_lookup()
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}),
+    )
+
+
+class DoctorFilterForm(forms.Form):
+    q = forms.CharField(
+        required=False,
+        label="Last name starts with",
+        widget=forms.TextInput(attrs={"class": "form-control"}),
+    )
+    clinic = clinic_lookup()
+
+
+class ClinicFilterForm(forms.Form):
+    q = forms.CharField(
+        required=False,
+        label="Name starts with",
+        widget=forms.TextInput(attrs={"class": "form-control"}),
+    )
+    doctor = doctor_lookup()
+
+
+class ExportFilterForm(forms.Form):
+    format = forms.ChoiceField(choices=[("csv", "CSV"), ("ndjson", "NDJSON")])
+    clinic = forms.ModelChoiceField(queryset=Clinic.objects.all(), required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
@@ -0,0 +1,89 @@
+"""Cached lookups for the country/state/city dropdowns.
+
+Geo data almost never changes, so lookups go through two cache layers: a
+per-process LRU and the Django cache backend shared by all workers. Every
+key embeds a version number kept in the cache backend; the signal handlers
+in ``core.signals`` replace it whenever a ``Country``, ``State`` or ``City``
+is saved or deleted, which invalidates both layers everywhere at once. The
+layers are filled from the primary database, since a lagging replica would
+leave stale data cached under the new version.
+"""
+
+import time
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import City, State
+
+VERSION_KEY = "geo:version"
+GEO_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def geo_version():
+    # A fresh timestamp (not 1) if the key was evicted, so LRU entries built
+    # from an older version can never be served again
+    return cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+
+
+def bump_geo_version():
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def _load_states(country_id):
+    return [
+        {"id": state_id, "name": name}
+        for state_id, name in State.objects.using(DEFAULT_DB_ALIAS)
+        .filter(country_id=country_id)
+        .order_by("name")
+        .values_list("id", "name")
+    ]
+
+
+def _load_cities(state_id):
+    return [
+        {"id": city_id, "name": name}
+        for city_id, name in City.objects.using(DEFAULT_DB_ALIAS)
+        .filter(state_id=state_id)
+        .order_by("name")
+        .values_list("id", "name")
+    ]
+
+
+def _load_tree(country_id):
+    # Two queries for the whole country: [[state_id, name, [[city_id, name]]]]
+    cities = {}
+    for state_id, city_id, name in (
+        City.objects.using(DEFAULT_DB_ALIAS)
+        .filter(state__country_id=country_id)
+        .order_by("name")
+        .values_list("state_id", "id", "name")
+    ):
+        cities.setdefault(state_id, []).append([city_id, name])
+    return [
+        [state_id, name, cities.get(state_id, [])]
+        for state_id, name in State.objects.using(DEFAULT_DB_ALIAS)
+        .filter(country_id=country_id)
+        .order_by("name")
+        .values_list("id", "name")
+    ]
+
+
+LOADERS = {"states": _load_states, "cities": _load_cities, "tree": _load_tree}
+
+
+@lru_cache(maxsize=2048)
+def _lookup(version, kind, parent_id):
+    key = f"geo:{version}:{kind}:{parent_id}"
+    data = cache.get(key)
+    if data is None:
+        data = LOADERS[kind](parent_id)
+        cache.set(key, data, GEO_CACHE_TIMEOUT)
+    return data
+
+
+def geo_lookup(kind, parent_id):
+    """Return ``(etag, data)`` for ``kind`` ("states", "cities" or "tree")."""
+    version = geo_version()
+    return f'"geo-{version}-{kind}-{parent_id}"', _lookup(version, kind, parent_id)
@@ -0,0 +1,60 @@
+"""Invitations for users created without a password.
+
+Imported and bulk-created users get an unusable password, so none is hashed
+on the way in. Their invitation links to ``invite-accept``, Django's
+password reset confirmation with its usual one-time token, where they pick
+one.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+User = get_user_model()
+
+INVITE_SUBJECT = "Your Dental Management Platform account"
+
+
+def pending_invites():
+    """Active users who have no password and never signed in."""
+    return User.objects.filter(
+        is_active=True,
+        last_login__isnull=True,
+        password__startswith=UNUSABLE_PASSWORD_PREFIX,
+    )
+
+
+def invite_url(user):
+    path = reverse(
+        "invite-accept",
+        kwargs={
+            "uidb64": urlsafe_base64_encode(force_bytes(user.pk)),
+            "token": default_token_generator.make_token(user),
+        },
+    )
+    return settings.SITE_URL.rstrip("/") + path
+
+
+def send_invites(users, batch_size=100):
+    """Email an invitation to each of ``users``, return how many were sent."""
+    connection = get_connection()
+    sent, messages = 0, []
+    for user in users:
+        body = render_to_string(
+            "core/invite_email.txt", {"user": user, "url": invite_url(user)}
+        )
+        messages.append(
+            EmailMessage(INVITE_SUBJECT, body, to=[user.email], connection=connection)
+        )
+        if len(messages) >= batch_size:
+            sent += connection.send_messages(messages) or 0
+            messages = []
+    if messages:
+        sent += connection.send_messages(messages) or 0
+    return sent
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.export import EXPORTS, FORMATS, stream_export
+from core.forms import ExportFilterForm
+from core.views import day_bounds
+
+
+class Command(BaseCommand):
+    help = "Stream the visit or appointment history as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=list(EXPORTS))
+        parser.add_argument("--format", choices=list(FORMATS), default="csv")
+        parser.add_argument("--clinic", type=int, help="Clinic id")
+        parser.add_argument("--date-from", help="YYYY-MM-DD, included")
+        parser.add_argument("--date-to", help="YYYY-MM-DD, included")
+        parser.add_argument(
+            "--output", help="File to write to instead of standard output"
+        )
+
+    def handle(self, *args, **options):
+        form = ExportFilterForm(
+            {
+                name: options[name]
+                for name in ("format", "clinic", "date_from", "date_to")
+                if options[name] is not None
+            }
+        )
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        filters = form.cleaned_data
+        start, end = day_bounds(filters["date_from"], filters["date_to"])
+        chunks = stream_export(
+            options["kind"],
+            filters["format"],
+            start=start,
+            end=end,
+            clinic=filters["clinic"],
+        )
+
+        if options["output"]:
+            with open(options["output"], "w", newline="") as file:
+                file.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
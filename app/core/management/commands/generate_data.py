@@ -0,0 +1,295 @@
+import random
+import time
+from datetime import date, timedelta
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from core.models import (
+    Appointment,
+    Clinic,
+    Doctor,
+    DoctorClinicAffiliation,
+    DoctorPatientAffiliation,
+    Patient,
+    Procedure,
+    Visit,
+)
+from core.availability import rebuild_availability
+from core.matching import invalidate_matching
+from core.stats import rebuild_stats
+
+User = get_user_model()
+
+FIRST_NAMES = [
+    "Ana", "Carlos", "Lucia", "Jorge", "Maria", "Luis", "Sofia", "Diego",
+    "Valeria", "Miguel", "Camila", "Jose", "Elena", "Pedro", "Paula", "Mateo",
+]  # fmt: skip
+LAST_NAMES = [
+    "Garcia", "Rodriguez", "Lopez", "Martinez", "Gonzalez", "Perez", "Sanchez",
+    "Ramirez", "Torres", "Flores", "Rivera", "Gomez", "Diaz", "Reyes", "Cruz",
+]  # fmt: skip
+PROCEDURES = [
+    ("Teeth Cleaning", 30),
+    ("Filling", 45),
+    ("Root Canal", 90),
+    ("Tooth Extraction", 60),
+    ("Crown", 90),
+    ("Whitening", 60),
+    ("Orthodontic Check", 30),
+    ("Implant Consultation", 60),
+]
+WEEKLY_SCHEDULES = [
+    {"days": [0, 1, 2, 3, 4], "start": "08:00", "end": "16:00"},
+    {"days": [0, 2, 4], "start": "09:00", "end": "18:00"},
+    {"days": [1, 3, 5], "start": "10:00", "end": "19:00"},
+]
+
+
+class Command(BaseCommand):
+    help = "Generate a seeded, realistic synthetic dataset with bulk inserts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--clinics", type=int, default=20)
+        parser.add_argument("--doctors", type=int, default=100)
+        parser.add_argument("--patients", type=int, default=10000)
+        parser.add_argument("--years", type=int, default=3, help="Visit history")
+        parser.add_argument(
+            "--visits-per-year", type=int, default=2, help="Per patient"
+        )
+        parser.add_argument(
+            "--appointments", type=int, default=1, help="Upcoming, per patient"
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--skip-availability",
+            action="store_true",
+            help="Do not materialize availability for the new affiliations",
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.tag = f"s{options['seed']}"
+        self.batch_size = options["batch_size"]
+        if User.objects.filter(username__startswith=f"{self.tag}-").exists():
+            raise CommandError(
+                f"Data for seed {options['seed']} already exists, use another --seed"
+            )
+
+        started = time.perf_counter()
+        # One shared unusable password: no hashing cost per generated user
+        self.password = make_password(None)
+        self.now = timezone.now()
+
+        with transaction.atomic():
+            procedures = self.create_procedures()
+            clinics = self.create_clinics(options["clinics"])
+            affiliations = self.create_doctors(options["doctors"], clinics, procedures)
+        rows = len(clinics) + 2 * options["doctors"] + len(affiliations)
+
+        for offset in range(0, options["patients"], self.batch_size):
+            count = min(self.batch_size, options["patients"] - offset)
+            with transaction.atomic():
+                rows += self.create_patients(
+                    offset,
+                    count,
+                    affiliations,
+                    procedures,
+                    options["years"],
+                    options["visits_per_year"],
+                    options["appointments"],
+                )
+            self.stdout.write(f"Patients {offset + count}/{options['patients']}")
+
+        if not options["skip_availability"]:
+            # bulk_create skips the signal that materializes availability
+            for affiliation in affiliations:
+                rebuild_availability(affiliation)
+
+        # Nor do the signals maintain the clinic and doctor stats
+        rebuild_stats(batch_size=self.batch_size)
+        # Nor the one dropping the cached procedure/clinic/doctor matches
+        invalidate_matching()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {rows} rows in {elapsed:.1f}s "
+                f"({rows / elapsed if elapsed else 0:.0f} rows/sec)"
+            )
+        )
+
+    def create_users(self, kind, start, count):
+        users = []
+        for index in range(start, start + count):
+            first_name = self.rng.choice(FIRST_NAMES)
+            last_name = self.rng.choice(LAST_NAMES)
+            username = f"{self.tag}-{kind}{index}"
+            users.append(
+                User(
+                    username=username,
+                    email=f"{username}@example.com",
+                    first_name=first_name,
+                    last_name=last_name,
+                    password=self.password,
+                )
+            )
+        return User.objects.bulk_create(users, batch_size=self.batch_size)
+
+    def create_procedures(self):
+        existing = {p.name: p for p in Procedure.objects.all()}
+        missing = [
+            Procedure(name=name, duration_minutes=minutes)
+            for name, minutes in PROCEDURES
+            if name not in existing
+        ]
+        Procedure.objects.bulk_create(missing)
+        return list(Procedure.objects.filter(name__in=[n for n, _ in PROCEDURES]))
+
+    def create_clinics(self, count):
+        return Clinic.objects.bulk_create(
+            [
+                Clinic(
+                    name=f"{self.rng.choice(LAST_NAMES)} Dental {self.tag}-{index}",
+                    address=f"{self.rng.randint(1, 9999)} Main St",
+                    phone_number=f"555-{self.rng.randint(0, 9999999):07d}",
+                )
+                for index in range(count)
+            ],
+            batch_size=self.batch_size,
+        )
+
+    def create_doctors(self, count, clinics, procedures):
+        users = self.create_users("doctor", 0, count)
+        doctors = Doctor.objects.bulk_create(
+            [
+                Doctor(
+                    user=user,
+                    npi=f"{self.tag}-{index:010d}",
+                    phone_number=f"555-{self.rng.randint(0, 9999999):07d}",
+                )
+                for index, user in enumerate(users)
+            ],
+            batch_size=self.batch_size,
+        )
+
+        specialties, affiliations = [], []
+        for doctor in doctors:
+            for procedure in self.rng.sample(procedures, self.rng.randint(2, 5)):
+                specialties.append(
+                    Doctor.specialties.through(doctor=doctor, procedure=procedure)
+                )
+            for clinic in self.rng.sample(clinics, min(len(clinics), 2)):
+                affiliations.append(
+                    DoctorClinicAffiliation(
+                        doctor=doctor,
+                        clinic=clinic,
+                        office_address=clinic.address,
+                        working_schedule=[self.rng.choice(WEEKLY_SCHEDULES)],
+                    )
+                )
+        Doctor.specialties.through.objects.bulk_create(
+            specialties, batch_size=self.batch_size
+        )
+        return DoctorClinicAffiliation.objects.bulk_create(
+            affiliations, batch_size=self.batch_size
+        )
+
+    def random_time(self, days_from, days_to):
+        day = self.now + timedelta(days=self.rng.randint(days_from, days_to))
+        return day.replace(
+            hour=self.rng.randint(8, 17), minute=0, second=0, microsecond=0
+        )
+
+    def create_patients(
+        self, offset, count, affiliations, procedures, years, per_year, upcoming
+    ):
+        users = self.create_users("patient", offset, count)
+        patients = Patient.objects.bulk_create(
+            [
+                Patient(
+                    user=user,
+                    date_of_birth=date(1940, 1, 1)
+                    + timedelta(days=self.rng.randint(0, 365 * 65)),
+                    address=f"{self.rng.randint(1, 9999)} Patient Ave",
+                    phone_number=f"555-{self.rng.randint(0, 9999999):07d}",
+                    ssn_last_four=f"{self.rng.randint(0, 9999):04d}",
+                    gender=self.rng.choice("MF"),
+                )
+                for user in users
+            ],
+            batch_size=self.batch_size,
+        )
+
+        visits, doctor_patients = [], []
+        for patient in patients:
+            seen = set()
+            for _ in range(years * per_year):
+                affiliation = self.rng.choice(affiliations)
+                visits.append(
+                    Visit(
+                        patient=patient,
+                        doctor_id=affiliation.doctor_id,
+                        clinic_id=affiliation.clinic_id,
+                        visit_date=self.random_time(-365 * years, -1),
+                        doctor_notes="Synthetic visit notes. " * 5,
+                    )
+                )
+                seen.add(affiliation.doctor_id)
+            doctor_patients.extend(
+                DoctorPatientAffiliation(
+                    doctor_id=doctor_id,
+                    patient=patient,
+                    visit_date=self.now.date(),
+                )
+                for doctor_id in seen
+            )
+        Visit.objects.bulk_create(visits, batch_size=self.batch_size)
+        DoctorPatientAffiliation.objects.bulk_create(
+            doctor_patients, batch_size=self.batch_size
+        )
+        procedures_done = [
+            Visit.procedures_done.through(
+                visit=visit, procedure=self.rng.choice(procedures)
+            )
+            for visit in visits
+        ]
+        Visit.procedures_done.through.objects.bulk_create(
+            procedures_done, batch_size=self.batch_size
+        )
+
+        # Whole-hour starts that are unique per doctor, as the booking
+        # constraint requires
+        taken = set(
+            Appointment.objects.filter(appointment_date__gte=self.now).values_list(
+                "doctor_id", "appointment_date"
+            )
+        )
+        appointments = []
+        for patient in patients:
+            for _ in range(upcoming):
+                affiliation = self.rng.choice(affiliations)
+                start = self.random_time(1, 180)
+                if (affiliation.doctor_id, start) in taken:
+                    continue
+                taken.add((affiliation.doctor_id, start))
+                appointments.append(
+                    Appointment(
+                        patient=patient,
+                        doctor_id=affiliation.doctor_id,
+                        clinic_id=affiliation.clinic_id,
+                        procedure=self.rng.choice(procedures),
+                        appointment_date=start,
+                    )
+                )
+        Appointment.objects.bulk_create(appointments, batch_size=self.batch_size)
+
+        return (
+            2 * len(patients)
+            + len(visits)
+            + len(doctor_patients)
+            + len(procedures_done)
+            + len(appointments)
+        )
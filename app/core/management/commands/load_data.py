@@ -1,17 +1,99 @@
 import json
+import time
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.geo import bump_geo_version
 from core.models import Country, State, City
 
 
+def iter_json_array(file, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array one at a time.
+
+    Only the element being decoded (one country with its states and cities)
+    is held in memory, instead of the whole document as with ``json.load``.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = eof = False
+    # After a failed decode, wait until the buffer doubles before retrying so
+    # a large element is re-parsed O(log n) times rather than once per chunk
+    wanted = 0
+    while True:
+        buffer = buffer.lstrip()
+        if len(buffer) >= wanted or eof:
+            if not started and buffer:
+                if buffer[0] != "[":
+                    raise ValueError("Expected a JSON array")
+                buffer, started = buffer[1:], True
+                continue
+            if started and buffer[:1] == ",":
+                buffer = buffer[1:]
+                continue
+            if started and buffer[:1] == "]":
+                return
+            if started and buffer:
+                try:
+                    element, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    wanted = len(buffer) * 2
+                else:
+                    yield element
+                    buffer, wanted = buffer[end:], 0
+                    continue
+            if eof:
+                raise ValueError("Unterminated JSON array")
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
 class Command(BaseCommand):
     help = "Load countries, states, and cities data from JSON file"
 
-    def handle(self, *args, **kwargs):
-        with open("static/geo_data.json", "r") as file:
-            data = json.load(file)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file",
+            default="static/geo_data.json",
+            help="JSON array of countries with nested states and cities",
+        )
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Insert missing rows with bulk_create instead of one at a time",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per bulk_create call in bulk mode",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with open(options["file"], "r") as file:
+            countries = iter_json_array(file)
+            if options["bulk"]:
+                rows, created = self.load_bulk(countries, options["batch_size"])
+            else:
+                rows, created = self.load_rows(countries)
+
+        # Bulk inserts skip the save signals, so invalidate the geo cache here
+        bump_geo_version()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {rows} rows ({created} created) in {elapsed:.1f}s, "
+                f"{rows / elapsed if elapsed else 0:.0f} rows/sec"
+            )
+        )
 
-        for country_data in data:
+    def load_rows(self, countries):
+        rows = created_rows = 0
+        for country_data in countries:
             country, created = Country.objects.get_or_create(name=country_data["name"])
+            rows, created_rows = rows + 1, created_rows + created
             print(
                 f"Country {country.name} {'created' if created else 'already exists'}"
             )
@@ -20,6 +102,7 @@ class Command(BaseCommand):
                 state, created = State.objects.get_or_create(
                     country=country, name=state_data["name"]
                 )
+                rows, created_rows = rows + 1, created_rows + created
                 print(
                     f"  State {state.name} {'created' if created else 'already exists'}"
                 )
@@ -28,6 +111,74 @@ class Command(BaseCommand):
                     city, created = City.objects.get_or_create(
                         state=state, name=city_data["name"]
                     )
+                    rows, created_rows = rows + 1, created_rows + created
                     print(
                         f"    City {city.name} {'created' if created else 'already exists'}"
                     )
+        return rows, created_rows
+
+    def load_bulk(self, countries, batch_size):
+        """Diff each country against the database and bulk insert what is new.
+
+        Existing rows are loaded one country at a time, so memory stays
+        bounded by the largest country rather than by the whole dataset.
+        """
+        existing_countries = dict(Country.objects.values_list("name", "id"))
+        rows = created_rows = 0
+
+        for country_data in countries:
+            states_data = country_data.get("states", [])
+            rows += 1 + len(states_data)
+            rows += sum(len(state.get("cities", [])) for state in states_data)
+
+            with transaction.atomic():
+                country_id = existing_countries.get(country_data["name"])
+                if country_id is None:
+                    country_id = Country.objects.create(name=country_data["name"]).id
+                    existing_countries[country_data["name"]] = country_id
+                    created_rows += 1
+
+                states = dict(
+                    State.objects.filter(country_id=country_id).values_list(
+                        "name", "id"
+                    )
+                )
+                new_states = {
+                    state["name"]
+                    for state in states_data
+                    if state["name"] not in states
+                }
+                State.objects.bulk_create(
+                    [State(country_id=country_id, name=name) for name in new_states],
+                    batch_size=batch_size,
+                )
+                created_rows += len(new_states)
+                if new_states:
+                    # Not every backend returns primary keys from bulk_create
+                    states = dict(
+                        State.objects.filter(country_id=country_id).values_list(
+                            "name", "id"
+                        )
+                    )
+
+                cities = set(
+                    City.objects.filter(state__country_id=country_id).values_list(
+                        "state_id", "name"
+                    )
+                )
+                new_cities = []
+                for state_data in states_data:
+                    state_id = states[state_data["name"]]
+                    for city_data in state_data.get("cities", []):
+                        key = (state_id, city_data["name"])
+                        if key not in cities:
+                            cities.add(key)
+                            new_cities.append(City(state_id=state_id, name=key[1]))
+                City.objects.bulk_create(new_cities, batch_size=batch_size)
+                created_rows += len(new_cities)
+
+            self.stdout.write(
+                f"Country {country_data['name']}: {len(new_states)} states, "
+                f"{len(new_cities)} cities created"
+            )
+        return rows, created_rows
@@ -0,0 +1,36 @@
+import json
+from django.core.management.base import BaseCommand
+from core.profiling import reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = "Show the per-URL numbers recorded by ProfilingMiddleware"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Dump raw JSON")
+        parser.add_argument(
+            "--reset", action="store_true", help="Clear the numbers afterwards"
+        )
+
+    def handle(self, *args, **options):
+        report = stats()
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(
+                f"{'url name':32} {'requests':>8} {'mean ms':>8} {'p50 ms':>7} "
+                f"{'p95 ms':>7} {'db ms':>7} {'tpl ms':>7} {'queries':>7} {'dups':>6}"
+            )
+            for row in report:
+                self.stdout.write(
+                    f"{row['name']:32} {row['requests']:>8} {row['mean_ms']:>8.1f} "
+                    f"{self.bound(row['p50_ms']):>7} {self.bound(row['p95_ms']):>7} "
+                    f"{row['mean_db_ms']:>7.1f} {row['mean_template_ms']:>7.1f} "
+                    f"{row['mean_queries']:>7.1f} {row['duplicate_queries']:>6}"
+                )
+        if options["reset"]:
+            reset_stats()
+
+    def bound(self, value):
+        # Percentiles are histogram bucket bounds
+        return f"<={value}" if value is not None else "inf"
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from core.availability import extend_availability, rebuild_availability
+from core.models import DoctorClinicAffiliation
+
+
+class Command(BaseCommand):
+    help = "Roll the materialized availability windows forward (run daily)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recompute the whole horizon instead of only the missing days",
+        )
+        parser.add_argument("--doctor", type=int, help="Only this doctor id")
+        parser.add_argument("--clinic", type=int, help="Only this clinic id")
+
+    def handle(self, *args, **options):
+        affiliations = DoctorClinicAffiliation.objects.order_by("pk")
+        if options["doctor"]:
+            affiliations = affiliations.filter(doctor_id=options["doctor"])
+        if options["clinic"]:
+            affiliations = affiliations.filter(clinic_id=options["clinic"])
+
+        count = 0
+        for affiliation in affiliations.iterator():
+            if options["full"]:
+                rebuild_availability(affiliation)
+            else:
+                extend_availability(affiliation)
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Availability rebuilt for {count} affiliations")
+        )
@@ -0,0 +1,36 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from core.stats import STATS, rebuild_stats, stats_mismatches
+
+
+class Command(BaseCommand):
+    help = "Rebuild the clinic and doctor stats tables and verify them (run daily)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the stored stats with the live aggregates",
+        )
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        if not options["check"]:
+            started = time.perf_counter()
+            rows = rebuild_stats(now, options["batch_size"])
+            self.stdout.write(
+                f"Rebuilt {rows} stats rows in {time.perf_counter() - started:.1f}s"
+            )
+
+        mismatches = 0
+        for model in STATS:
+            for pk, counter, stored, live in stats_mismatches(model, now):
+                mismatches += 1
+                self.stderr.write(
+                    f"{model.__name__} {pk}: {counter} is {stored}, expected {live}"
+                )
+        if mismatches:
+            raise CommandError(f"{mismatches} stats counters are out of date")
+        self.stdout.write(self.style.SUCCESS("Stats match the live aggregates"))
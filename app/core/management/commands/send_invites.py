@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from core.invites import pending_invites, send_invites
+
+
+class Command(BaseCommand):
+    help = "Email a set-your-password link to users without a password"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--email",
+            action="append",
+            help="Only invite this user (repeatable); default: every user "
+            "with no password who never signed in",
+        )
+
+    def handle(self, *args, **options):
+        users = pending_invites()
+        if options["email"]:
+            users = users.filter(email__in=options["email"])
+        sent = send_invites(users.iterator())
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} invitations"))
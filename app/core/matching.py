@@ -0,0 +1,108 @@
+"""Which clinics and doctors can perform which procedure.
+
+Booking pages ask this on every change of a dropdown. The answer is the set
+of ``(procedure, clinic, doctor)`` triples given by the doctors' specialties
+and clinic affiliations, which is small enough to precompute whole. It is
+kept in the cache backend shared by all workers under a version number, and
+each process arranges it into a ``MatchingIndex`` of sets kept in an LRU, as
+in ``core.geo``. The signal handlers in ``core.signals`` replace the version
+whenever a specialty or an affiliation changes, which invalidates both
+layers everywhere at once.
+"""
+
+import time
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import DoctorClinicAffiliation
+
+VERSION_KEY = "matching:version"
+MATCHING_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def matching_version():
+    # A fresh timestamp (not 1) if the key was evicted, see geo_version()
+    return cache.get_or_set(VERSION_KEY, time.time_ns, timeout=None)
+
+
+def bump_matching_version():
+    cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_matching():
+    """Drop the triples after a change to specialties or affiliations."""
+    bump_matching_version()
+    # Again once committed, in case another worker cached the old triples
+    # between the change and the commit
+    transaction.on_commit(bump_matching_version)
+
+
+def _load_triples():
+    # One join of the affiliations with the doctors' specialties, read from
+    # the primary: triples from a lagging replica would stay cached under
+    # the new version
+    return list(
+        DoctorClinicAffiliation.objects.using(DEFAULT_DB_ALIAS)
+        .filter(doctor__specialties__isnull=False)
+        .order_by()
+        .values_list("doctor__specialties", "clinic_id", "doctor_id")
+        .distinct()
+    )
+
+
+def matching_triples(version=None):
+    """Return every ``(procedure_id, clinic_id, doctor_id)`` bookable triple."""
+    key = f"matching:{version or matching_version()}:triples"
+    triples = cache.get(key)
+    if triples is None:
+        triples = _load_triples()
+        cache.set(key, triples, MATCHING_CACHE_TIMEOUT)
+    return triples
+
+
+class MatchingIndex:
+    """The bookable triples as ``{procedure_id: {clinic_id: doctor_ids}}``.
+
+    Doctor ids are frozensets, so lookups are dict reads and set tests.
+    """
+
+    def __init__(self, triples):
+        clinics = {}
+        for procedure, clinic, doctor in triples:
+            clinics.setdefault(procedure, {}).setdefault(clinic, set()).add(doctor)
+        self.clinics = {
+            procedure: {
+                clinic: frozenset(doctors) for clinic, doctors in by_clinic.items()
+            }
+            for procedure, by_clinic in clinics.items()
+        }
+
+    def options(self, procedure_id, clinic_id=None, doctor_id=None):
+        clinics = self.clinics.get(procedure_id, {})
+        if clinic_id is not None:
+            clinics = {clinic_id: clinics[clinic_id]} if clinic_id in clinics else {}
+        if doctor_id is not None:
+            singleton = frozenset([doctor_id])
+            return {
+                clinic: singleton
+                for clinic, doctors in clinics.items()
+                if doctor_id in doctors
+            }
+        return dict(clinics)
+
+
+@lru_cache(maxsize=4)
+def _index(version):
+    return MatchingIndex(matching_triples(version))
+
+
+def matching_index():
+    """Return this process's ``MatchingIndex`` of the current triples."""
+    return _index(matching_version())
+
+
+def matching_options(procedure_id, clinic_id=None, doctor_id=None):
+    """Return ``{clinic_id: frozenset(doctor_ids)}`` able to do ``procedure_id``."""
+    return matching_index().options(procedure_id, clinic_id, doctor_id)
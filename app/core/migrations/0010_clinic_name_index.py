@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_alter_city_options_alter_country_options"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="clinic",
+            name="name",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
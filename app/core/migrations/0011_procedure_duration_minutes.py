@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 05:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_clinic_name_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="procedure",
+            name="duration_minutes",
+            field=models.PositiveIntegerField(default=60),
+        ),
+    ]
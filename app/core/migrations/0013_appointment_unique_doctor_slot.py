@@ -0,0 +1,45 @@
+# Generated by Django 5.1.1 on 2026-10-18 05:11
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_slots(apps, schema_editor):
+    # Refuse to guess which of two bookings with the same doctor and start to
+    # drop; they have to be rescheduled or removed by hand first
+    Appointment = apps.get_model("core", "Appointment")
+    duplicates = list(
+        Appointment.objects.using(schema_editor.connection.alias)
+        .values("doctor_id", "appointment_date")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by("doctor_id", "appointment_date")[:10]
+    )
+    if duplicates:
+        slots = ", ".join(
+            f"doctor {row['doctor_id']} at {row['appointment_date'].isoformat()}"
+            f" ({row['count']} appointments)"
+            for row in duplicates
+        )
+        raise ValueError(
+            "Cannot add the unique_doctor_slot constraint, some doctors have "
+            f"several appointments with the same start: {slots}. Reschedule or "
+            "delete the extra appointments and migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_availabilityslot"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="appointment",
+            constraint=models.UniqueConstraint(
+                fields=("doctor", "appointment_date"), name="unique_doctor_slot"
+            ),
+        ),
+    ]
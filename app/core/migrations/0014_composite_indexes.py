@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-18 05:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_appointment_unique_doctor_slot"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["patient", "appointment_date"],
+                name="appointment_patient_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["doctor", "clinic", "appointment_date"],
+                name="appointment_doctor_clinic_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="city",
+            index=models.Index(fields=["state", "name"], name="city_state_name_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="state",
+            index=models.Index(
+                fields=["country", "name"], name="state_country_name_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="visit",
+            index=models.Index(
+                fields=["patient", "-visit_date"], name="visit_patient_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,158 @@
+# Generated by Django 5.1.1 on 2026-10-18 05:32
+
+from datetime import datetime, time, timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def fill_stats(apps, schema_editor):
+    # The counters of core.stats.live_counters, with the models as of this
+    # migration; later changes are applied by the signal handlers
+    db = schema_editor.connection.alias
+    Visit = apps.get_model("core", "Visit")
+    Appointment = apps.get_model("core", "Appointment")
+    DoctorClinicAffiliation = apps.get_model("core", "DoctorClinicAffiliation")
+    DoctorPatientAffiliation = apps.get_model("core", "DoctorPatientAffiliation")
+    now = timezone.now()
+    month = timezone.localdate(now).replace(day=1)
+    start = timezone.make_aware(datetime.combine(month, time.min))
+    end = timezone.make_aware(
+        datetime.combine((month + timedelta(days=32)).replace(day=1), time.min)
+    )
+
+    def count(rows, key, field, distinct=True):
+        counts = (
+            rows.filter(**{key: OuterRef("pk")})
+            .order_by()
+            .values(key)
+            .annotate(count=Count(field, distinct=distinct))
+            .values("count")
+        )
+        return Coalesce(Subquery(counts), 0)
+
+    def patients(key, sources):
+        # Each source only counts the patients none of the earlier ones has
+        total = None
+        for index, model in enumerate(sources):
+            rows = model.objects.all()
+            for earlier in sources[:index]:
+                rows = rows.filter(
+                    ~Exists(
+                        earlier.objects.filter(
+                            patient=OuterRef("patient"), **{key: OuterRef(key)}
+                        )
+                    )
+                )
+            total = (
+                count(rows, key, "patient")
+                if total is None
+                else total + count(rows, key, "patient")
+            )
+        return total
+
+    for owner, stats, key, affiliated, sources in [
+        ("Clinic", "ClinicStats", "clinic", "num_doctors", (Visit, Appointment)),
+        (
+            "Doctor",
+            "DoctorStats",
+            "doctor",
+            "num_clinics",
+            (Visit, Appointment, DoctorPatientAffiliation),
+        ),
+    ]:
+        counters = {
+            affiliated: count(
+                DoctorClinicAffiliation.objects.all(),
+                key,
+                "clinic" if key == "doctor" else "doctor",
+            ),
+            "num_patients": patients(key, sources),
+            "visits_this_month": count(
+                Visit.objects.filter(visit_date__gte=start, visit_date__lt=end),
+                key,
+                "pk",
+                distinct=False,
+            ),
+            "upcoming_appointments": count(
+                Appointment.objects.filter(appointment_date__gte=now),
+                key,
+                "pk",
+                distinct=False,
+            ),
+        }
+        rows = (
+            apps.get_model("core", owner)
+            .objects.using(db)
+            .annotate(**counters)
+            .values("pk", *counters)
+        )
+        StatsModel = apps.get_model("core", stats)
+        StatsModel.objects.using(db).bulk_create(
+            (
+                StatsModel(
+                    **{f"{key}_id": row.pop("pk")},
+                    **row,
+                    month=month,
+                    updated_at=now,
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClinicStats",
+            fields=[
+                (
+                    "clinic",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="core.clinic",
+                    ),
+                ),
+                ("num_doctors", models.PositiveIntegerField(default=0)),
+                ("num_patients", models.PositiveIntegerField(default=0)),
+                ("visits_this_month", models.PositiveIntegerField(default=0)),
+                ("upcoming_appointments", models.PositiveIntegerField(default=0)),
+                ("month", models.DateField()),
+                ("updated_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="DoctorStats",
+            fields=[
+                (
+                    "doctor",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="core.doctor",
+                    ),
+                ),
+                ("num_clinics", models.PositiveIntegerField(default=0)),
+                ("num_patients", models.PositiveIntegerField(default=0)),
+                ("visits_this_month", models.PositiveIntegerField(default=0)),
+                ("upcoming_appointments", models.PositiveIntegerField(default=0)),
+                ("month", models.DateField()),
+                ("updated_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.1 on 2026-10-18 06:38
+
+import core.search
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0015_clinicstats_doctorstats"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="clinic",
+            index=core.search.PrefixIndex(
+                django.db.models.functions.text.Lower("name"),
+                name="clinic_name_lower_idx",
+            ),
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.conf import settings
 from django.db import models
+from django.db.models.functions import Lower
+
+from .search import PrefixIndex
 
 
 class Country(models.Model):
@@ -21,6 +24,11 @@ class State(models.Model):
     def __str__(self):
         return self.name
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["country", "name"], name="state_country_name_idx")
+        ]
+
 
 class City(models.Model):
     state = models.ForeignKey(State, on_delete=models.CASCADE, related_name="cities")
@@ -31,23 +39,30 @@ class City(models.Model):
 
     class Meta:
         verbose_name_plural = "Cities"
+        indexes = [models.Index(fields=["state", "name"], name="city_state_name_idx")]
 
 
 class Procedure(models.Model):
+    DEFAULT_DURATION_MINUTES = 60
+
     name = models.CharField(max_length=100)
+    duration_minutes = models.PositiveIntegerField(default=DEFAULT_DURATION_MINUTES)
 
     def __str__(self):
         return self.name
 
 
 class Clinic(models.Model):
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, db_index=True)
     address = models.CharField(max_length=255)
     phone_number = models.CharField(max_length=15)
     country = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True)
     state = models.ForeignKey(State, on_delete=models.SET_NULL, null=True)
     city = models.ForeignKey(City, on_delete=models.SET_NULL, null=True)
 
+    class Meta:
+        indexes = [PrefixIndex(Lower("name"), name="clinic_name_lower_idx")]
+
     def __str__(self):
         return self.name
 
@@ -84,6 +99,13 @@ class Visit(models.Model):
     procedures_done = models.ManyToManyField(Procedure)
     doctor_notes = models.TextField()
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["patient", "-visit_date"], name="visit_patient_date_idx"
+            )
+        ]
+
     def __str__(self):
         return f"Visit by {self.patient.user.get_full_name()} on {self.visit_date}"
 
@@ -96,6 +118,23 @@ class Appointment(models.Model):
     appointment_date = models.DateTimeField()
     booked_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["doctor", "appointment_date"], name="unique_doctor_slot"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["patient", "appointment_date"],
+                name="appointment_patient_date_idx",
+            ),
+            models.Index(
+                fields=["doctor", "clinic", "appointment_date"],
+                name="appointment_doctor_clinic_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Appointment on {self.appointment_date} with {self.doctor.user.get_full_name()}"
 
@@ -105,6 +144,8 @@ class DoctorClinicAffiliation(models.Model):
     clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE)
     office_address = models.CharField(max_length=255)
     working_schedule = models.JSONField()
+    # Free windows are stored in AvailabilitySlot up to (excluding) this date
+    availability_until = models.DateField(null=True, blank=True, editable=False)
 
     class Meta:
         constraints = [
@@ -117,6 +158,30 @@ class DoctorClinicAffiliation(models.Model):
         return f"{self.doctor.name} - {self.clinic.name}"
 
 
+class AvailabilitySlot(models.Model):
+    """Materialized free window of a doctor in a clinic on a given day."""
+
+    affiliation = models.ForeignKey(
+        DoctorClinicAffiliation,
+        on_delete=models.CASCADE,
+        related_name="availability_slots",
+    )
+    date = models.DateField()
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["affiliation", "date", "start"],
+                name="availability_range_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.affiliation_id}: {self.start} - {self.end}"
+
+
 class DoctorPatientAffiliation(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
@@ -126,3 +191,38 @@ class DoctorPatientAffiliation(models.Model):
         return (
             f"{self.doctor.user.get_full_name()} - {self.patient.user.get_full_name()}"
         )
+
+
+class ClinicStats(models.Model):
+    """Dashboard counters of a clinic, kept up to date by ``core.signals``."""
+
+    clinic = models.OneToOneField(
+        Clinic, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    num_doctors = models.PositiveIntegerField(default=0)
+    num_patients = models.PositiveIntegerField(default=0)
+    visits_this_month = models.PositiveIntegerField(default=0)
+    upcoming_appointments = models.PositiveIntegerField(default=0)
+    # Month and time the time-dependent counters were computed for
+    month = models.DateField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Stats of {self.clinic_id}"
+
+
+class DoctorStats(models.Model):
+    """Dashboard counters of a doctor, kept up to date by ``core.signals``."""
+
+    doctor = models.OneToOneField(
+        Doctor, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    num_clinics = models.PositiveIntegerField(default=0)
+    num_patients = models.PositiveIntegerField(default=0)
+    visits_this_month = models.PositiveIntegerField(default=0)
+    upcoming_appointments = models.PositiveIntegerField(default=0)
+    month = models.DateField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Stats of {self.doctor_id}"
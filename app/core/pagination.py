@@ -0,0 +1,175 @@
+import base64
+import json
+from datetime import datetime, time
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes and times to milliseconds, which would
+    # skip or repeat rows less than a millisecond apart around a page break
+    def default(self, o):
+        if isinstance(o, (datetime, time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, direction="next"):
+    payload = json.dumps({"d": direction, "v": values}, cls=CursorEncoder)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction, values = payload["d"], payload["v"]
+    except (ValueError, TypeError, KeyError):
+        raise Http404("Invalid cursor")
+    if direction not in ("next", "previous") or not isinstance(values, list):
+        raise Http404("Invalid cursor")
+    return direction, values
+
+
+def _model_field(model, path):
+    field = None
+    for part in path.split("__"):
+        field = model._meta.pk if part == "pk" else model._meta.get_field(part)
+        model = field.related_model or model
+    return field
+
+
+def cursor_values(model, fields, values):
+    """Convert the decoded ``values`` to the types of ``fields`` of ``model``.
+
+    Cursors come from the client, so a value that does not fit its field
+    raises ``Http404`` rather than failing in the query.
+    """
+    if len(values) != len(fields):
+        raise Http404("Invalid cursor")
+    converted = []
+    for path, value in zip(fields, values):
+        field = _model_field(model, path)
+        try:
+            if value is None:
+                raise ValidationError("Cursor values cannot be null.")
+            value = field.to_python(value)
+            field.run_validators(value)
+        except (ValidationError, TypeError, ValueError):
+            raise Http404("Invalid cursor")
+        converted.append(value)
+    return converted
+
+
+def keyset_filter(fields, values, direction="next"):
+    """Build the row-value comparison ``(f1, f2, ...) > (v1, v2, ...)``.
+
+    The comparison is expanded into ``f1 > v1 OR (f1 = v1 AND f2 > v2) ...`` so
+    it works on every backend and can still use a composite index on the
+    ordering columns.
+    """
+    lookup = "gt" if direction == "next" else "lt"
+    clauses = []
+    for position, field in enumerate(fields):
+        equal = {fields[i]: values[i] for i in range(position)}
+        clauses.append(Q(**equal, **{f"{field}__{lookup}": values[position]}))
+    return reduce(or_, clauses)
+
+
+def resolve_field(obj, field):
+    if field == "pk":
+        return obj.pk
+    for part in field.split("__"):
+        obj = getattr(obj, part)
+    return obj
+
+
+class KeysetPage:
+    """Page of results addressed by cursors instead of ``OFFSET``."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginationMixin:
+    """Cursor pagination for ``ListView`` subclasses.
+
+    Rows are ordered by ``keyset_fields`` (which must end with a unique column)
+    and each page starts strictly after the last row of the previous one, so
+    the cost of a page does not depend on how deep into the list it is and
+    rows inserted meanwhile never shift or duplicate entries.
+    """
+
+    paginate_by = 50
+    keyset_fields = ("pk",)
+    cursor_kwarg = "cursor"
+
+    def paginate_queryset(self, queryset, page_size):
+        fields = list(self.keyset_fields)
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        direction, values = decode_cursor(cursor) if cursor else ("next", None)
+        if values is not None:
+            values = cursor_values(queryset.model, fields, values)
+
+        if direction == "next":
+            queryset = queryset.order_by(*fields)
+        else:
+            queryset = queryset.order_by(*[f"-{field}" for field in fields])
+        if values is not None:
+            queryset = queryset.filter(keyset_filter(fields, values, direction))
+
+        rows = list(queryset[: page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if direction == "previous":
+            rows.reverse()
+
+        def cursor_for(obj, towards):
+            return encode_cursor([resolve_field(obj, f) for f in fields], towards)
+
+        has_next = has_more if direction == "next" else values is not None
+        has_previous = values is not None if direction == "next" else has_more
+        page = KeysetPage(
+            rows,
+            next_cursor=cursor_for(rows[-1], "next") if rows and has_next else None,
+            previous_cursor=(
+                cursor_for(rows[0], "previous") if rows and has_previous else None
+            ),
+        )
+        return (None, page, rows, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get("page_obj")
+        if page is not None:
+            params = self.request.GET.copy()
+            for name, value in (
+                ("next_query", page.next_cursor),
+                ("previous_query", page.previous_cursor),
+            ):
+                if value is not None:
+                    params[self.cursor_kwarg] = value
+                    context[name] = params.urlencode()
+        return context
@@ -0,0 +1,323 @@
+"""Opt-in per-request profiling.
+
+When the ``PROFILING`` environment variable is ``True``, ``ProfilingMiddleware``
+is added to ``MIDDLEWARE`` and ``ProfiledTemplates`` replaces the Django
+template backend. For every request the middleware records the number of
+queries, the time spent in the database and rendering templates, the total
+latency, and the queries that ran several times with the same SQL (the
+signature of an N+1 loop). Queries are counted by an execute wrapper added to
+every connection, in whichever thread runs them (under ASGI, the threads of
+``sync_to_async``), and attributed to the request through a context
+variable. The numbers are sent back in a ``Server-Timing``
+header, which browser devtools display next to the request::
+
+    Server-Timing: db;dur=12.5;desc="14 queries", dup;desc="10 duplicate queries",
+                   tpl;dur=8.1, total;dur=31.0
+
+and aggregated per URL name into histograms. Each worker process adds up
+its requests in memory and writes its totals to the Django cache at most
+every ``PROFILING_FLUSH_SECONDS``, so the numbers of every worker add up
+when the cache backend is shared. They are read with the
+``profiling_report`` command or the staff-only ``/profiling/`` endpoint.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Same SQL run this many times in one request is reported as an N+1
+DUPLICATE_THRESHOLD = getattr(settings, "PROFILING_DUPLICATE_THRESHOLD", 3)
+FLUSH_SECONDS = getattr(settings, "PROFILING_FLUSH_SECONDS", 10)
+
+WORKERS_KEY = "profiling:workers"
+GENERATION_KEY = "profiling:generation"
+STATS_TIMEOUT = 60 * 60 * 24 * 7
+
+_current = ContextVar("profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self._rendering = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper; params vary between the queries of an N+1
+        # loop while the SQL stays the same
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries[sql] += 1
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    def duplicates(self):
+        """Return ``{sql: count}`` of the queries repeated too many times."""
+        return {
+            sql: count
+            for sql, count in self.queries.items()
+            if count >= DUPLICATE_THRESHOLD
+        }
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        profile = _current.get()
+        if profile is None or profile._rendering:
+            # Nested renders are already counted by the outer one
+            return super().render(context, request)
+        profile._rendering += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            profile.template_time += time.perf_counter() - started
+            profile._rendering -= 1
+
+
+class ProfiledTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for the middleware."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return ProfiledTemplate(super().get_template(template_name).template, self)
+
+
+def _bucket(bounds, value):
+    return bisect_left(bounds, value)
+
+
+class WorkerStats:
+    """The totals of this process, per URL name and field."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def start(self):
+        self.pid = os.getpid()
+        self.key = f"profiling:worker:{uuid.uuid4().hex}"
+        self.totals = defaultdict(Counter)
+        self.generation = cache.get(GENERATION_KEY)
+        self.flushed = time.monotonic()
+
+    def add(self, name, values):
+        with self.lock:
+            if self.pid != os.getpid():
+                # A new worker, or a fork of one
+                self.start()
+            self.totals[name].update(values)
+            if time.monotonic() - self.flushed >= FLUSH_SECONDS:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                self._flush()
+
+    def _flush(self):
+        # Only this process writes its key, so its totals replace the
+        # previous ones without a race between workers
+        shared = cache.get_many([WORKERS_KEY, GENERATION_KEY])
+        if shared.get(GENERATION_KEY) != self.generation:
+            # The numbers were reset since the last flush
+            self.generation = shared.get(GENERATION_KEY)
+            self.totals.clear()
+        workers = shared.get(WORKERS_KEY) or []
+        if self.key not in workers:
+            # A race between workers may drop a key until its next flush
+            cache.set(WORKERS_KEY, sorted({*workers, self.key}), None)
+        totals = {name: dict(values) for name, values in self.totals.items()}
+        cache.set(self.key, totals, STATS_TIMEOUT)
+        self.flushed = time.monotonic()
+
+    def reset(self):
+        with self.lock:
+            cache.delete_many(cache.get(WORKERS_KEY) or ())
+            cache.delete(WORKERS_KEY)
+            generation = time.time_ns()
+            cache.set(GENERATION_KEY, generation, None)
+            if self.pid == os.getpid():
+                self.totals.clear()
+                self.generation = generation
+
+
+_worker = WorkerStats()
+
+
+def record(name, total, profile, duplicates):
+    """Add one request to the histograms of the URL ``name``."""
+    _worker.add(
+        name,
+        {
+            "requests": 1,
+            "total_us": int(total * 1e6),
+            "db_us": int(profile.db_time * 1e6),
+            "template_us": int(profile.template_time * 1e6),
+            "queries": profile.query_count,
+            "duplicates": sum(duplicates.values()),
+            f"latency:{_bucket(LATENCY_BUCKETS_MS, total * 1000)}": 1,
+            f"queries:{_bucket(QUERY_BUCKETS, profile.query_count)}": 1,
+        },
+    )
+
+
+def _percentile(histogram, bounds, fraction):
+    """Upper bound of the bucket holding the given fraction of requests."""
+    total = sum(histogram)
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if total and seen >= fraction * total:
+            return bounds[index] if index < len(bounds) else None
+    return None
+
+
+def stats():
+    """Return the aggregated numbers of every URL name, slowest first."""
+    _worker.flush()
+    totals = defaultdict(Counter)
+    for worker in cache.get_many(cache.get(WORKERS_KEY) or ()).values():
+        for name, values in worker.items():
+            totals[name].update(values)
+    report = []
+    for name, values in sorted(totals.items()):
+        requests = values.get("requests")
+        if not requests:
+            continue
+        latency = [
+            values.get(f"latency:{i}", 0) for i in range(len(LATENCY_BUCKETS_MS) + 1)
+        ]
+        queries = [values.get(f"queries:{i}", 0) for i in range(len(QUERY_BUCKETS) + 1)]
+        report.append(
+            {
+                "name": name,
+                "requests": requests,
+                "mean_ms": values.get("total_us", 0) / requests / 1000,
+                "mean_db_ms": values.get("db_us", 0) / requests / 1000,
+                "mean_template_ms": values.get("template_us", 0) / requests / 1000,
+                "mean_queries": values.get("queries", 0) / requests,
+                "duplicate_queries": values.get("duplicates", 0),
+                "p50_ms": _percentile(latency, LATENCY_BUCKETS_MS, 0.5),
+                "p95_ms": _percentile(latency, LATENCY_BUCKETS_MS, 0.95),
+                "latency_histogram": dict(
+                    zip([*map(str, LATENCY_BUCKETS_MS), "inf"], latency)
+                ),
+                "query_histogram": dict(
+                    zip([*map(str, QUERY_BUCKETS), "inf"], queries)
+                ),
+            }
+        )
+    return sorted(report, key=lambda row: row["mean_ms"], reverse=True)
+
+
+def reset_stats():
+    _worker.reset()
+
+
+def _execute(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """Count the queries of ``connection`` in the current profile."""
+    if _execute not in connection.execute_wrappers:
+        # First, so that execute_wrapper() blocks still pop their own wrapper
+        connection.execute_wrappers.insert(0, _execute)
+
+
+def _install_all(**kwargs):
+    for connection in connections.all(initialized_only=True):
+        install(connection)
+
+
+@contextmanager
+def profiling():
+    """Profile the queries and template renders of the enclosed code."""
+    _install_all()
+    profile = RequestProfile()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Under ASGI the queries run in other threads than the middleware.
+        # request_started is sent in the thread that runs the sync code of
+        # the request, and connection_created in any thread that connects
+        request_started.connect(_install_all, dispatch_uid="profiling")
+        connection_created.connect(install, dispatch_uid="profiling")
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with profiling() as profile:
+            response = self.get_response(request)
+        return self.report(request, response, profile, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with profiling() as profile:
+            response = await self.get_response(request)
+        return self.report(request, response, profile, started)
+
+    def report(self, request, response, profile, started):
+        total = time.perf_counter() - started
+        duplicates = profile.duplicates()
+        timings = [
+            f'db;dur={profile.db_time * 1000:.1f};desc="{profile.query_count} queries"',
+            f"tpl;dur={profile.template_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ]
+        if duplicates:
+            timings.insert(
+                1, f'dup;desc="{sum(duplicates.values())} duplicate queries"'
+            )
+            for sql, count in duplicates.items():
+                logger.warning("Query ran %d times in %s: %s", count, request.path, sql)
+        response["Server-Timing"] = ", ".join(timings)
+
+        match = request.resolver_match
+        record(match.view_name if match else "<unresolved>", total, profile, duplicates)
+        return response
@@ -0,0 +1,132 @@
+"""Read replica routing with read-your-writes.
+
+``ReplicaRouter`` sends the reads of read-only views to one of the
+``REPLICA_DATABASES``: the list and detail pages, the function views marked
+with ``replica_reads`` (the AJAX lookups) and the GET requests of the view
+classes with ``replica_reads = True`` (the read API). Everything else, and
+all writes, use the primary.
+
+Replicas lag behind the primary, so a user who just wrote must not read
+from them: ``ReplicaMiddleware`` keeps the reads of a request on the
+primary once the request wrote, and sets a cookie after any write or unsafe
+request that pins the user's next requests to the primary for
+``REPLICA_PIN_SECONDS``.
+"""
+
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.views.generic.detail import BaseDetailView
+from django.views.generic.list import BaseListView
+
+PIN_COOKIE = "primary_pin"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_state = ContextVar("replica_state", default=None)
+
+
+def replica_reads(view):
+    """Let the GET requests of the function ``view`` read from a replica."""
+    view.replica_reads = True
+    return view
+
+
+def reads_from_replica(view):
+    if getattr(view, "replica_reads", False):
+        return True
+    view_class = getattr(view, "view_class", None)
+    return view_class is not None and (
+        getattr(view_class, "replica_reads", False)
+        or issubclass(view_class, (BaseListView, BaseDetailView))
+    )
+
+
+class RequestState:
+    """Where the reads of one request may go."""
+
+    def __init__(self, request):
+        self.request = request
+        self.pinned = (
+            request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+        )
+        self.wrote = False
+        self.replica = random.choice(settings.REPLICA_DATABASES)
+        self._eligible = None
+
+    def read_database(self):
+        if self.pinned or self.wrote:
+            return None
+        if self._eligible is None:
+            # Unknown until the URL is resolved, which comes after the
+            # session and user lookups of the middleware
+            match = self.request.resolver_match
+            if match is None:
+                return None
+            self._eligible = reads_from_replica(match.func)
+        return self.replica if self._eligible else None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        return state.read_database() if state else None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state:
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in settings.REPLICA_DATABASES
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+        state = RequestState(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.pin(state, response)
+
+    def pin(self, state, response):
+        if state.wrote or state.request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,59 @@
+"""Case-insensitive prefix search that can use an index.
+
+``name__istartswith`` compiles to ``UPPER(name) LIKE UPPER('ab%')`` on
+PostgreSQL and to ``name LIKE 'ab%'`` on SQLite, which no index of the column
+can serve. ``PrefixIndex`` indexes ``Lower(field)`` instead, and
+``filter_prefix`` matches the lowercased prefix against that expression:
+
+* PostgreSQL only uses an index for ``LIKE 'ab%'`` with a pattern operator
+  class (unless the database collation is ``C``), so the index is created
+  with ``text_pattern_ops`` there.
+* SQLite never uses an index for ``LIKE`` on an expression, so the prefix is
+  also matched as a range there, which in the binary order of SQLite
+  strings holds exactly the strings starting with it.
+"""
+
+from django.db import connections, models
+from django.db.models import Value
+from django.db.models.functions import Concat, Lower
+
+# Sorts after any character that may follow the prefix
+LAST_CHARACTER = "\U0010ffff"
+
+
+class PrefixIndex(models.Index):
+    """An index of ``Lower(field)`` for ``filter_prefix`` on ``field``."""
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.vendor == "postgresql":
+            from django.contrib.postgres.indexes import OpClass
+
+            index = self.clone()
+            index.expressions = tuple(
+                OpClass(expression, name="text_pattern_ops")
+                for expression in self.expressions
+            )
+            return super(PrefixIndex, index).create_sql(
+                model, schema_editor, using, **kwargs
+            )
+        return super().create_sql(model, schema_editor, using, **kwargs)
+
+
+def filter_prefix(queryset, field, prefix):
+    """Keep the rows of ``queryset`` whose ``field`` starts with ``prefix``.
+
+    The comparison ignores case, and ``field`` needs a ``PrefixIndex``.
+    """
+    alias = f"{field.replace('__', '_')}_lower"
+    lowered = Lower(Value(prefix))
+    queryset = queryset.alias(**{alias: Lower(field)}).filter(
+        **{f"{alias}__startswith": lowered}
+    )
+    if connections[queryset.db].vendor == "sqlite":
+        queryset = queryset.filter(
+            **{
+                f"{alias}__gte": lowered,
+                f"{alias}__lt": Concat(lowered, Value(LAST_CHARACTER)),
+            }
+        )
+    return queryset
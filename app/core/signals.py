@@ -0,0 +1,173 @@
+from datetime import timedelta
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .availability import rebuild_availability, refresh_doctor_availability
+from .geo import bump_geo_version
+from .matching import invalidate_matching
+from .models import (
+    Appointment,
+    AvailabilitySlot,
+    City,
+    Clinic,
+    ClinicStats,
+    Country,
+    Doctor,
+    DoctorClinicAffiliation,
+    DoctorPatientAffiliation,
+    DoctorStats,
+    Procedure,
+    State,
+    Visit,
+)
+from .stats import apply_stats_change, source_fields
+
+
+def aware_datetime(value):
+    if isinstance(value, str):
+        # Instances built with raw strings are saved without conversion
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def booking_span(doctor_id, start, minutes):
+    start = aware_datetime(start)
+    return doctor_id, start, start + timedelta(minutes=minutes)
+
+
+def stats_values(sender, instance):
+    values = {field: getattr(instance, field) for field in source_fields(sender)}
+    for field in ("visit_date", "appointment_date"):
+        if field in values:
+            values[field] = aware_datetime(values[field])
+    return values
+
+
+@receiver(post_save, sender=DoctorClinicAffiliation)
+def rebuild_affiliation_availability(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rebuild_availability(instance)
+
+
+@receiver(post_delete, sender=DoctorClinicAffiliation)
+def drop_affiliation_availability(sender, instance, **kwargs):
+    # Appointments deleted in the same cascade may have rebuilt slots for this
+    # affiliation after its own slots were collected
+    AvailabilitySlot.objects.filter(affiliation_id=instance.pk).delete()
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_previous_booking(sender, instance, raw=False, **kwargs):
+    # Keep the old slot so moving an appointment frees it again
+    instance._previous_booking = None
+    if instance.pk and not raw:
+        previous = (
+            Appointment.objects.filter(pk=instance.pk)
+            .values_list("doctor_id", "appointment_date", "procedure__duration_minutes")
+            .first()
+        )
+        if previous:
+            instance._previous_booking = booking_span(*previous)
+
+
+@receiver(post_save, sender=Appointment)
+def refresh_booked_availability(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    spans = {
+        booking_span(
+            instance.doctor_id,
+            instance.appointment_date,
+            instance.procedure.duration_minutes,
+        ),
+        getattr(instance, "_previous_booking", None),
+    }
+    for span in filter(None, spans):
+        refresh_doctor_availability(*span)
+
+
+@receiver(post_delete, sender=Appointment)
+def refresh_released_availability(sender, instance, **kwargs):
+    refresh_doctor_availability(
+        *booking_span(
+            instance.doctor_id,
+            instance.appointment_date,
+            instance.procedure.duration_minutes,
+        )
+    )
+
+
+@receiver(pre_save, sender=Visit)
+@receiver(pre_save, sender=Appointment)
+@receiver(pre_save, sender=DoctorClinicAffiliation)
+@receiver(pre_save, sender=DoctorPatientAffiliation)
+def remember_stats_values(sender, instance, raw=False, **kwargs):
+    # A row moved to another clinic or doctor changes the stats of both
+    instance._previous_stats_values = None
+    if instance.pk and not raw:
+        fields = source_fields(sender)
+        previous = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+        if previous:
+            instance._previous_stats_values = dict(zip(fields, previous))
+
+
+@receiver(post_save, sender=Visit)
+@receiver(post_save, sender=Appointment)
+@receiver(post_save, sender=DoctorClinicAffiliation)
+@receiver(post_save, sender=DoctorPatientAffiliation)
+def update_saved_row_stats(sender, instance, raw=False, **kwargs):
+    if not raw:
+        apply_stats_change(
+            sender,
+            instance.pk,
+            getattr(instance, "_previous_stats_values", None),
+            stats_values(sender, instance),
+        )
+
+
+@receiver(post_delete, sender=Visit)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_delete, sender=DoctorClinicAffiliation)
+@receiver(post_delete, sender=DoctorPatientAffiliation)
+def update_deleted_row_stats(sender, instance, **kwargs):
+    apply_stats_change(sender, instance.pk, stats_values(sender, instance), None)
+
+
+@receiver(post_delete, sender=Clinic)
+def drop_clinic_stats(sender, instance, **kwargs):
+    # Rows deleted in the same cascade may have refreshed the stats after
+    # they were collected for deletion
+    ClinicStats.objects.filter(clinic_id=instance.pk).delete()
+
+
+@receiver(post_delete, sender=Doctor)
+def drop_doctor_stats(sender, instance, **kwargs):
+    DoctorStats.objects.filter(doctor_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=State)
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=Country)
+@receiver(post_delete, sender=State)
+@receiver(post_delete, sender=City)
+def invalidate_geo_cache(sender, **kwargs):
+    bump_geo_version()
+
+
+@receiver(post_save, sender=DoctorClinicAffiliation)
+@receiver(post_delete, sender=DoctorClinicAffiliation)
+@receiver(post_delete, sender=Procedure)
+def invalidate_matching_on_change(sender, **kwargs):
+    invalidate_matching()
+
+
+@receiver(m2m_changed, sender=Doctor.specialties.through)
+def invalidate_matching_on_specialties(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_matching()
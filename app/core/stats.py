@@ -0,0 +1,282 @@
+"""Per-clinic and per-doctor dashboard counters.
+
+``ClinicStats`` and ``DoctorStats`` hold, for each clinic and doctor, the
+number of affiliated doctors (or clinics), distinct patients, visits in the
+current month and upcoming appointments. The signal handlers in
+``core.signals`` apply each change to a visit, appointment or affiliation to
+the rows of the clinics and doctors it touches. The time-dependent counters
+also change as time passes, so the ``rebuild_stats`` command, which rebuilds
+every row in bulk, should run daily.
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import (
+    Appointment,
+    Clinic,
+    ClinicStats,
+    Doctor,
+    DoctorClinicAffiliation,
+    DoctorPatientAffiliation,
+    DoctorStats,
+    Visit,
+)
+
+COUNTERS = ("num_patients", "visits_this_month", "upcoming_appointments")
+
+# Model: (stats model, its key field, counters)
+STATS = {
+    Clinic: (ClinicStats, "clinic", ("num_doctors", *COUNTERS)),
+    Doctor: (DoctorStats, "doctor", ("num_clinics", *COUNTERS)),
+}
+STATS_OWNERS = {"clinic": Clinic, "doctor": Doctor}
+
+# Rows of these models count towards the stats of their clinic and/or
+# doctor: model: (owner keys, other fields the counters depend on)
+STATS_SOURCES = {
+    Visit: (("clinic", "doctor"), ("patient_id", "visit_date")),
+    Appointment: (("clinic", "doctor"), ("patient_id", "appointment_date")),
+    DoctorClinicAffiliation: (("clinic", "doctor"), ()),
+    DoctorPatientAffiliation: (("doctor",), ("patient_id",)),
+}
+
+# The rows whose patients count as the patients of a clinic or doctor
+PATIENT_SOURCES = {
+    "clinic": (Visit, Appointment),
+    "doctor": (Visit, Appointment, DoctorPatientAffiliation),
+}
+
+
+def subquery_count(queryset, group_by, field, distinct=True):
+    """``COUNT(DISTINCT field)`` of a correlated ``queryset`` as an annotation.
+
+    Unlike ``Count`` across several joins, each count scans only its own
+    rows, so counts of different relations never multiply each other.
+    """
+    counts = (
+        queryset.order_by()
+        .values(group_by)
+        .annotate(count=Count(field, distinct=distinct))
+        .values("count")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def distinct_patients(key, models=(Visit, Appointment)):
+    """Distinct patients of the outer clinic or doctor across ``models``.
+
+    ``key`` is ``"clinic"`` or ``"doctor"``. Each model only counts the
+    patients that none of the models before it has.
+    """
+    total = None
+    for index, model in enumerate(models):
+        rows = model.objects.filter(**{key: OuterRef("pk")})
+        for earlier in models[:index]:
+            rows = rows.filter(
+                ~Exists(
+                    earlier.objects.filter(
+                        patient=OuterRef("patient"), **{key: OuterRef(key)}
+                    )
+                )
+            )
+        count = subquery_count(rows, key, "patient")
+        total = count if total is None else total + count
+    return total
+
+
+def month_bounds(today):
+    """Aware datetime bounds of the month of ``today``."""
+    first = today.replace(day=1)
+    following = (first + timedelta(days=32)).replace(day=1)
+    return (
+        timezone.make_aware(datetime.combine(first, time.min)),
+        timezone.make_aware(datetime.combine(following, time.min)),
+    )
+
+
+def live_counters(model, now):
+    """Annotate ``Clinic`` or ``Doctor`` rows with counters from the raw data."""
+    _, key, counters = STATS[model]
+    start, end = month_bounds(timezone.localdate(now))
+    return model.objects.annotate(
+        **{
+            # num_doctors of a clinic, num_clinics of a doctor
+            counters[0]: subquery_count(
+                DoctorClinicAffiliation.objects.filter(**{key: OuterRef("pk")}),
+                key,
+                "clinic" if key == "doctor" else "doctor",
+            ),
+            "num_patients": distinct_patients(key, PATIENT_SOURCES[key]),
+            "visits_this_month": subquery_count(
+                Visit.objects.filter(
+                    visit_date__gte=start, visit_date__lt=end, **{key: OuterRef("pk")}
+                ),
+                key,
+                "pk",
+                distinct=False,
+            ),
+            "upcoming_appointments": subquery_count(
+                Appointment.objects.filter(
+                    appointment_date__gte=now, **{key: OuterRef("pk")}
+                ),
+                key,
+                "pk",
+                distinct=False,
+            ),
+        }
+    )
+
+
+def _stats_rows(model, queryset, now):
+    stats_model, key, counters = STATS[model]
+    month = timezone.localdate(now).replace(day=1)
+    for row in queryset.values("pk", *counters).iterator():
+        pk = row.pop("pk")
+        yield stats_model(**{f"{key}_id": pk}, **row, month=month, updated_at=now)
+
+
+def refresh_stats(model, pks):
+    """Recompute the stats rows of the given clinics (or doctors)."""
+    pks = {pk for pk in pks if pk is not None}
+    if not pks:
+        return
+    stats_model, key, counters = STATS[model]
+    now = timezone.now()
+    stats_model.objects.bulk_create(
+        _stats_rows(model, live_counters(model, now).filter(pk__in=pks), now),
+        update_conflicts=True,
+        unique_fields=[key],
+        update_fields=[*counters, "month", "updated_at"],
+    )
+
+
+def source_fields(sender):
+    """The fields of a ``sender`` row that its owners' counters depend on."""
+    keys, fields = STATS_SOURCES[sender]
+    return (*[f"{key}_id" for key in keys], *fields)
+
+
+def _row_counters(sender, key, row, now):
+    # The counters of the owner's stats that count the row itself
+    if sender is DoctorClinicAffiliation:
+        return STATS[STATS_OWNERS[key]][2][:1]
+    if sender is Visit:
+        start, end = month_bounds(timezone.localdate(now))
+        return ("visits_this_month",) if start <= row["visit_date"] < end else ()
+    if sender is Appointment:
+        return ("upcoming_appointments",) if row["appointment_date"] >= now else ()
+    return ()
+
+
+def _only_row_of_patient(sender, pk, key, row):
+    # Whether no other row makes the patient one of the owner's patients
+    for model in PATIENT_SOURCES[key]:
+        rows = model.objects.filter(
+            patient_id=row["patient_id"], **{f"{key}_id": row[f"{key}_id"]}
+        )
+        if model is sender:
+            rows = rows.exclude(pk=pk)
+        if rows.exists():
+            return False
+    return True
+
+
+def apply_stats_change(sender, pk, old, new):
+    """Update the stats of the owners of the ``sender`` row ``pk``.
+
+    ``old`` and ``new`` map the row's ``source_fields`` to their values
+    before and after the change, and are ``None`` for a created or a deleted
+    row. The counters move by one with ``F()`` expressions; the distinct
+    patients are only counted again when the row was the patient's first or
+    last one for that owner. Missing stats rows, and rows of a past month,
+    are recomputed with ``refresh_stats``.
+    """
+    if old == new:
+        return
+    now = timezone.now()
+    keys, _ = STATS_SOURCES[sender]
+    deltas = defaultdict(Counter)
+    recount = set()
+    for row, sign in ((old, -1), (new, 1)):
+        if row is None:
+            continue
+        for key in keys:
+            owner = (key, row[f"{key}_id"])
+            for counter in _row_counters(sender, key, row, now):
+                deltas[owner][counter] += sign
+            if sender not in PATIENT_SOURCES[key]:
+                continue
+            moved = (
+                old is None
+                or new is None
+                or any(
+                    old[field] != new[field] for field in (f"{key}_id", "patient_id")
+                )
+            )
+            if moved and _only_row_of_patient(sender, pk, key, row):
+                recount.add(owner)
+
+    month = timezone.localdate(now).replace(day=1)
+    for key, owner_pk in {*deltas, *recount}:
+        if owner_pk is None:
+            continue
+        model = STATS_OWNERS[key]
+        values = {
+            counter: Greatest(F(counter) + delta, Value(0))
+            for counter, delta in deltas[key, owner_pk].items()
+            if delta
+        }
+        if (key, owner_pk) in recount:
+            values["num_patients"] = distinct_patients(key, PATIENT_SOURCES[key])
+        if not values:
+            continue
+        updated = (
+            STATS[model][0]
+            .objects.filter(pk=owner_pk, month=month)
+            .update(**values, updated_at=now)
+        )
+        if not updated:
+            refresh_stats(model, [owner_pk])
+
+
+def rebuild_stats(now=None, batch_size=2000):
+    """Replace every stats row with counters computed in bulk."""
+    now = now or timezone.now()
+    rows = 0
+    with transaction.atomic():
+        for model, (stats_model, _, _) in STATS.items():
+            stats_model.objects.all().delete()
+            batch = []
+            for stats in _stats_rows(model, live_counters(model, now), now):
+                batch.append(stats)
+                if len(batch) >= batch_size:
+                    rows += len(stats_model.objects.bulk_create(batch))
+                    batch = []
+            rows += len(stats_model.objects.bulk_create(batch))
+    return rows
+
+
+def stats_mismatches(model, now=None):
+    """Return ``[(pk, counter, stored, live)]`` where the table is wrong.
+
+    Clinics and doctors without a stats row are compared as all zeros. The
+    time-dependent counters only match when ``now`` is the time they were
+    computed at, e.g. right after ``rebuild_stats(now)``.
+    """
+    stats_model, key, counters = STATS[model]
+    stored = {row.pop(key): row for row in stats_model.objects.values(key, *counters)}
+    mismatches = []
+    for row in live_counters(model, now or timezone.now()).values("pk", *counters):
+        saved = stored.get(row["pk"], {})
+        for counter in counters:
+            if saved.get(counter, 0) != row[counter]:
+                mismatches.append(
+                    (row["pk"], counter, saved.get(counter, 0), row[counter])
+                )
+    return mismatches
@@ -0,0 +1,20 @@
+"""Test case bases for the apps' test suites.
+
+With ``SQL_REPLICAS`` set, requests would read from the replica, which the
+test cases do not declare in ``databases`` and which cannot see the rows a
+``TestCase`` has not committed. These bases keep every read on the primary;
+``core.tests.ReplicaDatabaseTests`` routes requests to a real replica.
+"""
+
+from django import test
+from django.test import override_settings
+
+
+@override_settings(REPLICA_DATABASES=[])
+class TestCase(test.TestCase):
+    pass
+
+
+@override_settings(REPLICA_DATABASES=[])
+class TransactionTestCase(test.TransactionTestCase):
+    pass
@@ -1,6 +1,32 @@
-from django.test import TestCase
-from django.urls import reverse
+import csv
+import json
+import os
+import tempfile
+import threading
+import time as time_module
+import warnings
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.signals import request_started
+from django.db import OperationalError, connection, connections
+from django.db.backends.signals import connection_created
+from django.db.models import Exists, OuterRef
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django import test
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.http import HttpResponse, JsonResponse, QueryDict
+from django.urls import include, path, reverse
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
 from core.models import (
     Doctor,
     Clinic,
@@ -9,7 +35,46 @@ from core.models import (
     Visit,
     Procedure,
     Appointment,
+    AvailabilitySlot,
+    ClinicStats,
+    DoctorPatientAffiliation,
+    DoctorStats,
+    Country,
+    State,
+    City,
+)
+from core.availability import BookedIntervals, get_availability, horizon_end
+from core.connection_metrics import (
+    connection_mode,
+    connection_stats,
+    reset_connection_stats,
+)
+from core.booking import BookingConflict, book_appointment, booking_options
+from core.export import stream_export
+from core.invites import invite_url, pending_invites
+from core.geo import geo_lookup
+from core.matching import (
+    MatchingIndex,
+    matching_index,
+    matching_options,
+    matching_triples,
+)
+from core.management.commands.load_data import iter_json_array
+from core.pagination import encode_cursor
+from core.profiling import reset_stats as reset_profiling_stats
+from core.profiling import stats as profiling_stats
+from core.testing import TestCase, TransactionTestCase
+from core.timeline import timeline_page
+from core.replicas import (
+    PIN_COOKIE,
+    ReplicaMiddleware,
+    ReplicaRouter,
+    RequestState,
+    reads_from_replica,
 )
+from core import views
+from core.views import ClinicListView, DoctorDetailView
+from api import views as api_views
 
 User = get_user_model()
 
@@ -188,3 +253,2061 @@ class VisitTests(TestCase):
             appointment.appointment_date.strftime("%Y-%m-%dT%H:%M:%S"),
             "2024-09-26T09:00:00",
         )
+
+
+class PatientListViewTests(TestCase):
+    def setUp(self):
+        doctor_user = User.objects.create_user(
+            username="doctoruser", email="doctor@example.com", password="12345"
+        )
+        self.doctor = Doctor.objects.create(user=doctor_user, npi="1234567890")
+        self.clinic = Clinic.objects.create(name="Test Clinic", address="123 Clinic St")
+        self.procedure = Procedure.objects.create(name="Teeth Cleaning")
+        self.url = reverse("patient-list")
+
+    def create_patient(self, index):
+        user = User.objects.create_user(
+            username=f"patient{index}",
+            email=f"patient{index}@example.com",
+            password="12345",
+            first_name="Patient",
+            last_name=str(index),
+        )
+        patient = Patient.objects.create(
+            user=user,
+            date_of_birth="1990-01-01",
+            address="456 Patient St",
+            phone_number="555-555-5555",
+            ssn_last_four="1234",
+            gender="F",
+        )
+        for day in (1, 2):
+            visit = Visit.objects.create(
+                patient=patient,
+                doctor=self.doctor,
+                clinic=self.clinic,
+                visit_date=f"2024-09-0{day}T09:00:00Z",
+                doctor_notes="Routine checkup",
+            )
+            visit.procedures_done.add(self.procedure)
+            Appointment.objects.create(
+                patient=patient,
+                doctor=self.doctor,
+                clinic=self.clinic,
+                procedure=self.procedure,
+                appointment_date=f"2024-10-0{day}T{index:02d}:00:00Z",
+            )
+        return patient
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_patients(self):
+        """Test the patient list runs a fixed number of queries"""
+        self.create_patient(0)
+        baseline, _ = self.count_queries()
+
+        for index in range(1, 6):
+            self.create_patient(index)
+        num_queries, response = self.count_queries()
+
+        self.assertEqual(num_queries, baseline)
+        self.assertEqual(len(response.context["patients"]), 6)
+
+    def test_last_visit_and_next_appointment(self):
+        """Test each patient gets its latest visit and earliest appointment"""
+        patient = self.create_patient(0)
+        _, response = self.count_queries()
+
+        listed = response.context["patients"][0]
+        self.assertEqual(listed.pk, patient.pk)
+        self.assertEqual(listed.last_visit.visit_date.day, 2)
+        self.assertEqual(listed.next_appointment.appointment_date.day, 1)
+        self.assertContains(response, "Teeth Cleaning")
+
+
+class StatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="staffuser", email="staff@example.com"
+        )
+        self.client.force_login(self.user)
+        self.procedure = Procedure.objects.create(name="Teeth Cleaning")
+        self.clinic = Clinic.objects.create(name="Alpha Clinic", address="1 St")
+        self.other_clinic = Clinic.objects.create(name="Bravo Clinic", address="2 St")
+        self.doctors = [self.create_user_record(Doctor, f"doctor{i}") for i in (0, 1)]
+        for doctor in self.doctors:
+            DoctorClinicAffiliation.objects.create(
+                doctor=doctor,
+                clinic=self.clinic,
+                office_address="Office",
+                working_schedule=[],
+            )
+        self.patients = [
+            self.create_user_record(Patient, f"patient{i}") for i in range(3)
+        ]
+
+    def create_user_record(self, model, username):
+        user = User.objects.create_user(
+            username=username, email=f"{username}@example.com", last_name=username
+        )
+        if model is Doctor:
+            return Doctor.objects.create(user=user, npi=username)
+        return Patient.objects.create(
+            user=user,
+            date_of_birth="1990-01-01",
+            address="456 Patient St",
+            phone_number="555-555-5555",
+            ssn_last_four="1234",
+            gender="F",
+        )
+
+    def test_counts_include_appointment_only_patients(self):
+        """Test counts are distinct and not inflated by visits x appointments"""
+        first, second = self.doctors
+        for day in (1, 2, 3):
+            Visit.objects.create(
+                patient=self.patients[0],
+                doctor=first,
+                clinic=self.clinic,
+                visit_date=f"2024-09-0{day}T09:00:00Z",
+                doctor_notes="Checkup",
+            )
+            Appointment.objects.create(
+                patient=self.patients[0],
+                doctor=first,
+                clinic=self.clinic,
+                procedure=self.procedure,
+                appointment_date=f"2024-10-0{day}T09:00:00Z",
+            )
+        Appointment.objects.create(
+            patient=self.patients[1],
+            doctor=second,
+            clinic=self.clinic,
+            procedure=self.procedure,
+            appointment_date="2024-10-01T09:00:00Z",
+        )
+        Visit.objects.create(
+            patient=self.patients[2],
+            doctor=first,
+            clinic=self.other_clinic,
+            visit_date="2024-09-01T09:00:00Z",
+            doctor_notes="Checkup",
+        )
+
+        clinics = self.client.get(reverse("clinic-list")).context["clinics"]
+        self.assertEqual(
+            [(c.name, c.num_doctors, c.num_patients) for c in clinics],
+            [("Alpha Clinic", 2, 2), ("Bravo Clinic", 0, 1)],
+        )
+        doctors = self.client.get(reverse("doctor-list")).context["doctors"]
+        self.assertEqual(
+            [(d.npi, d.num_clinics, d.num_patients) for d in doctors],
+            [("doctor0", 1, 2), ("doctor1", 1, 1)],
+        )
+
+    def test_incremental_updates(self):
+        """Test the stats follow saves, moves and deletes of their sources"""
+        first, second = self.doctors
+        now = timezone.now()
+        visit = Visit.objects.create(
+            patient=self.patients[0],
+            doctor=first,
+            clinic=self.clinic,
+            visit_date=now,
+            doctor_notes="Checkup",
+        )
+        appointment = Appointment.objects.create(
+            patient=self.patients[1],
+            doctor=first,
+            clinic=self.clinic,
+            procedure=self.procedure,
+            appointment_date=now + timedelta(days=1),
+        )
+        DoctorPatientAffiliation.objects.create(
+            doctor=second, patient=self.patients[2], visit_date=now.date()
+        )
+
+        stats = ClinicStats.objects.get(clinic=self.clinic)
+        self.assertEqual(
+            (
+                stats.num_doctors,
+                stats.num_patients,
+                stats.visits_this_month,
+                stats.upcoming_appointments,
+            ),
+            (2, 2, 1, 1),
+        )
+        self.assertEqual(DoctorStats.objects.get(doctor=second).num_patients, 1)
+
+        visit.clinic = self.other_clinic
+        visit.save()
+        appointment.delete()
+        self.assertEqual(ClinicStats.objects.get(clinic=self.clinic).num_patients, 0)
+        self.assertEqual(
+            ClinicStats.objects.get(clinic=self.other_clinic).visits_this_month, 1
+        )
+        self.assertEqual(DoctorStats.objects.get(doctor=first).num_patients, 1)
+        call_command("rebuild_stats", check=True, stdout=StringIO())
+
+    def test_writes_apply_deltas(self):
+        """Test writes only count patients again for a patient's first row"""
+        now = timezone.now()
+
+        def book(patient, days):
+            return Appointment.objects.create(
+                patient=patient,
+                doctor=self.doctors[0],
+                clinic=self.clinic,
+                procedure=self.procedure,
+                appointment_date=now + timedelta(days=days),
+            )
+
+        def counted_patients(queries):
+            return sum("COUNT(DISTINCT" in query["sql"] for query in queries)
+
+        book(self.patients[0], 1)
+        with CaptureQueriesContext(connection) as queries:
+            second = book(self.patients[0], 2)
+        self.assertEqual(counted_patients(queries), 0)
+        with CaptureQueriesContext(connection) as queries:
+            book(self.patients[1], 3)
+        self.assertEqual(counted_patients(queries), 2)
+
+        stats = ClinicStats.objects.get(clinic=self.clinic)
+        self.assertEqual((stats.num_patients, stats.upcoming_appointments), (2, 3))
+        second.delete()
+        self.patients[1].delete()
+        stats = ClinicStats.objects.get(clinic=self.clinic)
+        self.assertEqual((stats.num_patients, stats.upcoming_appointments), (1, 1))
+        call_command("rebuild_stats", check=True, stdout=StringIO())
+
+    def test_rebuild_and_verify(self):
+        """Test the command detects drift and rebuilds the table in bulk"""
+        Visit.objects.create(
+            patient=self.patients[0],
+            doctor=self.doctors[0],
+            clinic=self.clinic,
+            visit_date=timezone.now(),
+            doctor_notes="Checkup",
+        )
+        ClinicStats.objects.update(num_patients=7)
+        DoctorStats.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command(
+                "rebuild_stats", check=True, stdout=StringIO(), stderr=StringIO()
+            )
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command("rebuild_stats", stdout=StringIO())
+        self.assertLess(len(queries), 20)
+        self.assertEqual(ClinicStats.objects.get(clinic=self.clinic).num_patients, 1)
+        self.assertEqual(DoctorStats.objects.count(), 2)
+
+
+class ClinicDetailViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="staffuser", email="staff@example.com"
+        )
+        self.client.force_login(self.user)
+        country = Country.objects.create(name="Peru")
+        state = State.objects.create(country=country, name="Lima")
+        self.clinic = Clinic.objects.create(
+            name="Test Clinic",
+            address="123 Clinic St",
+            country=country,
+            state=state,
+            city=City.objects.create(state=state, name="Miraflores"),
+        )
+        self.url = reverse("clinic-detail", args=[self.clinic.id])
+
+    def add_doctor(self, index, working_schedule):
+        user = User.objects.create_user(
+            username=f"doctor{index}",
+            email=f"doctor{index}@example.com",
+            first_name="Doctor",
+            last_name=str(index),
+        )
+        DoctorClinicAffiliation.objects.create(
+            doctor=Doctor.objects.create(user=user, npi=str(index)),
+            clinic=self.clinic,
+            office_address="Office",
+            working_schedule=working_schedule,
+        )
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_doctors(self):
+        """Test the clinic page runs a fixed number of queries"""
+        self.add_doctor(0, [])
+        baseline, _ = self.count_queries()
+
+        for index in range(1, 6):
+            self.add_doctor(index, [])
+        num_queries, response = self.count_queries()
+
+        # Session, user, clinic with its location, affiliations
+        self.assertEqual(num_queries, 4)
+        self.assertEqual(num_queries, baseline)
+        self.assertEqual(len(response.context["affiliations"]), 6)
+        self.assertContains(response, "Miraflores")
+
+    def test_working_schedule_is_normalized(self):
+        """Test schedules stored as JSON strings are listed like lists"""
+        shift = {"start": "2024-09-26T09:00:00", "end": "2024-09-26T13:00:00"}
+        self.add_doctor(0, json.dumps([shift]))
+        self.add_doctor(1, "not json")
+        _, response = self.count_queries()
+
+        schedules = [a["working_schedule"] for a in response.context["affiliations"]]
+        self.assertEqual(schedules, [[shift], []])
+        self.assertContains(response, "2024-09-26T09:00:00")
+
+
+class DoctorDetailViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="staffuser", email="staff@example.com"
+        )
+        self.client.force_login(self.user)
+        doctor_user = User.objects.create_user(
+            username="doctoruser", email="doctor@example.com"
+        )
+        self.doctor = Doctor.objects.create(user=doctor_user, npi="1234567890")
+        self.url = reverse("doctor-detail", args=[self.doctor.id])
+
+    def add_patient_and_clinic(self, index):
+        user = User.objects.create_user(
+            username=f"patient{index}",
+            email=f"patient{index}@example.com",
+            first_name="Patient",
+            last_name=str(index),
+        )
+        patient = Patient.objects.create(
+            user=user,
+            date_of_birth="1990-01-01",
+            address="456 Patient St",
+            phone_number="555-555-5555",
+            ssn_last_four="1234",
+            gender="F",
+        )
+        # A patient seen twice is still listed once
+        for day in (1, 2):
+            DoctorPatientAffiliation.objects.create(
+                doctor=self.doctor, patient=patient, visit_date=f"2024-09-0{day}"
+            )
+        DoctorClinicAffiliation.objects.create(
+            doctor=self.doctor,
+            clinic=Clinic.objects.create(name=f"Clinic {index}", address="1 St"),
+            office_address=f"Office {index}",
+            working_schedule=[],
+        )
+
+    def count_queries(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow(self):
+        """Test the doctor page runs a fixed number of queries"""
+        self.add_patient_and_clinic(0)
+        baseline, _ = self.count_queries()
+
+        for index in range(1, 6):
+            self.add_patient_and_clinic(index)
+        num_queries, response = self.count_queries()
+
+        self.assertEqual(num_queries, baseline)
+        self.assertEqual(len(response.context["patients"]), 6)
+        self.assertEqual(len(response.context["affiliations"]), 6)
+        self.assertContains(response, "Office 5")
+        self.assertContains(response, "patient5@example.com")
+
+    def test_patient_roster_is_paginated(self):
+        """Test the roster pages cover every patient once"""
+        for index in range(5):
+            self.add_patient_and_clinic(index)
+
+        names, params = [], {}
+        with mock.patch.object(DoctorDetailView, "paginate_by", 2):
+            while True:
+                _, response = self.count_queries(params)
+                names += [p.user.last_name for p in response.context["patients"]]
+                if not response.context.get("next_query"):
+                    break
+                params = QueryDict(response.context["next_query"])
+        self.assertEqual(names, ["0", "1", "2", "3", "4"])
+
+
+class PatientTimelineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="staffuser", email="staff@example.com"
+        )
+        self.client.force_login(self.user)
+        doctor_user = User.objects.create_user(
+            username="doctoruser", email="doctor@example.com"
+        )
+        self.doctor = Doctor.objects.create(user=doctor_user, npi="1234567890")
+        self.clinic = Clinic.objects.create(name="Test Clinic", address="1 St")
+        self.procedure = Procedure.objects.create(name="Teeth Cleaning")
+        patient_user = User.objects.create_user(
+            username="patientuser", email="patient@example.com"
+        )
+        self.patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth="1990-01-01",
+            address="456 Patient St",
+            phone_number="555-555-5555",
+            ssn_last_four="1234",
+            gender="F",
+        )
+        self.start = timezone.now().replace(microsecond=0) - timedelta(days=100)
+
+    def add_history(self, days):
+        for day in days:
+            moment = self.start + timedelta(days=day)
+            visit = Visit.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                clinic=self.clinic,
+                visit_date=moment,
+                doctor_notes="x" * 500,
+            )
+            visit.procedures_done.add(self.procedure)
+            # Same time as the visit, to exercise the tie-break
+            Appointment.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                clinic=self.clinic,
+                procedure=self.procedure,
+                appointment_date=moment,
+            )
+
+    def test_pages_merge_visits_and_appointments(self):
+        """Test the JSON pages list every entry once, newest first"""
+        self.add_history(range(25))
+        entries, url = [], reverse("patient-timeline", args=[self.patient.id])
+        while url:
+            data = self.client.get(url).json()
+            entries += data["results"]
+            url = data["next"]
+
+        self.assertEqual(len(entries), 50)
+        keys = [(e["date"], e["type"] == "appointment", e["id"]) for e in entries]
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertEqual(entries[0]["type"], "appointment")
+        visit = entries[1]
+        self.assertEqual(visit["procedures"], ["Teeth Cleaning"])
+        self.assertTrue(visit["notes_truncated"])
+        self.assertEqual(len(visit["notes"]), 200)
+
+        data = self.client.get(
+            reverse("patient-timeline", args=[self.patient.id]), {"notes": "full"}
+        ).json()
+        self.assertEqual(len(data["results"][1]["notes"]), 500)
+
+    def test_detail_page_query_count_does_not_grow(self):
+        """Test the patient page runs a fixed number of queries"""
+        url = reverse("patient-detail", args=[self.patient.id])
+        self.add_history(range(2))
+        with CaptureQueriesContext(connection) as baseline:
+            self.client.get(url)
+
+        self.add_history(range(2, 40))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(queries), len(baseline))
+        self.assertEqual(len(response.context["timeline"]), 20)
+        self.assertIn("next_query", response.context)
+        visits = [e.item for e in response.context["timeline"] if e.kind == "visit"]
+        self.assertIn("doctor_notes", visits[0].get_deferred_fields())
+
+    def test_cursor_keeps_microseconds(self):
+        """Test rows 500 microseconds apart are split across pages"""
+        # Both in the same millisecond, so a cursor cut to milliseconds
+        # would skip the older one
+        moments = [self.start + timedelta(microseconds=us) for us in (600, 100)]
+        for moment in moments:
+            Visit.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                clinic=self.clinic,
+                visit_date=moment,
+                doctor_notes="Checkup",
+            )
+        seen, cursor = [], None
+        while True:
+            entries, cursor = timeline_page(self.patient, cursor, page_size=1)
+            seen += [entry.item.visit_date for entry in entries]
+            if not cursor:
+                break
+        self.assertEqual(seen, moments)
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor returns 404"""
+        url = reverse("patient-timeline", args=[self.patient.id])
+        self.assertEqual(self.client.get(url, {"cursor": "nope"}).status_code, 404)
+        for values in [
+            ["2024-01-01T09:00:00+00:00", 0, "x"],
+            ["2024-01-01T09:00:00+00:00", 0, [1]],
+            ["2024-01-01T09:00:00+00:00", "0", 1],
+            ["not a date", 0, 1],
+            [None, 0, 1],
+        ]:
+            response = self.client.get(url, {"cursor": encode_cursor(values)})
+            self.assertEqual(response.status_code, 404, values)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="reporter", email="reporter@example.com"
+        )
+        self.user.user_permissions.set(
+            Permission.objects.filter(codename__in=["view_visit", "view_appointment"])
+        )
+        self.client.force_login(self.user)
+        doctor_user = User.objects.create_user(
+            username="doctoruser",
+            email="doctor@example.com",
+            first_name="Ana",
+            last_name="Lopez",
+        )
+        self.doctor = Doctor.objects.create(user=doctor_user, npi="1234567890")
+        self.clinic = Clinic.objects.create(name="Test Clinic", address="1 St")
+        self.other_clinic = Clinic.objects.create(name="Other Clinic", address="2 St")
+        self.cleaning = Procedure.objects.create(name="Teeth Cleaning")
+        self.filling = Procedure.objects.create(name="Filling")
+        patient_user = User.objects.create_user(
+            username="patientuser", email="patient@example.com", first_name="Pat"
+        )
+        self.patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth="1990-01-01",
+            address="456 Patient St",
+            phone_number="555-555-5555",
+            ssn_last_four="1234",
+            gender="F",
+        )
+
+    def add_visits(self, count, clinic=None, day=1):
+        for index in range(count):
+            visit = Visit.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                clinic=clinic or self.clinic,
+                visit_date=timezone.make_aware(datetime(2024, 9, day, 9, index)),
+                doctor_notes=f"Notes, line {index}\nsecond line",
+            )
+            visit.procedures_done.add(self.cleaning, self.filling)
+
+    def export(self, kind, **params):
+        response = self.client.get(reverse("export-history", args=[kind]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        """Test visits export with names, procedures and multiline notes"""
+        self.add_visits(2)
+        rows = list(csv.DictReader(StringIO(self.export("visits", format="csv"))))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["doctor_name"], "Ana Lopez")
+        self.assertEqual(rows[0]["patient_name"], "Pat")
+        self.assertEqual(rows[0]["procedures"], "Filling; Teeth Cleaning")
+        self.assertEqual(rows[1]["notes"], "Notes, line 1\nsecond line")
+
+    def test_ndjson_export_filters(self):
+        """Test appointments export filtered by clinic and date range"""
+        for clinic, day in [
+            (self.clinic, 1),
+            (self.clinic, 2),
+            (self.clinic, 3),
+            (self.other_clinic, 2),
+        ]:
+            Appointment.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                clinic=clinic,
+                procedure=self.cleaning,
+                appointment_date=timezone.make_aware(
+                    datetime(2024, 10, day, 9, clinic.pk)
+                ),
+            )
+        lines = self.export(
+            "appointments",
+            format="ndjson",
+            clinic=self.clinic.id,
+            date_from="2024-10-02",
+            date_to="2024-10-03",
+        ).splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [row["date"][:10] for row in rows], ["2024-10-02", "2024-10-03"]
+        )
+        self.assertEqual(rows[0]["procedure_name"], "Teeth Cleaning")
+        self.assertEqual(rows[0]["clinic_name"], "Test Clinic")
+
+    def test_rows_are_read_in_chunks(self):
+        """Test queries grow with the number of chunks, not of rows"""
+        self.add_visits(7)
+        with mock.patch("core.export.EXPORT_CHUNK_SIZE", 3):
+            with CaptureQueriesContext(connection) as queries:
+                lines = list(stream_export("visits", "ndjson"))
+        # One query for the rows, one per chunk of 3 for their procedures
+        self.assertEqual(len(queries), 1 + 3)
+        self.assertEqual("".join(lines).count("\n"), 7)
+
+    async def test_export_streams_under_asgi(self):
+        """Test ASGI gets the export chunk by chunk instead of read whole"""
+        await sync_to_async(self.add_visits)(3)
+        await self.async_client.aforce_login(self.user)
+        url = reverse("export-history", args=["visits"])
+        with warnings.catch_warnings():
+            # Django warns when it reads a sync iterator whole
+            warnings.simplefilter("error")
+            response = await self.async_client.get(url, {"format": "ndjson"})
+            self.assertTrue(response.is_async)
+            content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(content.decode().count("\n"), 3)
+
+    def test_export_requires_view_permission(self):
+        """Test exports need the view permission and a valid format"""
+        url = reverse("export-history", args=["visits"])
+        self.assertEqual(self.client.get(url, {"format": "xml"}).status_code, 400)
+        self.assertEqual(
+            self.client.get(reverse("export-history", args=["users"])).status_code, 404
+        )
+        self.user.user_permissions.clear()
+        self.assertEqual(self.client.get(url, {"format": "csv"}).status_code, 403)
+
+    def test_export_command(self):
+        """Test the command writes the same export to a file"""
+        self.add_visits(2, day=1)
+        self.add_visits(1, day=5)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "visits.csv")
+            call_command("export_history", "visits", date_to="2024-09-04", output=path)
+            with open(path, newline="") as file:
+                self.assertEqual(len(list(csv.DictReader(file))), 2)
+
+
+class InviteTests(TestCase):
+    def test_invited_user_sets_a_password(self):
+        """Test the invitation link lets a user without a password set one"""
+        user = User.objects.create_user(username="invitee", email="invitee@example.com")
+        self.assertFalse(user.has_usable_password())
+        call_command("send_invites", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        url = invite_url(user)
+        self.assertIn(url, mail.outbox[0].body)
+
+        # The token is swapped for a session one, as in a password reset
+        response = self.client.get(url, follow=True)
+        form_url = response.redirect_chain[-1][0]
+        response = self.client.post(
+            form_url,
+            {"new_password1": "Sm1le-wide!", "new_password2": "Sm1le-wide!"},
+        )
+        self.assertRedirects(response, reverse("login"))
+        self.assertTrue(
+            self.client.login(username="invitee@example.com", password="Sm1le-wide!")
+        )
+        # Used links and users with a password are not invited again
+        self.assertFalse(self.client.get(url).context["validlink"])
+        self.assertFalse(pending_invites().exists())
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="staffuser", email="staff@example.com", password="12345"
+        )
+        self.client.login(username="staffuser", password="12345")
+        for name in ["Delta", "Alpha", "Echo", "Charlie", "Bravo"]:
+            Clinic.objects.create(name=f"{name} Clinic", address="123 Clinic St")
+        self.url = reverse("clinic-list")
+
+    def collect_pages(self, params=None):
+        names, query = [], "&".join(params or [])
+        while True:
+            response = self.client.get(f"{self.url}?{query}")
+            self.assertEqual(response.status_code, 200)
+            names.extend(clinic.name for clinic in response.context["clinics"])
+            query = response.context.get("next_query")
+            if not query:
+                return names
+
+    def test_pages_cover_every_row_once_in_order(self):
+        """Test following next cursors walks the whole list in name order"""
+        with mock.patch.object(ClinicListView, "paginate_by", 2):
+            names = self.collect_pages()
+        self.assertEqual(names, sorted(names))
+        self.assertEqual(len(names), 5)
+
+    def test_pages_are_stable_under_inserts(self):
+        """Test rows inserted before the cursor do not shift the next page"""
+        with mock.patch.object(ClinicListView, "paginate_by", 2):
+            first = self.client.get(self.url)
+            Clinic.objects.create(name="Aardvark Clinic", address="1 St")
+            second = self.client.get(f"{self.url}?{first.context['next_query']}")
+            previous = self.client.get(f"{self.url}?{second.context['previous_query']}")
+        self.assertEqual(
+            [clinic.name for clinic in second.context["clinics"]],
+            ["Charlie Clinic", "Delta Clinic"],
+        )
+        self.assertEqual(
+            [clinic.name for clinic in previous.context["clinics"]],
+            ["Alpha Clinic", "Bravo Clinic"],
+        )
+
+    def test_name_prefix_filter(self):
+        """Test the name prefix filter narrows the list"""
+        response = self.client.get(self.url, {"q": "ch"})
+        self.assertEqual(
+            [clinic.name for clinic in response.context["clinics"]],
+            ["Charlie Clinic"],
+        )
+        Clinic.objects.create(name="Ch_rlie%", address="1 St")
+        for prefix, names in [("CH_", ["Ch_rlie%"]), ("ch_rlie%", ["Ch_rlie%"])]:
+            response = self.client.get(self.url, {"q": prefix})
+            self.assertEqual(
+                [clinic.name for clinic in response.context["clinics"]], names
+            )
+
+    def test_lookup_filters(self):
+        """Test the clinic filter is a search box, not a list of every clinic"""
+        doctor = Doctor.objects.create(user=self.user, npi="1234567890")
+        clinic = Clinic.objects.get(name="Alpha Clinic")
+        response = self.client.get(reverse("patient-list"), {"clinic": clinic.id})
+        self.assertContains(response, f'name="clinic" value="{clinic.id}"')
+        self.assertContains(response, 'value="Alpha Clinic"')
+        self.assertNotContains(response, "Bravo Clinic")
+
+        response = self.client.get(reverse("ajax_search_clinics"), {"q": "b"})
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "id": Clinic.objects.get(name="Bravo Clinic").id,
+                    "name": "Bravo Clinic",
+                }
+            ],
+        )
+        response = self.client.get(reverse("ajax_search_doctors"), {"q": "x"})
+        self.assertEqual(response.json(), [])
+        response = self.client.get(reverse("ajax_search_doctors"), {"q": ""})
+        self.assertEqual([row["id"] for row in response.json()], [doctor.id])
+
+    def test_invalid_cursor(self):
+        """Test a malformed cursor returns 404"""
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+        # Well-formed cursors whose values do not fit the fields
+        for values in [["Alpha", "x"], ["Alpha", None], ["Alpha", 2**70], ["Alpha"]]:
+            response = self.client.get(self.url, {"cursor": encode_cursor(values)})
+            self.assertEqual(response.status_code, 404, values)
+
+    def test_patient_clinic_and_date_filters(self):
+        """Test patients are filtered by clinic and visit date range"""
+        doctor = Doctor.objects.create(user=self.user, npi="1234567890")
+        clinic = Clinic.objects.get(name="Alpha Clinic")
+        for index, visit_date in enumerate(["2024-01-10T09:00:00Z", None]):
+            user = User.objects.create_user(
+                username=f"patient{index}",
+                email=f"patient{index}@example.com",
+                password="12345",
+            )
+            patient = Patient.objects.create(
+                user=user,
+                date_of_birth="1990-01-01",
+                address="456 Patient St",
+                phone_number="555-555-5555",
+                ssn_last_four="1234",
+                gender="M",
+            )
+            if visit_date:
+                Visit.objects.create(
+                    patient=patient,
+                    doctor=doctor,
+                    clinic=clinic,
+                    visit_date=visit_date,
+                    doctor_notes="Routine checkup",
+                )
+                expected = patient
+
+        url = reverse("patient-list")
+        response = self.client.get(url, {"clinic": clinic.id})
+        self.assertEqual(list(response.context["patients"]), [expected])
+
+        response = self.client.get(
+            url, {"date_from": "2024-01-10", "date_to": "2024-01-10"}
+        )
+        self.assertEqual(list(response.context["patients"]), [expected])
+
+        response = self.client.get(url, {"date_from": "2024-01-11"})
+        self.assertEqual(list(response.context["patients"]), [])
+
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        doctor_user = User.objects.create_user(
+            username="doctoruser", email="doctor@example.com", password="12345"
+        )
+        patient_user = User.objects.create_user(
+            username="patientuser", email="patient@example.com", password="12345"
+        )
+        self.doctor = Doctor.objects.create(user=doctor_user, npi="1234567890")
+        self.patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth="1990-01-01",
+            address="456 Patient St",
+            phone_number="555-555-5555",
+            ssn_last_four="1234",
+            gender="M",
+        )
+        self.clinic = Clinic.objects.create(name="Test Clinic", address="123 Clinic St")
+        self.procedure = Procedure.objects.create(name="Filling", duration_minutes=30)
+        # Monday to Friday 09:00-12:00 with a coffee break, Christmas closed
+        self.affiliation = DoctorClinicAffiliation.objects.create(
+            doctor=self.doctor,
+            clinic=self.clinic,
+            office_address="123 Clinic St",
+            working_schedule=[
+                {
+                    "days": [0, 1, 2, 3, 4],
+                    "start": "09:00",
+                    "end": "12:00",
+                    "breaks": [{"start": "10:00", "end": "10:30"}],
+                },
+                {"start": "2024-12-21T09:00:00", "end": "2024-12-21T10:00:00"},
+                {"closed": True, "date": "2024-12-25"},
+            ],
+        )
+
+    def starts(self, slots):
+        return [slot.start.strftime("%H:%M") for slot in slots]
+
+    def test_weekly_rules_breaks_and_exceptions(self):
+        """Test recurring rules, breaks, one-off shifts and closed days"""
+        availability = get_availability(
+            self.affiliation, date(2024, 12, 20), days=6, procedure=self.procedure
+        )
+        self.assertEqual(len(availability), 6)
+        self.assertEqual(
+            self.starts(availability[date(2024, 12, 20)]),
+            ["09:00", "09:30", "10:30", "11:00", "11:30"],
+        )
+        self.assertEqual(
+            self.starts(availability[date(2024, 12, 21)]), ["09:00", "09:30"]
+        )
+        self.assertEqual(availability[date(2024, 12, 22)], [])
+        self.assertEqual(availability[date(2024, 12, 25)], [])
+
+    def test_booked_appointments_are_excluded(self):
+        """Test slots overlapping an existing appointment are not offered"""
+        Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            clinic=self.clinic,
+            procedure=Procedure.objects.create(name="Root Canal"),
+            appointment_date="2024-12-20T10:30:00Z",
+        )
+        availability = get_availability(
+            self.affiliation, date(2024, 12, 20), procedure=self.procedure
+        )
+        self.assertEqual(
+            self.starts(availability[date(2024, 12, 20)]),
+            ["09:00", "09:30", "11:30"],
+        )
+
+    def test_booked_intervals_overlap(self):
+        """Test the interval index against nested and adjacent bookings"""
+        booked = BookedIntervals([(1, 10), (2, 3), (12, 14)])
+        self.assertTrue(booked.overlaps(9, 11))
+        self.assertTrue(booked.overlaps(13, 20))
+        self.assertFalse(booked.overlaps(10, 12))
+        self.assertFalse(booked.overlaps(14, 15))
+        self.assertFalse(BookedIntervals([]).overlaps(0, 1))
+
+    def test_availability_endpoint(self):
+        """Test the endpoint returns every requested day in one response"""
+        response = self.client.get(
+            reverse("ajax_load_availability"),
+            {
+                "doctor_id": self.doctor.id,
+                "clinic_id": self.clinic.id,
+                "procedure_id": self.procedure.id,
+                "start": "2024-12-23",
+                "days": 3,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(list(data), ["2024-12-23", "2024-12-24", "2024-12-25"])
+        self.assertEqual(data["2024-12-23"][0]["start"], "2024-12-23T09:00:00+00:00")
+        self.assertEqual(data["2024-12-25"], [])
+
+    def test_timeslots_endpoint(self):
+        """Test the flat time slot list used by the booking form"""
+        response = self.client.get(
+            reverse("ajax_load_timeslots"),
+            {
+                "doctor_id": self.doctor.id,
+                "clinic_id": self.clinic.id,
+                "start": "2024-12-21",
+                "days": 1,
+            },
+        )
+        self.assertEqual(
+            response.json(),
+            [
+                {
+                    "start": "2024-12-21T09:00:00+00:00",
+                    "end": "2024-12-21T10:00:00+00:00",
+                }
+            ],
+        )
+
+
+class AvailabilitySlotTests(TestCase):
+    def setUp(self):
+        doctor_user = User.objects.create_user(
+            username="doctoruser", email="doctor@example.com", password="12345"
+        )
+        patient_user = User.objects.create_user(
+            username="patientuser", email="patient@example.com", password="12345"
+        )
+        self.doctor = Doctor.objects.create(user=doctor_user, npi="1234567890")
+        self.patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth="1990-01-01",
+            address="456 Patient St",
+            phone_number="555-555-5555",
+            ssn_last_four="1234",
+            gender="M",
+        )
+        self.clinic = Clinic.objects.create(name="Test Clinic", address="123 Clinic St")
+        self.procedure = Procedure.objects.create(name="Teeth Cleaning")
+        self.affiliation = DoctorClinicAffiliation.objects.create(
+            doctor=self.doctor,
+            clinic=self.clinic,
+            office_address="123 Clinic St",
+            working_schedule=[{"days": [0], "start": "09:00", "end": "12:00"}],
+        )
+        today = timezone.localdate()
+        self.monday = today + timedelta(days=7 - today.weekday())
+
+    def starts(self):
+        availability = get_availability(self.affiliation, self.monday)
+        return [slot.start.strftime("%H:%M") for slot in availability[self.monday]]
+
+    def book(self, hour):
+        return Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            clinic=self.clinic,
+            procedure=self.procedure,
+            appointment_date=timezone.make_aware(
+                datetime.combine(self.monday, time(hour))
+            ),
+        )
+
+    def test_affiliation_save_materializes_horizon(self):
+        """Test saving an affiliation stores its free windows ahead of time"""
+        self.affiliation.refresh_from_db()
+        self.assertEqual(self.affiliation.availability_until, horizon_end())
+        self.assertTrue(
+            AvailabilitySlot.objects.filter(
+                affiliation=self.affiliation, date=self.monday
+            ).exists()
+        )
+
+    def test_reads_are_a_single_range_scan(self):
+        """Test availability inside the horizon is read with one query"""
+        with self.assertNumQueries(1):
+            availability = get_availability(self.affiliation, self.monday, days=60)
+        self.assertEqual(len(availability[self.monday]), 3)
+
+    def test_bookings_update_stored_windows(self):
+        """Test creating, moving and deleting appointments refreshes the store"""
+        appointment = self.book(10)
+        self.assertEqual(self.starts(), ["09:00", "11:00"])
+
+        appointment.appointment_date = timezone.make_aware(
+            datetime.combine(self.monday, time(9))
+        )
+        appointment.save()
+        self.assertEqual(self.starts(), ["10:00", "11:00"])
+
+        appointment.delete()
+        self.assertEqual(self.starts(), ["09:00", "10:00", "11:00"])
+
+    def test_schedule_edit_rebuilds_windows(self):
+        """Test editing the schedule through the view replaces stored windows"""
+        response = self.client.post(
+            reverse("edit-affiliation", args=[self.affiliation.id]),
+            {
+                "doctor": self.doctor.id,
+                "office_address": "123 Clinic St",
+                "working_schedule": '[{"days": [0], "start": "14:00", "end": "16:00"}]',
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.affiliation.refresh_from_db()
+        self.assertEqual(self.starts(), ["14:00", "15:00"])
+
+    def test_rebuild_command_rolls_horizon_forward(self):
+        """Test the command extends affiliations that fell behind"""
+        DoctorClinicAffiliation.objects.update(availability_until=self.monday)
+        AvailabilitySlot.objects.filter(date__gte=self.monday).delete()
+
+        call_command("rebuild_availability", stdout=StringIO())
+
+        self.affiliation.refresh_from_db()
+        self.assertEqual(self.affiliation.availability_until, horizon_end())
+        self.assertEqual(self.starts(), ["09:00", "10:00", "11:00"])
+
+
+class BookingOptionsTests(TestCase):
+    def setUp(self):
+        self.procedure = Procedure.objects.create(name="Filling", duration_minutes=60)
+        self.other = Procedure.objects.create(name="Implant")
+        self.north = Clinic.objects.create(name="North", address="1 North St")
+        self.south = Clinic.objects.create(name="South", address="1 South St")
+        self.doctors = []
+        for number, last_name in enumerate(["Lopez", "Diaz", "Vega"]):
+            user = User.objects.create_user(
+                username=f"doctor{number}",
+                email=f"doctor{number}@example.com",
+                first_name="Ana",
+                last_name=last_name,
+            )
+            self.doctors.append(Doctor.objects.create(user=user, npi=f"10{number}"))
+        lopez, diaz, vega = self.doctors
+        lopez.specialties.add(self.procedure)
+        diaz.specialties.add(self.procedure, self.other)
+        vega.specialties.add(self.other)
+        schedule = [{"days": [0], "start": "09:00", "end": "11:00"}]
+        for doctor, clinic in [
+            (lopez, self.north),
+            (diaz, self.north),
+            (diaz, self.south),
+            (vega, self.south),
+        ]:
+            DoctorClinicAffiliation.objects.create(
+                doctor=doctor,
+                clinic=clinic,
+                office_address=clinic.address,
+                working_schedule=schedule,
+            )
+        today = timezone.localdate()
+        self.monday = today + timedelta(days=7 - today.weekday())
+
+    def test_options_list_matching_clinics_doctors_and_slots(self):
+        """Test the options hold the procedure's clinics, doctors and slots"""
+        lopez, diaz, _ = self.doctors
+        options = booking_options(self.procedure, start_date=self.monday)
+
+        self.assertEqual(
+            options["procedure"],
+            {"id": self.procedure.id, "name": "Filling", "duration_minutes": 60},
+        )
+        self.assertEqual(
+            options["clinics"],
+            [
+                {"id": self.north.id, "name": "North", "doctors": [diaz.id, lopez.id]},
+                {"id": self.south.id, "name": "South", "doctors": [diaz.id]},
+            ],
+        )
+        self.assertEqual(
+            options["doctors"],
+            [
+                {"id": diaz.id, "name": "Ana Diaz"},
+                {"id": lopez.id, "name": "Ana Lopez"},
+            ],
+        )
+        monday = self.monday.isoformat()
+        self.assertEqual(
+            options["availability"][self.north.id][lopez.id],
+            {monday: ["09:00", "10:00"]},
+        )
+        self.assertEqual(set(options["availability"][self.south.id]), {diaz.id})
+
+    def test_options_can_be_narrowed_to_a_clinic_and_doctor(self):
+        """Test clinic and doctor filters leave only their matches"""
+        _, diaz, _ = self.doctors
+        options = booking_options(self.procedure, clinic_id=self.south.id)
+        self.assertEqual(
+            [clinic["id"] for clinic in options["clinics"]], [self.south.id]
+        )
+
+        options = booking_options(self.procedure, doctor_id=diaz.id)
+        self.assertEqual(
+            [clinic["id"] for clinic in options["clinics"]],
+            [self.north.id, self.south.id],
+        )
+        self.assertEqual(options["doctors"], [{"id": diaz.id, "name": "Ana Diaz"}])
+
+    def test_query_count_does_not_grow_with_matches(self):
+        """Test the options take the same queries for any number of matches"""
+        booking_options(self.procedure)
+        with self.assertNumQueries(4):
+            booking_options(self.procedure, start_date=self.monday)
+
+        for number in range(5):
+            clinic = Clinic.objects.create(name=f"Clinic {number}")
+            DoctorClinicAffiliation.objects.create(
+                doctor=self.doctors[0],
+                clinic=clinic,
+                office_address="-",
+                working_schedule=[],
+            )
+        booking_options(self.procedure)
+        with self.assertNumQueries(4):
+            options = booking_options(self.procedure, start_date=self.monday)
+        self.assertEqual(len(options["clinics"]), 7)
+
+    def test_specialty_and_affiliation_changes_refresh_options(self):
+        """Test the cached matches follow specialties and affiliations"""
+        _, _, vega = self.doctors
+        booking_options(self.procedure)
+
+        vega.specialties.add(self.procedure)
+        options = booking_options(self.procedure)
+        self.assertEqual(options["clinics"][1]["doctors"][-1], vega.id)
+
+        DoctorClinicAffiliation.objects.create(
+            doctor=vega, clinic=self.north, office_address="-", working_schedule=[]
+        )
+        options = booking_options(self.procedure)
+        self.assertIn(vega.id, options["clinics"][0]["doctors"])
+
+        vega.specialties.clear()
+        options = booking_options(self.procedure)
+        self.assertNotIn(vega.id, [doctor["id"] for doctor in options["doctors"]])
+
+    def test_index_lookups(self):
+        """Test the index answers clinic and doctor lookups from its sets"""
+        lopez, diaz, vega = self.doctors
+        index = MatchingIndex(
+            [
+                (self.procedure.id, self.north.id, lopez.id),
+                (self.procedure.id, self.north.id, diaz.id),
+                (self.procedure.id, self.south.id, diaz.id),
+            ]
+        )
+        self.assertEqual(
+            index.options(self.procedure.id),
+            {self.north.id: {lopez.id, diaz.id}, self.south.id: {diaz.id}},
+        )
+        self.assertEqual(
+            index.options(self.procedure.id, clinic_id=self.south.id),
+            {self.south.id: {diaz.id}},
+        )
+        self.assertEqual(
+            index.options(self.procedure.id, doctor_id=lopez.id),
+            {self.north.id: {lopez.id}},
+        )
+        self.assertEqual(index.options(self.procedure.id, doctor_id=vega.id), {})
+        self.assertEqual(index.options(self.other.id), {})
+
+    def test_dropdown_lookups_use_the_index(self):
+        """Test the clinic and doctor dropdowns only query the names"""
+        lopez, diaz, vega = self.doctors
+        matching_options(self.procedure.id)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("ajax_load_clinics"), {"procedure_id": self.procedure.id}
+            )
+        self.assertEqual(
+            response.json(),
+            [
+                {"id": self.north.id, "name": "North"},
+                {"id": self.south.id, "name": "South"},
+            ],
+        )
+        query = {"procedure_id": self.procedure.id, "clinic_id": self.north.id}
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("ajax_load_doctors"), query)
+        self.assertEqual(
+            [doctor["id"] for doctor in response.json()], [diaz.id, lopez.id]
+        )
+
+        DoctorClinicAffiliation.objects.create(
+            doctor=vega, clinic=self.north, office_address="-", working_schedule=[]
+        )
+        vega.specialties.add(self.procedure)
+        response = self.client.get(reverse("ajax_load_doctors"), query)
+        self.assertEqual(
+            [doctor["id"] for doctor in response.json()], [diaz.id, lopez.id, vega.id]
+        )
+        response = self.client.get(reverse("ajax_load_doctors"), {"clinic_id": "x"})
+        self.assertEqual(response.json(), [])
+
+    async def test_ajax_lookups_are_async(self):
+        """Test the AJAX lookups are coroutines served under ASGI"""
+        for view in [
+            views.load_states,
+            views.load_cities,
+            views.load_geo_tree,
+            views.ajax_load_clinics,
+            views.ajax_load_doctors,
+            views.ajax_load_procedures,
+            views.ajax_load_timeslots,
+            views.ajax_load_availability,
+            views.ajax_booking_options,
+        ]:
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+
+        lopez, diaz, _ = self.doctors
+        response = await self.async_client.get(
+            reverse("ajax_load_doctors"),
+            {"procedure_id": self.procedure.id, "clinic_id": self.north.id},
+        )
+        self.assertEqual(
+            [doctor["id"] for doctor in response.json()], [diaz.id, lopez.id]
+        )
+        response = await self.async_client.get(
+            reverse("ajax_load_timeslots"),
+            {
+                "procedure_id": self.procedure.id,
+                "clinic_id": self.north.id,
+                "doctor_id": lopez.id,
+                "start": self.monday.isoformat(),
+                "days": 1,
+            },
+        )
+        self.assertEqual(len(response.json()), 2)
+        response = await self.async_client.get(
+            reverse("ajax_load_timeslots"), {"doctor_id": lopez.id, "clinic_id": 0}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_view_returns_options_in_one_request(self):
+        """Test the booking options endpoint and its validation"""
+        response = self.client.get(
+            reverse("ajax_booking_options"),
+            {"procedure_id": self.procedure.id, "start": self.monday.isoformat()},
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["clinics"]), 2)
+        lopez = str(self.doctors[0].id)
+        self.assertEqual(
+            data["availability"][str(self.north.id)][lopez][self.monday.isoformat()],
+            ["09:00", "10:00"],
+        )
+
+        response = self.client.get(
+            reverse("ajax_booking_options"), {"procedure_id": "x"}
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("ajax_booking_options"), {"procedure_id": 0})
+        self.assertEqual(response.status_code, 404)
+
+
+class BookingConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.clinic = Clinic.objects.create(name="Test Clinic", address="123 Clinic St")
+        self.procedure = Procedure.objects.create(name="Teeth Cleaning")
+        self.doctors = []
+        for index in range(2):
+            user = User.objects.create_user(
+                username=f"doctor{index}",
+                email=f"doctor{index}@example.com",
+            )
+            self.doctors.append(Doctor.objects.create(user=user, npi=f"npi{index}"))
+        self.patients = []
+        for index in range(8):
+            user = User.objects.create_user(
+                username=f"patient{index}",
+                email=f"patient{index}@example.com",
+            )
+            self.patients.append(
+                Patient.objects.create(
+                    user=user,
+                    date_of_birth="1990-01-01",
+                    address="456 Patient St",
+                    phone_number="555-555-5555",
+                    ssn_last_four="1234",
+                    gender="F",
+                )
+            )
+        self.slot = timezone.make_aware(datetime(2030, 1, 7, 9))
+
+    def hammer(self, bookings):
+        """Book every ``(patient, doctor, start)`` at once, one thread each."""
+        barrier = threading.Barrier(len(bookings))
+        outcomes = []
+
+        def attempt(patient, doctor, start):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        book_appointment(
+                            Appointment(
+                                patient=patient,
+                                doctor=doctor,
+                                clinic=self.clinic,
+                                procedure=self.procedure,
+                                appointment_date=start,
+                            )
+                        )
+                        outcomes.append("booked")
+                    except BookingConflict:
+                        outcomes.append("conflict")
+                    except OperationalError:
+                        # SQLite's shared test cache reports concurrent writers
+                        # as "table is locked" instead of waiting; retry
+                        time_module.sleep(0.01)
+                        continue
+                    break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=b) for b in bookings]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_exactly_one_booking_wins(self):
+        """Test concurrent bookings of one slot leave a single appointment"""
+        outcomes = self.hammer(
+            [(patient, self.doctors[0], self.slot) for patient in self.patients]
+        )
+        self.assertEqual(outcomes.count("booked"), 1)
+        self.assertEqual(outcomes.count("conflict"), len(self.patients) - 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_concurrent_overlapping_bookings(self):
+        """Test concurrent bookings of overlapping slots leave one appointment"""
+        outcomes = self.hammer(
+            [
+                (patient, self.doctors[0], self.slot + timedelta(minutes=5 * i))
+                for i, patient in enumerate(self.patients)
+            ]
+        )
+        self.assertEqual(outcomes.count("booked"), 1)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_overlapping_booking_conflicts(self):
+        """Test a slot overlapping an existing appointment is rejected"""
+        self.hammer([(self.patients[0], self.doctors[0], self.slot)])
+        outcomes = self.hammer(
+            [(self.patients[1], self.doctors[0], self.slot + timedelta(minutes=30))]
+        )
+        self.assertEqual(outcomes, ["conflict"])
+
+    def test_other_doctors_are_not_blocked(self):
+        """Test the same time can be booked with different doctors"""
+        outcomes = self.hammer(
+            [
+                (self.patients[i], doctor, self.slot)
+                for i, doctor in enumerate(self.doctors)
+            ]
+        )
+        self.assertEqual(outcomes, ["booked", "booked"])
+
+    def test_conflict_response(self):
+        """Test the booking form answers 409 when the slot overlaps a booking"""
+        self.hammer([(self.patients[0], self.doctors[0], self.slot)])
+        DoctorClinicAffiliation.objects.create(
+            doctor=self.doctors[0],
+            clinic=self.clinic,
+            office_address="123 Clinic St",
+            working_schedule=[],
+        )
+        response = self.client.post(
+            reverse("schedule-appointment", args=[self.patients[1].id]),
+            {
+                "clinic": self.clinic.id,
+                "doctor": self.doctors[0].id,
+                "procedure": self.procedure.id,
+                "appointment_date": "2030-01-07T09:30:00",
+            },
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, "no longer available", status_code=409)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+
+class GeoLookupTests(TestCase):
+    def setUp(self):
+        self.country = Country.objects.create(name="Peru")
+        self.lima = State.objects.create(country=self.country, name="Lima")
+        self.cusco = State.objects.create(country=self.country, name="Cusco")
+        City.objects.create(state=self.lima, name="Miraflores")
+        City.objects.create(state=self.lima, name="Barranco")
+        City.objects.create(state=self.cusco, name="Urubamba")
+
+    def test_states_are_cached_with_etag(self):
+        """Test repeated lookups skip the database and honour If-None-Match"""
+        url = reverse("ajax_load_states")
+        response = self.client.get(url, {"country_id": self.country.id})
+        self.assertEqual(
+            response.json(),
+            [
+                {"id": self.cusco.id, "name": "Cusco"},
+                {"id": self.lima.id, "name": "Lima"},
+            ],
+        )
+        self.assertIn("max-age", response["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, {"country_id": self.country.id})
+        self.assertEqual(cached.json(), response.json())
+
+        not_modified = self.client.get(
+            url, {"country_id": self.country.id}, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_changes_invalidate_cache(self):
+        """Test saving a city changes both the payload and the ETag"""
+        url = reverse("ajax_load_cities")
+        before = self.client.get(url, {"state_id": self.lima.id})
+        City.objects.create(state=self.lima, name="Surco")
+        after = self.client.get(
+            url, {"state_id": self.lima.id}, HTTP_IF_NONE_MATCH=before["ETag"]
+        )
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after["ETag"], before["ETag"])
+        self.assertEqual(
+            [city["name"] for city in after.json()],
+            ["Barranco", "Miraflores", "Surco"],
+        )
+
+    def test_country_tree(self):
+        """Test the bulk endpoint returns the whole state/city tree"""
+        response = self.client.get(
+            reverse("ajax_load_geo_tree"), {"country_id": self.country.id}
+        )
+        self.assertEqual(
+            response.json(),
+            [
+                [self.cusco.id, "Cusco", [[mock.ANY, "Urubamba"]]],
+                [
+                    self.lima.id,
+                    "Lima",
+                    [[mock.ANY, "Barranco"], [mock.ANY, "Miraflores"]],
+                ],
+            ],
+        )
+
+    def test_invalid_id(self):
+        """Test a missing or malformed id returns an empty list"""
+        response = self.client.get(reverse("ajax_load_states"), {"country_id": "x"})
+        self.assertEqual(response.json(), [])
+
+
+class LoadDataTests(TestCase):
+    def write_geo_file(self, data):
+        file = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        with file:
+            json.dump(data, file)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def test_bulk_load_is_incremental(self):
+        """Test bulk mode only inserts rows that do not exist yet"""
+        peru = {
+            "name": "Peru",
+            "states": [{"name": "Lima", "cities": [{"name": "Miraflores"}]}],
+        }
+        call_command(
+            "load_data", file=self.write_geo_file([peru]), bulk=True, stdout=StringIO()
+        )
+
+        peru["states"][0]["cities"].append({"name": "Barranco"})
+        peru["states"].append({"name": "Cusco", "cities": [{"name": "Urubamba"}]})
+        output = StringIO()
+        call_command(
+            "load_data",
+            file=self.write_geo_file([peru, {"name": "Chile", "states": []}]),
+            bulk=True,
+            batch_size=1,
+            stdout=output,
+        )
+
+        self.assertEqual(Country.objects.count(), 2)
+        self.assertEqual(State.objects.count(), 2)
+        self.assertEqual(
+            sorted(City.objects.values_list("name", flat=True)),
+            ["Barranco", "Miraflores", "Urubamba"],
+        )
+        self.assertIn("rows/sec", output.getvalue())
+
+    def test_iter_json_array_streams_elements(self):
+        """Test the streaming reader across tiny chunk boundaries"""
+        document = '[ {"name": "a]"} , {"name": "b", "states": [1, 2]} ]'
+        for chunk_size in (1, 3, 64):
+            self.assertEqual(
+                list(iter_json_array(StringIO(document), chunk_size)),
+                json.loads(document),
+            )
+        with self.assertRaises(ValueError):
+            list(iter_json_array(StringIO('[{"name": "a"}'), 4))
+
+
+class GenerateDataTests(TestCase):
+    options = {
+        "clinics": 3,
+        "doctors": 4,
+        "patients": 10,
+        "years": 2,
+        "visits_per_year": 2,
+        "appointments": 1,
+        "batch_size": 4,
+        "stdout": StringIO(),
+    }
+
+    def test_generates_seeded_dataset(self):
+        """Test the generator is deterministic and keeps the data consistent"""
+        call_command("generate_data", seed=7, **self.options)
+
+        self.assertEqual(Clinic.objects.count(), 3)
+        self.assertEqual(Doctor.objects.count(), 4)
+        self.assertEqual(Patient.objects.count(), 10)
+        self.assertEqual(Visit.objects.count(), 40)
+        self.assertEqual(
+            Visit.procedures_done.through.objects.count(), Visit.objects.count()
+        )
+        self.assertFalse(get_user_model().objects.first().has_usable_password())
+        # Every visit and appointment is at a clinic the doctor works at
+        for model in (Visit, Appointment):
+            self.assertFalse(
+                model.objects.exclude(
+                    Exists(
+                        DoctorClinicAffiliation.objects.filter(
+                            doctor=OuterRef("doctor"), clinic=OuterRef("clinic")
+                        )
+                    )
+                ).exists()
+            )
+        self.assertTrue(AvailabilitySlot.objects.exists())
+
+        names = list(Clinic.objects.order_by("pk").values_list("name", flat=True))
+        Clinic.objects.all().delete()
+        get_user_model().objects.all().delete()
+        call_command("generate_data", seed=7, **self.options)
+        self.assertEqual(
+            list(Clinic.objects.order_by("pk").values_list("name", flat=True)), names
+        )
+
+        with self.assertRaises(CommandError):
+            call_command("generate_data", seed=7, **self.options)
+
+
+def doctor_names(request):
+    # Reads each doctor's user on its own: an N+1 for the profiler to flag
+    names = [doctor.user.get_full_name() for doctor in Doctor.objects.all()]
+    return JsonResponse(names, safe=False)
+
+
+urlpatterns = [
+    path("doctor-names/", doctor_names, name="doctor-names"),
+    path("", include(settings.ROOT_URLCONF)),
+]
+
+
+@override_settings(
+    MIDDLEWARE=["core.profiling.ProfilingMiddleware", *settings.MIDDLEWARE],
+    ROOT_URLCONF="core.tests",
+    TEMPLATES=[
+        {**settings.TEMPLATES[0], "BACKEND": "core.profiling.ProfiledTemplates"}
+    ],
+)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_profiling_stats()
+        self.addCleanup(cache.clear)
+        self.clinic = Clinic.objects.create(name="Clinic", address="Street 1")
+        self.procedure = Procedure.objects.create(name="Cleaning")
+        for index in range(3):
+            doctor = Doctor.objects.create(
+                user=User.objects.create_user(
+                    username=f"doctor{index}", email=f"doctor{index}@example.com"
+                ),
+                npi=f"npi{index}",
+            )
+            doctor.specialties.add(self.procedure)
+            DoctorClinicAffiliation.objects.create(
+                doctor=doctor,
+                clinic=self.clinic,
+                office_address="Office",
+                working_schedule=[],
+            )
+        self.staff = User.objects.create_user(
+            username="staff", email="staff@example.com", is_staff=True
+        )
+
+    def test_server_timing_and_duplicates(self):
+        """Test the header reports queries and flags the N+1 lookup"""
+        with self.assertLogs("core.profiling", "WARNING"):
+            response = self.client.get(reverse("doctor-names"))
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('dup;desc="3 duplicate queries"', timing)
+        self.assertRegex(timing, r"total;dur=[\d.]+")
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("clinic-list"))
+        self.assertRegex(response["Server-Timing"], r"tpl;dur=(?!0\.0)[\d.]+")
+
+        report = {row["name"]: row for row in profiling_stats()}
+        self.assertEqual(report["doctor-names"]["requests"], 1)
+        self.assertEqual(report["doctor-names"]["duplicate_queries"], 3)
+        self.assertGreater(report["clinic-list"]["mean_template_ms"], 0)
+
+    def test_report_endpoint_and_command(self):
+        """Test the numbers are staff-only and can be dumped and reset"""
+        self.client.get(reverse("ajax_load_clinics"))
+        self.assertEqual(self.client.get(reverse("profiling-report")).status_code, 302)
+
+        self.client.force_login(self.staff)
+        report = self.client.get(reverse("profiling-report")).json()
+        self.assertIn("ajax_load_clinics", [row["name"] for row in report["urls"]])
+        self.assertEqual(report["connections"][0]["alias"], "default")
+
+        output = StringIO()
+        call_command("profiling_report", reset=True, stdout=output)
+        self.assertIn("ajax_load_clinics", output.getvalue())
+        self.assertEqual(profiling_stats(), [])
+
+    async def test_async_requests_and_batched_writes(self):
+        """Test async requests are profiled and written once per flush"""
+        with mock.patch("core.profiling.FLUSH_SECONDS", 60):
+            with mock.patch("core.profiling.cache", wraps=cache) as shared:
+                for _ in range(3):
+                    response = await self.async_client.get(
+                        reverse("ajax_load_clinics"),
+                        {"procedure_id": self.procedure.id},
+                    )
+                    # The queries run in a sync_to_async thread
+                    self.assertRegex(
+                        response["Server-Timing"], r'desc="[1-9]\d* queries"'
+                    )
+                # Nothing is written until the worker flushes its totals
+                self.assertEqual(shared.set.mock_calls, [])
+                report = await sync_to_async(profiling_stats)()
+        self.assertEqual(report[0]["requests"], 3)
+        self.assertEqual(len(shared.set.mock_calls), 2)
+
+        # Sync views too, which the ASGI handler runs in another thread
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse("clinic-list"))
+        self.assertRegex(response["Server-Timing"], r'desc="[1-9]\d* queries"')
+
+
+class ConnectionMetricsTests(TestCase):
+    def setUp(self):
+        reset_connection_stats()
+        self.addCleanup(reset_connection_stats)
+
+    def default_stats(self):
+        return next(row for row in connection_stats() if row["alias"] == "default")
+
+    def test_checkouts_reuse_and_age(self):
+        """Test connections opened and reused by requests are counted"""
+        wrapper = connections["default"]
+        connection_created.send(sender=type(wrapper), connection=wrapper)
+        request_started.send(sender=self.__class__)
+        request_started.send(sender=self.__class__)
+
+        stats = self.default_stats()
+        self.assertEqual(stats["mode"], "per-request")
+        self.assertEqual(stats["checkouts"], 1)
+        self.assertEqual(stats["reused"], 2)
+        self.assertEqual(stats["held"], 1)
+        self.assertGreaterEqual(stats["oldest_held_seconds"], 0)
+
+    def test_modes_and_pool_stats(self):
+        """Test the mode follows the settings and pools report their stats"""
+        self.assertEqual(connection_mode({"CONN_MAX_AGE": 0}), "per-request")
+        self.assertEqual(connection_mode({"CONN_MAX_AGE": None}), "persistent")
+        self.assertEqual(connection_mode({"CONN_MAX_AGE": 60}), "persistent")
+
+        pool = mock.Mock(**{"get_stats.return_value": {"pool_size": 4}})
+        wrapper = connections["default"]
+        with mock.patch.dict(wrapper.settings_dict["OPTIONS"], {"pool": True}):
+            with mock.patch.object(wrapper, "pool", pool, create=True):
+                stats = self.default_stats()
+        self.assertEqual(stats["mode"], "pool")
+        self.assertEqual(stats["pool"], {"pool_size": 4})
+
+
+@override_settings(REPLICA_DATABASES=["replica1"], REPLICA_PIN_SECONDS=10)
+class ReplicaRoutingTests(TestCase):
+    def request(self, method="get", path="/clinics/", **kwargs):
+        request = getattr(RequestFactory(), method)(path, **kwargs)
+        request.resolver_match = mock.Mock(func=ClinicListView.as_view())
+        return request
+
+    def test_read_only_views_are_eligible(self):
+        """Test lists, details, AJAX lookups and read API views use replicas"""
+        for view in [
+            ClinicListView.as_view(),
+            DoctorDetailView.as_view(),
+            views.ajax_load_doctors,
+            views.load_states,
+            api_views.PatientListView.as_view(),
+            api_views.VisitDetailView.as_view(),
+        ]:
+            self.assertTrue(reads_from_replica(view), view)
+        for view in [
+            views.ClinicUpdateView.as_view(),
+            views.ClinicCreateView.as_view(),
+            views.schedule_appointment,
+            views.add_visit,
+            api_views.PatientBulkView.as_view(),
+        ]:
+            self.assertFalse(reads_from_replica(view), view)
+
+    def test_reads_stay_on_the_primary_after_a_write(self):
+        """Test writes, unsafe methods and the pin cookie keep reads primary"""
+        router = ReplicaRouter()
+        state = RequestState(self.request())
+        self.assertEqual(state.read_database(), "replica1")
+        with mock.patch("core.replicas._state") as current:
+            current.get.return_value = state
+            self.assertEqual(router.db_for_read(Clinic), "replica1")
+            self.assertIsNone(router.db_for_write(Clinic))
+            self.assertIsNone(router.db_for_read(Clinic))
+
+        self.assertIsNone(RequestState(self.request("post")).read_database())
+        request = self.request(HTTP_COOKIE=f"{PIN_COOKIE}=1")
+        self.assertIsNone(RequestState(request).read_database())
+        # Outside of a request everything goes to the primary
+        self.assertIsNone(router.db_for_read(Clinic))
+        self.assertFalse(router.allow_migrate("replica1", "core"))
+
+    def test_middleware_pins_after_writes(self):
+        """Test the pin cookie follows unsafe requests and writes"""
+
+        def write(request):
+            ReplicaRouter().db_for_write(Clinic)
+            return HttpResponse()
+
+        response = ReplicaMiddleware(lambda request: HttpResponse())(self.request())
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response = ReplicaMiddleware(write)(self.request())
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 10)
+
+        response = ReplicaMiddleware(lambda request: HttpResponse())(
+            self.request("post")
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_cache_loaders_read_from_the_primary(self):
+        """Test the geo and matching caches are not filled from a replica"""
+        state = RequestState(self.request())
+        cache.clear()
+        # "replica1" is not a configured connection: routing to it would fail
+        with mock.patch("core.replicas._state") as current:
+            current.get.return_value = state
+            self.assertEqual(ReplicaRouter().db_for_read(Clinic), "replica1")
+            self.assertEqual(matching_triples(), [])
+            for kind in ["states", "cities", "tree"]:
+                self.assertEqual(geo_lookup(kind, 1)[1], [])
+
+
+@skipUnless(settings.REPLICA_DATABASES, "Set SQL_REPLICAS to test against a replica")
+class ReplicaDatabaseTests(test.TransactionTestCase):
+    """Route real requests to a replica, e.g. of two SQLite databases::
+
+        SQL_REPLICAS=replica.sqlite3 python manage.py test \\
+            core.tests.ReplicaDatabaseTests
+
+    The replica mirrors the test database, whose uncommitted rows it cannot
+    see, so the other test cases keep their reads on the primary (see
+    ``core.testing``).
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.replica = settings.REPLICA_DATABASES[0]
+        user = User.objects.create_user(username="staff", email="staff@example.com")
+        user.user_permissions.set(Permission.objects.filter(codename="add_clinic"))
+        self.client.force_login(user)
+        self.procedure = Procedure.objects.create(name="Teeth Cleaning")
+        doctor = Doctor.objects.create(
+            user=User.objects.create_user(
+                username="doctor", email="doctor@example.com"
+            ),
+            npi="1234567890",
+        )
+        doctor.specialties.add(self.procedure)
+        self.clinic = Clinic.objects.create(name="South", address="2 St")
+        DoctorClinicAffiliation.objects.create(
+            doctor=doctor,
+            clinic=self.clinic,
+            office_address="2 St",
+            working_schedule=[],
+        )
+
+    def queries(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connections[self.replica]) as replica:
+            with CaptureQueriesContext(connections["default"]) as primary:
+                response = getattr(self.client, method)(*args, **kwargs)
+        return response, len(primary), len(replica)
+
+    def test_reads_move_to_the_replica_until_the_pin_expires(self):
+        """Test a list reads from the replica, except right after a write"""
+        response, primary, replica = self.queries("get", reverse("clinic-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+        city = City.objects.create(
+            name="Lima",
+            state=State.objects.create(
+                name="Lima", country=Country.objects.create(name="Peru")
+            ),
+        )
+        response, _, replica = self.queries(
+            "post",
+            reverse("clinic-create"),
+            {
+                "name": "North",
+                "address": "1 St",
+                "phone_number": "555",
+                "country": city.state.country_id,
+                "state": city.state_id,
+                "city": city.id,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(replica, 0)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        response, primary, replica = self.queries("get", reverse("clinic-list"))
+        self.assertContains(response, "North")
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+        del self.client.cookies[PIN_COOKIE]
+        response, primary, replica = self.queries(
+            "get", reverse("ajax_load_clinics"), {"procedure_id": self.procedure.id}
+        )
+        self.assertEqual(
+            response.json(), [{"id": self.clinic.id, "name": self.clinic.name}]
+        )
+        self.assertGreater(replica, 0)
+
+
+class QueryPlanTests(TestCase):
+    """Run ``EXPLAIN`` on every query behind the views and AJAX endpoints.
+
+    Tables that only ever hold a handful of rows may be scanned; for every
+    other table a sequential scan means an index is missing. On PostgreSQL
+    ``enable_seqscan`` is turned off so that a ``Seq Scan`` in the plan means
+    no index could be used, whatever the size of the seeded data. On SQLite
+    only a ``SEARCH`` finds rows through an index; a ``SCAN``, even ``USING
+    INDEX``, reads all of it unless ``ORDERED_SCANS`` accepts it.
+    """
+
+    SMALL_TABLES = {"core_procedure", "core_country"}
+
+    # Index scans accepted on a URL: they walk an unfiltered list in its
+    # display order, one page at a time, and stop at the end of the page
+    ORDERED_SCANS = {
+        "/clinics/": {("core_clinic", "core_clinic_name_bde63aae")},
+        "/doctors/": {("users_user", "user_name_idx")},
+        "/patients/": {("users_user", "user_name_idx")},
+        # The API lists are in primary key order
+        "/api/patients/": {("core_patient", None)},
+        "/api/doctors/": {("core_doctor", None)},
+        "/api/clinics/": {("core_clinic", None)},
+        "/api/visits/": {("core_visit", None)},
+        "/api/appointments/": {("core_appointment", None)},
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="staffuser", email="staff@example.com", password="12345"
+        )
+        country = Country.objects.create(name="Peru")
+        cls.state = State.objects.create(country=country, name="Lima")
+        city = City.objects.create(state=cls.state, name="Miraflores")
+        cls.procedure = Procedure.objects.create(name="Teeth Cleaning")
+        cls.clinic = Clinic.objects.create(
+            name="Test Clinic",
+            address="123 Clinic St",
+            country=country,
+            state=cls.state,
+            city=city,
+        )
+        cls.doctor = Doctor.objects.create(user=cls.user, npi="1234567890")
+        cls.doctor.specialties.add(cls.procedure)
+        DoctorClinicAffiliation.objects.create(
+            doctor=cls.doctor,
+            clinic=cls.clinic,
+            office_address="123 Clinic St",
+            working_schedule=[
+                {"days": [0, 1, 2, 3, 4], "start": "09:00", "end": "17:00"}
+            ],
+        )
+        for index in range(3):
+            patient = Patient.objects.create(
+                user=User.objects.create_user(
+                    username=f"patient{index}", email=f"patient{index}@example.com"
+                ),
+                date_of_birth="1990-01-01",
+                address="456 Patient St",
+                phone_number="555-555-5555",
+                ssn_last_four="1234",
+                gender="F",
+            )
+            visit = Visit.objects.create(
+                patient=patient,
+                doctor=cls.doctor,
+                clinic=cls.clinic,
+                visit_date=f"2024-09-0{index + 1}T09:00:00Z",
+                doctor_notes="Routine checkup",
+            )
+            visit.procedures_done.add(cls.procedure)
+            Appointment.objects.create(
+                patient=patient,
+                doctor=cls.doctor,
+                clinic=cls.clinic,
+                procedure=cls.procedure,
+                appointment_date=f"2030-01-0{index + 1}T09:00:00Z",
+            )
+        cls.patient = patient
+
+    def setUp(self):
+        self.client.login(username="staffuser", password="12345")
+        # Building the matching index reads every affiliation on purpose,
+        # once per change; the lookups are checked against a warm index
+        matching_index()
+
+    def sequential_scans(self, sql):
+        """Return the ``(table, index)`` of every full scan in the plan.
+
+        ``index`` is ``None`` for a scan of the table itself. On SQLite a
+        ``SCAN ... USING [COVERING] INDEX`` reads the whole index, only a
+        ``SEARCH`` uses it to find rows.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute(f"EXPLAIN {sql}")
+                plan = [row[0] for row in cursor.fetchall()]
+                return [
+                    (line.split("Seq Scan on ")[1].split()[0], None)
+                    for line in plan
+                    if "Seq Scan on " in line
+                ]
+            # Scans of derived tables (window/subquery wrappers) are fine
+            tables = set(connection.introspection.table_names(cursor))
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            scans = []
+            for *_, detail in cursor.fetchall():
+                words = detail.split()
+                if words[0] != "SCAN" or words[1] not in tables:
+                    continue
+                index = words[words.index("INDEX") + 1] if "INDEX" in words else None
+                scans.append((words[1], index))
+            return scans
+
+    def assertNoSequentialScans(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params or {})
+        self.assertLess(response.status_code, 400, url)
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            accepted = self.ORDERED_SCANS.get(url, set()) if not params else set()
+            scans = {
+                (table, index)
+                for table, index in self.sequential_scans(sql)
+                if table not in self.SMALL_TABLES and (table, index) not in accepted
+            }
+            self.assertFalse(scans, f"{url} scans {scans}:\n{sql}")
+
+    def test_list_views(self):
+        """Test list pages, with and without filters, use indexes"""
+        self.assertNoSequentialScans(reverse("patient-list"))
+        self.assertNoSequentialScans(
+            reverse("patient-list"),
+            {"q": "pa", "clinic": self.clinic.id, "date_from": "2024-09-01"},
+        )
+        self.assertNoSequentialScans(reverse("doctor-list"))
+        self.assertNoSequentialScans(reverse("doctor-list"), {"clinic": self.clinic.id})
+        self.assertNoSequentialScans(reverse("clinic-list"))
+        self.assertNoSequentialScans(reverse("clinic-list"), {"doctor": self.doctor.id})
+
+    def test_detail_views(self):
+        """Test detail pages use indexes"""
+        self.assertNoSequentialScans(reverse("patient-detail", args=[self.patient.id]))
+        self.assertNoSequentialScans(
+            reverse("patient-timeline", args=[self.patient.id])
+        )
+        self.assertNoSequentialScans(reverse("doctor-detail", args=[self.doctor.id]))
+        self.assertNoSequentialScans(reverse("clinic-detail", args=[self.clinic.id]))
+        self.assertNoSequentialScans(
+            reverse("schedule-appointment", args=[self.patient.id])
+        )
+
+    def test_ajax_endpoints(self):
+        """Test the AJAX lookups use indexes"""
+        ids = {
+            "procedure_id": self.procedure.id,
+            "clinic_id": self.clinic.id,
+            "doctor_id": self.doctor.id,
+        }
+        self.assertNoSequentialScans(
+            reverse("ajax_load_states"), {"country_id": self.state.country_id}
+        )
+        self.assertNoSequentialScans(
+            reverse("ajax_load_cities"), {"state_id": self.state.id}
+        )
+        self.assertNoSequentialScans(
+            reverse("ajax_load_geo_tree"), {"country_id": self.state.country_id}
+        )
+        self.assertNoSequentialScans(reverse("ajax_load_clinics"), ids)
+        self.assertNoSequentialScans(reverse("ajax_load_doctors"), ids)
+        self.assertNoSequentialScans(reverse("ajax_load_procedures"), ids)
+        self.assertNoSequentialScans(reverse("ajax_load_timeslots"), ids)
+        self.assertNoSequentialScans(
+            reverse("ajax_load_availability"), {**ids, "start": "2024-09-02"}
+        )
+        self.assertNoSequentialScans(
+            reverse("ajax_booking_options"), {**ids, "start": "2024-09-02"}
+        )
+        self.assertNoSequentialScans(
+            reverse("ajax_booking_options"), {"procedure_id": self.procedure.id}
+        )
+        self.assertNoSequentialScans(reverse("ajax_search_clinics"), {"q": "te"})
+        self.assertNoSequentialScans(reverse("ajax_search_doctors"), {"q": "st"})
+
+    def test_api_lists(self):
+        """Test the API lists use indexes"""
+        self.user.user_permissions.set(
+            Permission.objects.filter(codename__startswith="view_")
+        )
+        for name in ["patient", "doctor", "clinic", "visit", "appointment"]:
+            self.assertNoSequentialScans(reverse(f"api-{name}-list"))
+            # Later pages start from the cursor
+            response = self.client.get(reverse(f"api-{name}-list"), {"page_size": 1})
+            if response.json()["next"]:
+                self.assertNoSequentialScans(response.json()["next"])
@@ -0,0 +1,128 @@
+"""Patient timeline: visits and appointments merged in date order, newest first.
+
+Each page runs one query per kind (plus one for the procedures of the
+visits): every source is read with its own keyset condition and ``LIMIT``,
+then the sorted results are merged. Entries are ordered by ``(date, kind,
+pk)`` descending, so the cursor of the last entry of a page says exactly
+where each source resumes.
+"""
+
+import heapq
+from collections import namedtuple
+
+from django.db.models import Q
+from django.db.models.functions import Left, Length
+from django.http import Http404
+
+from .models import Appointment, Visit
+from .pagination import cursor_values, decode_cursor, encode_cursor, keyset_filter
+
+TIMELINE_PAGE_SIZE = 20
+# Long doctor notes are only loaded in full when asked for
+NOTES_PREVIEW_LENGTH = 200
+
+TimelineEntry = namedtuple("TimelineEntry", ["kind", "date", "item"])
+
+# Ties on the same date list appointments before visits
+KIND_RANK = {"visit": 0, "appointment": 1}
+
+
+def _visits(patient, full_notes):
+    queryset = (
+        Visit.objects.filter(patient=patient)
+        .select_related("doctor__user", "clinic")
+        .prefetch_related("procedures_done")
+        .annotate(notes_length=Length("doctor_notes"))
+    )
+    if not full_notes:
+        queryset = queryset.defer("doctor_notes").annotate(
+            notes_preview=Left("doctor_notes", NOTES_PREVIEW_LENGTH)
+        )
+    return queryset, "visit_date"
+
+
+def _appointments(patient, full_notes):
+    queryset = Appointment.objects.filter(patient=patient).select_related(
+        "doctor__user", "clinic", "procedure"
+    )
+    return queryset, "appointment_date"
+
+
+SOURCES = {"visit": _visits, "appointment": _appointments}
+
+
+def _after(date_field, rank, cursor):
+    """Rows of a source ordered after the cursor ``(date, rank, pk)``."""
+    date, cursor_rank, pk = cursor
+    if rank < cursor_rank:
+        return Q(**{f"{date_field}__lte": date})
+    if rank > cursor_rank:
+        return Q(**{f"{date_field}__lt": date})
+    return keyset_filter([date_field, "pk"], [date, pk], "previous")
+
+
+def _parse_cursor(cursor):
+    _, values = decode_cursor(cursor)
+    try:
+        date, rank, pk = values
+    except ValueError:
+        raise Http404("Invalid cursor")
+    if type(rank) is not int or rank not in KIND_RANK.values():
+        raise Http404("Invalid cursor")
+    # Visits and appointments have the same types of date and pk
+    date, pk = cursor_values(Visit, ("visit_date", "pk"), [date, pk])
+    return date, rank, pk
+
+
+def timeline_page(patient, cursor=None, page_size=TIMELINE_PAGE_SIZE, full_notes=False):
+    """Return ``(entries, next_cursor)`` for a page of the patient's timeline.
+
+    Visits are loaded without their ``doctor_notes`` unless ``full_notes``;
+    they carry ``notes_preview`` and ``notes_length`` instead.
+    """
+    after = _parse_cursor(cursor) if cursor else None
+    sources = []
+    for kind, source in SOURCES.items():
+        queryset, date_field = source(patient, full_notes)
+        rank = KIND_RANK[kind]
+        if after:
+            queryset = queryset.filter(_after(date_field, rank, after))
+        rows = queryset.order_by(f"-{date_field}", "-pk")[: page_size + 1]
+        sources.append(
+            [TimelineEntry(kind, getattr(row, date_field), row) for row in rows]
+        )
+
+    entries = list(
+        heapq.merge(
+            *sources,
+            key=lambda entry: (entry.date, KIND_RANK[entry.kind], entry.item.pk),
+            reverse=True,
+        )
+    )[: page_size + 1]
+    next_cursor = None
+    if len(entries) > page_size:
+        entries = entries[:page_size]
+        last = entries[-1]
+        next_cursor = encode_cursor([last.date, KIND_RANK[last.kind], last.item.pk])
+    return entries, next_cursor
+
+
+def entry_data(entry):
+    item = entry.item
+    data = {
+        "type": entry.kind,
+        "id": item.pk,
+        "date": entry.date.isoformat(),
+        "doctor": item.doctor.user.get_full_name(),
+        "clinic": item.clinic.name,
+    }
+    if entry.kind == "visit":
+        data["procedures"] = [p.name for p in item.procedures_done.all()]
+        if hasattr(item, "notes_preview"):
+            data["notes"] = item.notes_preview
+            data["notes_truncated"] = item.notes_length > NOTES_PREVIEW_LENGTH
+        else:
+            data["notes"], data["notes_truncated"] = item.doctor_notes, False
+    else:
+        data["procedure"] = item.procedure.name
+    return data
@@ -1,5 +1,9 @@
-from django.contrib.auth.views import LoginView, LogoutView
-from django.urls import path, include
+from django.contrib.auth.views import (
+    LoginView,
+    LogoutView,
+    PasswordResetConfirmView,
+)
+from django.urls import path, include, reverse_lazy
 from .views import (
     UserProfileView,
     EditUserProfileView,
@@ -18,6 +22,7 @@ from .views import (
     PatientCreateView,
     load_states,
     load_cities,
+    load_geo_tree,
     edit_affiliation,
     create_affiliation,
     delete_affiliation,
@@ -27,12 +32,27 @@ from .views import (
     ajax_load_procedures,
     ajax_load_timeslots,
     ajax_load_clinics,
+    ajax_load_availability,
+    ajax_booking_options,
+    ajax_search_clinics,
+    ajax_search_doctors,
+    profiling_report,
+    patient_timeline,
+    export_history,
 )
 
 urlpatterns = [
     path("", HomePageView.as_view(), name="home"),
     path("login/", LoginView.as_view(template_name="core/login.html"), name="login"),
     path("logout/", LogoutView.as_view(next_page="login"), name="logout"),
+    path(
+        "invite/<uidb64>/<token>/",
+        PasswordResetConfirmView.as_view(
+            template_name="core/invite_accept.html",
+            success_url=reverse_lazy("login"),
+        ),
+        name="invite-accept",
+    ),
     path("accounts/profile/", UserProfileView.as_view(), name="profile"),
     path("accounts/profile/edit/", EditUserProfileView.as_view(), name="profile-edit"),
     path("clinics/", ClinicListView.as_view(), name="clinic-list"),
@@ -56,6 +76,8 @@ urlpatterns = [
     ),
     path("patients/", PatientListView.as_view(), name="patient-list"),
     path("patients/<int:pk>/", PatientDetailView.as_view(), name="patient-detail"),
+    path("patients/<int:pk>/timeline/", patient_timeline, name="patient-timeline"),
+    path("exports/<str:kind>/", export_history, name="export-history"),
     path("patients/<int:pk>/edit/", PatientUpdateView.as_view(), name="patient-update"),
     path("patients/<int:patient_id>/add-visit/", add_visit, name="add-visit"),
     path(
@@ -70,9 +92,19 @@ urlpatterns = [
     path("doctors/new/", DoctorCreateView.as_view(), name="doctor-create"),
     path("ajax/load-states/", load_states, name="ajax_load_states"),
     path("ajax/load-cities/", load_cities, name="ajax_load_cities"),
+    path("ajax/load-geo-tree/", load_geo_tree, name="ajax_load_geo_tree"),
     path("ajax/load-clinics/", ajax_load_clinics, name="ajax_load_clinics"),
     path("ajax/load-doctors/", ajax_load_doctors, name="ajax_load_doctors"),
     path("ajax/load-procedures/", ajax_load_procedures, name="ajax_load_procedures"),
     path("ajax/load-timeslots/", ajax_load_timeslots, name="ajax_load_timeslots"),
+    path(
+        "ajax/load-availability/",
+        ajax_load_availability,
+        name="ajax_load_availability",
+    ),
+    path("ajax/booking-options/", ajax_booking_options, name="ajax_booking_options"),
+    path("ajax/search-clinics/", ajax_search_clinics, name="ajax_search_clinics"),
+    path("ajax/search-doctors/", ajax_search_doctors, name="ajax_search_doctors"),
+    path("profiling/", profiling_report, name="profiling-report"),
     path("api/", include("api.urls")),
 ]
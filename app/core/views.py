@@ -1,8 +1,14 @@
 import json
-from datetime import datetime
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from urllib.parse import urlencode
+from datetime import date, datetime, time, timedelta
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.generic import (
     CreateView,
     ListView,
@@ -16,14 +22,16 @@ from .models import (
     Clinic,
     Procedure,
     DoctorClinicAffiliation,
+    DoctorPatientAffiliation,
     Patient,
     Visit,
     Appointment,
-    State,
-    City,
 )
-from django.db.models import Count, Q, F
+from django.db.models import Exists, OuterRef, Prefetch
+from django.db.models.functions import Coalesce
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
 from .forms import (
     ClinicForm,
     ClinicUpdateForm,
@@ -34,26 +42,68 @@ from .forms import (
     VisitForm,
     AppointmentForm,
     DoctorClinicAffiliationForm,
+    PatientFilterForm,
+    DoctorFilterForm,
+    ClinicFilterForm,
+    ExportFilterForm,
 )
+from .availability import get_availability, normalize_schedule
+from .booking import BookingConflict, book_appointment, booking_options
+from .connection_metrics import connection_stats
+from .export import EXPORTS, FORMATS, aiter_chunks, stream_export
+from .geo import geo_lookup
+from .matching import matching_options
+from .pagination import KeysetPaginationMixin
+from .profiling import stats as profiling_stats
+from .replicas import replica_reads
+from .search import filter_prefix
+from .timeline import entry_data, timeline_page
 
 User = get_user_model()
 
+DEFAULT_AVAILABILITY_DAYS = 14
+
+# Browsers revalidate geo lookups with their ETag after this many seconds
+GEO_MAX_AGE = 5 * 60
+
+# Matches listed by the clinic and doctor search boxes
+LOOKUP_LIMIT = 20
+
 
 class HomePageView(LoginRequiredMixin, TemplateView):
     template_name = "core/home.html"
     login_url = "login"
 
 
-def load_states(request):
-    country_id = request.GET.get("country_id")
-    states = State.objects.filter(country_id=country_id).order_by("name")
-    return JsonResponse(list(states.values("id", "name")), safe=False)
+async def geo_response(request, kind, parent_id):
+    try:
+        parent_id = int(parent_id)
+    except (TypeError, ValueError):
+        return JsonResponse([], safe=False)
+
+    etag, data = await sync_to_async(geo_lookup)(kind, parent_id)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(data, safe=False)
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=GEO_MAX_AGE)
+    return response
+
+
+@replica_reads
+async def load_states(request):
+    return await geo_response(request, "states", request.GET.get("country_id"))
+
 
+@replica_reads
+async def load_cities(request):
+    return await geo_response(request, "cities", request.GET.get("state_id"))
 
-def load_cities(request):
-    state_id = request.GET.get("state_id")
-    cities = City.objects.filter(state_id=state_id).order_by("name")
-    return JsonResponse(list(cities.values("id", "name")), safe=False)
+
+# Whole state -> city tree of a country in one compact response
+@replica_reads
+async def load_geo_tree(request):
+    return await geo_response(request, "tree", request.GET.get("country_id"))
 
 
 class UserProfileView(LoginRequiredMixin, TemplateView):
@@ -76,23 +126,96 @@ class EditUserProfileView(LoginRequiredMixin, UpdateView):
         return self.request.user
 
 
-class PatientListView(ListView):
+class FilterFormMixin:
+    """Bind ``filter_form_class`` to the query string of a list view."""
+
+    filter_form_class = None
+
+    def get_filters(self):
+        self.filter_form = self.filter_form_class(self.request.GET)
+        if self.filter_form.is_valid():
+            return {k: v for k, v in self.filter_form.cleaned_data.items() if v}
+        return {}
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["filter_form"] = self.filter_form
+        return context
+
+
+def day_bounds(date_from=None, date_to=None):
+    # Turn an inclusive date range into aware datetime bounds so filters hit
+    # the datetime column (and its index) directly instead of ``__date``.
+    start = end = None
+    if date_from:
+        start = timezone.make_aware(datetime.combine(date_from, time.min))
+    if date_to:
+        end = timezone.make_aware(
+            datetime.combine(date_to + timedelta(days=1), time.min)
+        )
+    return start, end
+
+
+class PatientListView(FilterFormMixin, KeysetPaginationMixin, ListView):
     model = Patient
     template_name = "core/patient_list.html"
     context_object_name = "patients"
+    filter_form_class = PatientFilterForm
+    keyset_fields = ("user__last_name", "user__first_name", "pk")
 
     def get_queryset(self):
-        queryset = super().get_queryset()
-        for patient in queryset:
+        queryset = Patient.objects.select_related("user")
+        filters = self.get_filters()
+        if "q" in filters:
+            queryset = filter_prefix(queryset, "user__last_name", filters["q"])
+
+        # Clinic, doctor and date filters match patients with either a visit
+        # or an appointment fitting all of them.
+        related = {k: filters[k] for k in ("clinic", "doctor") if k in filters}
+        start, end = day_bounds(filters.get("date_from"), filters.get("date_to"))
+        if related or start or end:
+            visits = Visit.objects.filter(patient=OuterRef("pk"), **related)
+            appointments = Appointment.objects.filter(patient=OuterRef("pk"), **related)
+            if start:
+                visits = visits.filter(visit_date__gte=start)
+                appointments = appointments.filter(appointment_date__gte=start)
+            if end:
+                visits = visits.filter(visit_date__lt=end)
+                appointments = appointments.filter(appointment_date__lt=end)
+            queryset = queryset.filter(Exists(visits) | Exists(appointments))
+
+        # Latest visit and earliest appointment are fetched with one windowed
+        # prefetch each, so the page costs the same number of queries no
+        # matter how many patients are listed.
+        return queryset.prefetch_related(
+            Prefetch(
+                "visit_set",
+                queryset=Visit.objects.select_related("doctor__user")
+                .prefetch_related("procedures_done")
+                .order_by("-visit_date")[:1],
+                to_attr="recent_visits",
+            ),
+            Prefetch(
+                "appointment_set",
+                queryset=Appointment.objects.select_related(
+                    "doctor__user", "procedure"
+                ).order_by("appointment_date")[:1],
+                to_attr="upcoming_appointments",
+            ),
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        for patient in context["patients"]:
             patient.last_visit = (
-                Visit.objects.filter(patient=patient).order_by("-visit_date").first()
+                patient.recent_visits[0] if patient.recent_visits else None
             )
             patient.next_appointment = (
-                Appointment.objects.filter(patient=patient)
-                .order_by("appointment_date")
-                .first()
+                patient.upcoming_appointments[0]
+                if patient.upcoming_appointments
+                else None
             )
-        return queryset
+        return context
 
 
 class PatientCreateView(LoginRequiredMixin, CreateView):
@@ -133,16 +256,25 @@ class PatientDetailView(LoginRequiredMixin, DetailView):
     template_name = "core/patient_detail.html"
     context_object_name = "patient"
 
+    def get_queryset(self):
+        return Patient.objects.select_related("user")
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["visits"] = Visit.objects.filter(patient=self.object).order_by(
-            "-visit_date"
-        )
         context["next_appointment"] = (
-            Appointment.objects.filter(patient=self.object)
+            Appointment.objects.filter(
+                patient=self.object, appointment_date__gte=timezone.now()
+            )
+            .select_related("doctor__user", "clinic", "procedure")
             .order_by("appointment_date")
             .first()
         )
+        # One page of visits and appointments, newest first
+        context["timeline"], next_cursor = timeline_page(
+            self.object, self.request.GET.get("cursor")
+        )
+        if next_cursor:
+            context["next_query"] = urlencode({"cursor": next_cursor})
         return context
 
 
@@ -172,20 +304,32 @@ class ClinicCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy("clinic-list")
 
 
-class ClinicListView(LoginRequiredMixin, ListView):
+class ClinicListView(
+    LoginRequiredMixin, FilterFormMixin, KeysetPaginationMixin, ListView
+):
     model = Clinic
     template_name = "core/clinic_list.html"
     context_object_name = "clinics"
+    filter_form_class = ClinicFilterForm
+    keyset_fields = ("name", "pk")
 
     def get_queryset(self):
-        return Clinic.objects.annotate(
-            num_doctors=Count("doctorclinicaffiliation__doctor", distinct=True),
-            num_patients=Count(
-                # Count distinct patients with either a visit or appointment to this clinic
-                "visit__patient",
-                filter=Q(visit__clinic=F("pk")) | Q(appointment__clinic=F("pk")),
-                distinct=True,
-            ),
+        queryset = Clinic.objects.select_related("city", "state")
+        filters = self.get_filters()
+        if "q" in filters:
+            queryset = filter_prefix(queryset, "name", filters["q"])
+        if "doctor" in filters:
+            # An IN subquery lets the database start from the doctor's
+            # affiliations rather than walk every clinic in name order
+            queryset = queryset.filter(
+                pk__in=DoctorClinicAffiliation.objects.filter(
+                    doctor=filters["doctor"]
+                ).values("clinic")
+            )
+        # Counters maintained in ClinicStats, see core.stats
+        return queryset.annotate(
+            num_doctors=Coalesce("stats__num_doctors", 0),
+            num_patients=Coalesce("stats__num_patients", 0),
         )
 
 
@@ -194,33 +338,28 @@ class ClinicDetailView(LoginRequiredMixin, DetailView):
     template_name = "core/clinic_detail.html"
     context_object_name = "clinic"
 
+    def get_queryset(self):
+        return Clinic.objects.select_related("city", "state", "country")
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        # Get all doctor affiliations for this clinic
-        clinic = self.get_object()
-        affiliations = DoctorClinicAffiliation.objects.filter(clinic=clinic)
-
-        # Parse the working schedules for each affiliation
-        affiliation_data = []
-        for affiliation in affiliations:
-            try:
-                working_schedule = affiliation.working_schedule  # Parse JSON schedule
-            except ValueError:
-                working_schedule = []  # If there's an error parsing, use an empty list
-
-            # Add affiliation id to the data
-            affiliation_data.append(
-                {
-                    "id": affiliation.id,  # Add the ID for reverse URL matching
-                    "doctor": affiliation.doctor.user.get_full_name(),
-                    "office_address": affiliation.office_address,
-                    "working_schedule": working_schedule,  # Pass the schedule as a list of dicts
-                }
-            )
-
-        # Add the parsed affiliation data to the context
-        context["affiliations"] = affiliation_data
+        # One query for the affiliations with their doctors' names
+        affiliations = (
+            DoctorClinicAffiliation.objects.filter(clinic=self.object)
+            .select_related("doctor__user")
+            .order_by("doctor__user__last_name", "doctor__user__first_name", "pk")
+        )
+        context["affiliations"] = [
+            {
+                "id": affiliation.id,
+                "doctor": affiliation.doctor.user.get_full_name(),
+                "office_address": affiliation.office_address,
+                # Stored as a list or as a JSON string, whatever the form saved
+                "working_schedule": normalize_schedule(affiliation.working_schedule),
+            }
+            for affiliation in affiliations
+        ]
         return context
 
 
@@ -231,20 +370,28 @@ class ClinicUpdateView(LoginRequiredMixin, UpdateView):
     success_url = reverse_lazy("clinic-list")
 
 
-class DoctorListView(ListView):
+class DoctorListView(FilterFormMixin, KeysetPaginationMixin, ListView):
     model = Doctor
     template_name = "core/doctor_list.html"
     context_object_name = "doctors"
+    filter_form_class = DoctorFilterForm
+    keyset_fields = ("user__last_name", "user__first_name", "pk")
 
     def get_queryset(self):
-        return Doctor.objects.annotate(
-            num_clinics=Count("clinics", distinct=True),
-            num_patients=Count(
-                # Count distinct patients with either a visit or appointment to this clinic
-                "visit__patient",
-                filter=Q(visit__doctor=F("pk")) | Q(appointment__doctor=F("pk")),
-                distinct=True,
-            ),
+        queryset = Doctor.objects.select_related("user").prefetch_related("specialties")
+        filters = self.get_filters()
+        if "q" in filters:
+            queryset = filter_prefix(queryset, "user__last_name", filters["q"])
+        if "clinic" in filters:
+            queryset = queryset.filter(
+                pk__in=DoctorClinicAffiliation.objects.filter(
+                    clinic=filters["clinic"]
+                ).values("doctor")
+            )
+        # Counters maintained in DoctorStats, see core.stats
+        return queryset.annotate(
+            num_clinics=Coalesce("stats__num_clinics", 0),
+            num_patients=Coalesce("stats__num_patients", 0),
         )
 
 
@@ -277,15 +424,43 @@ class DoctorCreateView(CreateView):
         return super().form_valid(form)
 
 
-class DoctorDetailView(LoginRequiredMixin, DetailView):
+class DoctorDetailView(LoginRequiredMixin, KeysetPaginationMixin, DetailView):
     model = Doctor
     template_name = "core/doctor_detail.html"
     context_object_name = "doctor"
+    # The patient roster is paginated, the doctor itself is not
+    keyset_fields = ("user__last_name", "user__first_name", "pk")
+
+    def get_queryset(self):
+        return Doctor.objects.select_related("user").prefetch_related("specialties")
+
+    def get_patients(self):
+        return Patient.objects.filter(
+            pk__in=DoctorPatientAffiliation.objects.filter(doctor=self.object).values(
+                "patient"
+            )
+        ).select_related("user")
 
     def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["affiliations"] = self.object.clinics.all()
-        context["patients"] = self.object.patients.all()
+        _, page, patients, is_paginated = self.paginate_queryset(
+            self.get_patients(), self.paginate_by
+        )
+        context = super().get_context_data(
+            patients=patients, page_obj=page, is_paginated=is_paginated, **kwargs
+        )
+        # Each clinic with the doctor's office and schedule there, in one query
+        context["affiliations"] = [
+            {
+                "clinic": affiliation.clinic,
+                "office_address": affiliation.office_address,
+                "working_schedule": normalize_schedule(affiliation.working_schedule),
+            }
+            for affiliation in DoctorClinicAffiliation.objects.filter(
+                doctor=self.object
+            )
+            .select_related("clinic")
+            .order_by("clinic__name", "pk")
+        ]
         return context
 
 
@@ -425,6 +600,17 @@ def add_visit(request, patient_id):
     return render(request, "core/add_visit.html", {"form": form, "patient": patient})
 
 
+def keep_submitted_choices(form):
+    # A form shown again lists the submitted clinic and doctor only, the page
+    # loads the others once a procedure is picked
+    for name in ("clinic", "doctor"):
+        field = form.fields[name]
+        selected = form.cleaned_data.get(name)
+        field.queryset = (
+            field.queryset.filter(pk=selected.pk) if selected else field.queryset.none()
+        )
+
+
 def schedule_appointment(request, patient_id):
     patient = get_object_or_404(Patient, pk=patient_id)
 
@@ -444,12 +630,28 @@ def schedule_appointment(request, patient_id):
         if form.is_valid():
             appointment = form.save(commit=False)
             appointment.patient = patient  # Link the appointment to the patient
-            appointment.save()
+            try:
+                book_appointment(appointment)
+            except BookingConflict:
+                # Someone else took the slot between loading and submitting
+                form.add_error(
+                    "appointment_date",
+                    "This time slot is no longer available. Please pick another one.",
+                )
+                keep_submitted_choices(form)
+                return render(
+                    request,
+                    "core/schedule_appointment.html",
+                    {"form": form, "patient": patient},
+                    status=409,
+                )
             return redirect("patient-detail", pk=patient_id)
+        keep_submitted_choices(form)
     else:
         form = AppointmentForm()
-        # Populate clinics and procedures in GET request
-        form.fields["clinic"].queryset = Clinic.objects.all()
+        # Clinics and doctors are filled in by the page once a procedure is
+        # picked, so there is no need to list every clinic up front
+        form.fields["clinic"].queryset = Clinic.objects.none()
         form.fields["doctor"].queryset = Doctor.objects.none()  # Empty initially
         form.fields["procedure"].queryset = Procedure.objects.all()
 
@@ -458,63 +660,217 @@ def schedule_appointment(request, patient_id):
     )
 
 
-def ajax_load_clinics(request):
-    procedure_id = request.GET.get("procedure_id")
-    clinics = Clinic.objects.filter(
-        doctorclinicaffiliation__doctor__specialties__id=procedure_id
-    ).distinct()
-    clinic_data = [{"id": clinic.id, "name": clinic.name} for clinic in clinics]
+# The AJAX lookups below are async views: under ASGI, a worker keeps serving
+# other requests while they wait on the database
+@replica_reads
+async def ajax_load_clinics(request):
+    try:
+        procedure_id = int(request.GET.get("procedure_id", ""))
+    except ValueError:
+        return JsonResponse([], safe=False)
+    # The matches come from the in-memory index, only the names from the
+    # database
+    clinic_ids = await sync_to_async(matching_options)(procedure_id)
+    clinics = (
+        Clinic.objects.filter(pk__in=list(clinic_ids))
+        .order_by("name")
+        .values_list("id", "name")
+    )
+    clinic_data = [{"id": clinic_id, "name": name} async for clinic_id, name in clinics]
     return JsonResponse(clinic_data, safe=False)
 
 
 # View to filter doctors based on the selected clinic
-def ajax_load_doctors(request):
-    procedure_id = request.GET.get("procedure_id")
-    clinic_id = request.GET.get("clinic_id")
-    doctors = Doctor.objects.filter(
-        clinics__id=clinic_id, specialties__id=procedure_id
-    ).distinct()
+@replica_reads
+async def ajax_load_doctors(request):
+    try:
+        procedure_id = int(request.GET.get("procedure_id", ""))
+        clinic_id = int(request.GET.get("clinic_id", ""))
+    except ValueError:
+        return JsonResponse([], safe=False)
+    options = await sync_to_async(matching_options)(procedure_id, clinic_id)
+    doctors = (
+        Doctor.objects.filter(pk__in=list(options.get(clinic_id, ())))
+        .select_related("user")
+        .order_by("user__last_name", "user__first_name")
+    )
     doctor_data = [
-        {"id": doctor.id, "name": doctor.user.get_full_name()} for doctor in doctors
+        {"id": doctor.id, "name": doctor.user.get_full_name()}
+        async for doctor in doctors
+    ]
+    return JsonResponse(doctor_data, safe=False)
+
+
+# Matches of the clinic and doctor search boxes of the list filters
+@replica_reads
+async def ajax_search_clinics(request):
+    clinics = (
+        filter_prefix(Clinic.objects.all(), "name", request.GET.get("q", ""))
+        .order_by("name")
+        .values_list("id", "name")[:LOOKUP_LIMIT]
+    )
+    clinic_data = [{"id": clinic_id, "name": name} async for clinic_id, name in clinics]
+    return JsonResponse(clinic_data, safe=False)
+
+
+@replica_reads
+async def ajax_search_doctors(request):
+    doctors = filter_prefix(
+        Doctor.objects.select_related("user"),
+        "user__last_name",
+        request.GET.get("q", ""),
+    ).order_by("user__last_name", "user__first_name")[:LOOKUP_LIMIT]
+    doctor_data = [
+        {"id": doctor.id, "name": doctor.user.get_full_name()}
+        async for doctor in doctors
     ]
     return JsonResponse(doctor_data, safe=False)
 
 
 # View to filter procedures based on the selected doctor
-def ajax_load_procedures(request):
+@replica_reads
+async def ajax_load_procedures(request):
     doctor_id = request.GET.get("doctor_id")
-    doctor = Doctor.objects.get(id=doctor_id)
+    doctor = await Doctor.objects.aget(id=doctor_id)
     procedures = doctor.specialties.all()
     procedure_data = [
-        {"id": procedure.id, "name": procedure.name} for procedure in procedures
+        {"id": procedure.id, "name": procedure.name} async for procedure in procedures
     ]
     return JsonResponse(procedure_data, safe=False)
 
 
+async def availability_request(request):
+    """Resolve the affiliation, procedure and date range of a slots request."""
+    affiliation = await aget_object_or_404(
+        DoctorClinicAffiliation,
+        doctor_id=request.GET.get("doctor_id"),
+        clinic_id=request.GET.get("clinic_id"),
+    )
+    procedure_id = request.GET.get("procedure_id")
+    procedure = (
+        await aget_object_or_404(Procedure, pk=procedure_id) if procedure_id else None
+    )
+    start = request.GET.get("start")
+    start_date = date.fromisoformat(start) if start else timezone.localdate()
+    days = int(request.GET.get("days", DEFAULT_AVAILABILITY_DAYS))
+    return affiliation, procedure, start_date, days
+
+
+def slot_data(slot):
+    return {"start": slot.start.isoformat(), "end": slot.end.isoformat()}
+
+
 # View to filter available time slots based on doctor and clinic
-def ajax_load_timeslots(request):
-    doctor_id = request.GET.get("doctor_id")
-    clinic_id = request.GET.get("clinic_id")
+@replica_reads
+async def ajax_load_timeslots(request):
+    try:
+        affiliation, procedure, start_date, days = await availability_request(request)
+    except ValueError:
+        return JsonResponse({"error": "Invalid start or days"}, status=400)
+
+    availability = await sync_to_async(get_availability)(
+        affiliation, start_date, days, procedure
+    )
+    available_slots = [
+        slot_data(slot) for slots in availability.values() for slot in slots
+    ]
+    return JsonResponse(available_slots, safe=False)
+
+
+# Available slots for several days at once, grouped by date
+@replica_reads
+async def ajax_load_availability(request):
+    try:
+        affiliation, procedure, start_date, days = await availability_request(request)
+    except ValueError:
+        return JsonResponse({"error": "Invalid start or days"}, status=400)
+
+    availability = await sync_to_async(get_availability)(
+        affiliation, start_date, days, procedure
+    )
+    return JsonResponse(
+        {
+            day.isoformat(): [slot_data(slot) for slot in slots]
+            for day, slots in availability.items()
+        }
+    )
 
-    # Get the doctor's working schedule in the selected clinic
-    affiliation = DoctorClinicAffiliation.objects.get(
-        doctor_id=doctor_id, clinic_id=clinic_id
+
+# Clinics, doctors and their first free slots for a procedure, in one request
+# instead of the load-clinics / load-doctors / load-timeslots cascade
+@replica_reads
+async def ajax_booking_options(request):
+    try:
+        procedure_id = int(request.GET.get("procedure_id", ""))
+        clinic_id, doctor_id = (
+            int(request.GET[name]) if request.GET.get(name) else None
+            for name in ("clinic_id", "doctor_id")
+        )
+        start = request.GET.get("start")
+        start_date = date.fromisoformat(start) if start else None
+        days = int(request.GET["days"]) if request.GET.get("days") else None
+    except ValueError:
+        return JsonResponse(
+            {"error": "Invalid procedure, clinic, doctor, start or days"}, status=400
+        )
+
+    procedure = await aget_object_or_404(Procedure, pk=procedure_id)
+    options = await sync_to_async(booking_options)(
+        procedure, clinic_id, doctor_id, start_date, days
     )
-    working_schedule = affiliation.working_schedule  # Assuming it's a JSON object
+    return JsonResponse(options)
 
-    # Fetch booked appointments to exclude them
-    booked_appointments = Appointment.objects.filter(
-        doctor_id=doctor_id, clinic_id=clinic_id
-    ).values_list("appointment_date", flat=True)
 
-    # Calculate available slots, excluding booked ones
-    available_slots = []
-    for entry in working_schedule:
-        start = datetime.fromisoformat(entry["start"])
-        end = datetime.fromisoformat(entry["end"])
+# Per-URL numbers aggregated by ProfilingMiddleware, and the database
+# connections of the worker serving this request
+@staff_member_required
+def profiling_report(request):
+    return JsonResponse({"urls": profiling_stats(), "connections": connection_stats()})
 
-        # Check if this slot is booked
-        if start not in booked_appointments:
-            available_slots.append({"start": start.isoformat(), "end": end.isoformat()})
 
-    return JsonResponse(available_slots, safe=False)
+# Patient timeline as JSON; ?notes=full includes the whole doctor notes
+@login_required
+def patient_timeline(request, pk):
+    patient = get_object_or_404(Patient, pk=pk)
+    entries, next_cursor = timeline_page(
+        patient,
+        request.GET.get("cursor"),
+        full_notes=request.GET.get("notes") == "full",
+    )
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params["cursor"] = next_cursor
+        next_url = f"{request.path}?{params.urlencode()}"
+    return JsonResponse(
+        {"results": [entry_data(entry) for entry in entries], "next": next_url}
+    )
+
+
+# Visit or appointment history as a CSV or NDJSON download, streamed as it is
+# read; ?format=csv|ndjson&clinic=&date_from=&date_to=
+@login_required
+def export_history(request, kind):
+    if kind not in EXPORTS:
+        raise Http404("Unknown export")
+    model = EXPORTS[kind][0]
+    if not request.user.has_perm(f"core.view_{model._meta.model_name}"):
+        raise PermissionDenied
+    form = ExportFilterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    filters = form.cleaned_data
+    start, end = day_bounds(filters["date_from"], filters["date_to"])
+    chunks = stream_export(
+        kind, filters["format"], start=start, end=end, clinic=filters["clinic"]
+    )
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(
+        chunks,
+        content_type=FORMATS[filters["format"]][0],
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{kind}.{filters["format"]}"'
+    )
+    return response
@@ -35,7 +35,15 @@ AUTH_USER_MODEL = "users.User"
 
 AUTHENTICATION_BACKENDS = ["users.backends.EmailBackend"]
 
-SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+# Base URL of the links in outgoing emails, such as invitations
+SITE_URL = os.environ.get("SITE_URL", "http://localhost:8000")
+
+EMAIL_BACKEND = os.environ.get(
+    "EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend"
+)
+DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "webmaster@localhost")
+
+SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 
 # Application definition
 
@@ -56,6 +64,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # Outside the session middleware, so that session writes pin the user
+    "core.replicas.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -64,6 +74,11 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Opt-in query and latency instrumentation, see core.profiling
+PROFILING = os.environ.get("PROFILING", default="False") == "True"
+if PROFILING:
+    MIDDLEWARE.insert(0, "core.profiling.ProfilingMiddleware")
+
 ROOT_URLCONF = "dental_management.urls"
 
 TEMPLATES = [
@@ -81,6 +96,8 @@ TEMPLATES = [
         },
     },
 ]
+if PROFILING:
+    TEMPLATES[0]["BACKEND"] = "core.profiling.ProfiledTemplates"
 
 WSGI_APPLICATION = "dental_management.wsgi.application"
 
@@ -107,6 +124,61 @@ DATABASES = {
     }
 }
 
+# Reuse database connections instead of opening one per request. On
+# PostgreSQL, each worker process takes its connections from a psycopg 3 pool
+# unless SQL_POOL=False. Otherwise SQL_CONN_MAX_AGE keeps a worker thread's
+# connection for that many seconds, checked before reuse with
+# SQL_CONN_HEALTH_CHECKS=True; it has no effect under the ASGI entrypoint,
+# where every request runs in a new thread.
+POSTGRESQL = DATABASES["default"]["ENGINE"].endswith("postgresql")
+if os.environ.get("SQL_POOL", default=str(POSTGRESQL)) == "True":
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("SQL_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("SQL_POOL_MAX_SIZE", 10)),
+            "timeout": float(os.environ.get("SQL_POOL_TIMEOUT", 10)),
+        }
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("SQL_CONN_MAX_AGE", 0))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = (
+        os.environ.get("SQL_CONN_HEALTH_CHECKS", default="False") == "True"
+    )
+
+# Read replicas of the default database, as space-separated host[:port]
+# (or database files with SQLite). The read-only views read from them,
+# except for REPLICA_PIN_SECONDS after the user wrote, see core.replicas.
+REPLICA_DATABASES = []
+for index, replica in enumerate(os.environ.get("SQL_REPLICAS", "").split(), 1):
+    if DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+        location = {"NAME": replica}
+    else:
+        location = dict(zip(["HOST", "PORT"], replica.split(":")))
+    DATABASES[f"replica{index}"] = {
+        **DATABASES["default"],
+        **location,
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICA_DATABASES.append(f"replica{index}")
+
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.environ.get("SQL_REPLICA_PIN_SECONDS", 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Use a shared backend (e.g. Redis) in production so that cache invalidation
+# reaches every worker process.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -15,6 +15,8 @@ python manage.py collectstatic --noinput
 
 python manage.py migrate
 
-gunicorn dental_management.wsgi:application --bind 0.0.0.0:8000
+# Uvicorn workers serve the async views without holding a worker per request;
+# gunicorn reads the worker count from WEB_CONCURRENCY
+gunicorn dental_management.asgi:application -k uvicorn_worker.UvicornWorker --bind 0.0.0.0:8000
 
 exec "$@"
\ No newline at end of file
@@ -11,59 +11,71 @@ document.addEventListener('DOMContentLoaded', function () {
         cityElement.disabled = false;
     }
 
-    // Function to load states dynamically based on the selected country
-    function loadStates(countryId, selectedStateId = null) {
-        const url = '/ajax/load-states/';
-        fetch(url + '?country_id=' + countryId)
+    // State -> city trees already fetched, keyed by country ID
+    const geoTrees = {};
+
+    // Fetch the whole state/city tree of a country once (cached by the browser
+    // via ETag) so changing the state needs no further round trip
+    function loadTree(countryId) {
+        if (geoTrees[countryId]) {
+            return Promise.resolve(geoTrees[countryId]);
+        }
+        return fetch('/ajax/load-geo-tree/?country_id=' + countryId)
             .then(response => response.json())
             .then(data => {
+                geoTrees[countryId] = data;
+                return data;
+            });
+    }
+
+    // Function to load states dynamically based on the selected country
+    function loadStates(countryId, selectedStateId = null, selectedCityId = null) {
+        loadTree(countryId)
+            .then(tree => {
                 stateElement.innerHTML = '<option value="">Select a state</option>';
                 cityElement.innerHTML = '<option value="">Select a state first</option>';
                 stateElement.disabled = false;
                 cityElement.disabled = true;
 
                 // Populate the state dropdown and preselect if applicable
-                data.forEach(state => {
+                tree.forEach(([stateId, stateName]) => {
                     const option = document.createElement('option');
-                    option.value = state.id;
-                    option.textContent = state.name;
+                    option.value = stateId;
+                    option.textContent = stateName;
                     stateElement.appendChild(option);
 
                     // Preserve the selected state
-                    if (selectedStateId && state.id == selectedStateId) {
+                    if (selectedStateId && stateId == selectedStateId) {
                         option.selected = true;
-                        stateElement.disabled = false;
                     }
                 });
 
-                // After loading states, trigger loading cities if a state is preselected
-                if (selectedStateId && selectedCityId == null) {
-                    loadCities(selectedStateId, cityElement.value);  // Pass selected city ID
+                // After loading states, fill the cities of a preselected state
+                if (selectedStateId) {
+                    loadCities(selectedStateId, selectedCityId);
                 }
             })
             .catch(error => console.error('Error fetching states:', error));
     }
 
-    // Function to load cities dynamically based on the selected state
+    // Function to load cities of the selected state from the cached tree
     function loadCities(stateId, selectedCityId = null) {
-        const url = '/ajax/load-cities/';
-        fetch(url + '?state_id=' + stateId)
-            .then(response => response.json())
-            .then(data => {
+        loadTree(countryElement.value)
+            .then(tree => {
+                const state = tree.find(([id]) => id == stateId);
                 cityElement.innerHTML = '<option value="">Select a city</option>';
                 cityElement.disabled = false;
 
                 // Populate the city dropdown and preselect if applicable
-                data.forEach(city => {
+                (state ? state[2] : []).forEach(([cityId, cityName]) => {
                     const option = document.createElement('option');
-                    option.value = city.id;
-                    option.textContent = city.name;
+                    option.value = cityId;
+                    option.textContent = cityName;
                     cityElement.appendChild(option);
 
                     // Preserve the selected city
-                    if (selectedCityId && city.id == selectedCityId) {
+                    if (selectedCityId && cityId == selectedCityId) {
                         option.selected = true;
-                        cityElement.disabled = false;
                     }
                 });
             })
@@ -99,9 +111,7 @@ document.addEventListener('DOMContentLoaded', function () {
     const selectedStateId = stateElement.value;
     const selectedCityId = cityElement.value;
     if (selectedCountryId) {
-        loadStates(selectedCountryId, selectedStateId);  // Preload states and select current state
-        if (selectedStateId) {
-            loadCities(selectedStateId, selectedCityId);  // Preload cities and select current city
-        }
+        // Preload states and cities and keep the current selection
+        loadStates(selectedCountryId, selectedStateId, selectedCityId);
     }
 });
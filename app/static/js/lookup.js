@@ -0,0 +1,40 @@
+document.addEventListener('DOMContentLoaded', function () {
+    // Search boxes of LookupWidget: list the rows starting with what is typed
+    // and put the ID of the picked one in the hidden input that is submitted
+    document.querySelectorAll('input[data-lookup-url]').forEach(function (input) {
+        const hidden = input.form.querySelector(
+            'input[type="hidden"][name="' + input.dataset.lookupName + '"]'
+        );
+        const matches = document.getElementById(input.getAttribute('list'));
+        let timer = null;
+
+        input.addEventListener('input', function () {
+            const option = Array.from(matches.options).find(
+                option => option.value === input.value
+            );
+            hidden.value = option ? option.dataset.id : '';
+            clearTimeout(timer);
+            if (option || !input.value) {
+                return;
+            }
+            const query = input.value;
+            // Wait for a pause in typing before asking the server
+            timer = setTimeout(function () {
+                fetch(input.dataset.lookupUrl + '?q=' + encodeURIComponent(query))
+                    .then(response => response.json())
+                    .then(data => {
+                        if (input.value !== query) {
+                            return;
+                        }
+                        matches.innerHTML = '';
+                        data.forEach(function (row) {
+                            const option = document.createElement('option');
+                            option.value = row.name;
+                            option.dataset.id = row.id;
+                            matches.appendChild(option);
+                        });
+                    });
+            }, 200);
+        });
+    });
+});
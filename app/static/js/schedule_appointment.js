@@ -1,74 +1,77 @@
 $(document).ready(function () {
-    // Load clinics based on the selected procedure
+    // Clinics, doctors and free slots of the selected procedure, loaded in
+    // one request and reused when the clinic or the doctor changes
+    var options = null;
+
+    function fill(select, placeholder, items) {
+        $(select).empty().append('<option value="">' + placeholder + '</option>');
+        $.each(items, function (key, item) {
+            $(select).append($('<option>').val(item.value).text(item.label));
+        });
+        $(select).prop('disabled', false);
+    }
+
+    // Load the booking options of the selected procedure
     $('#id_procedure').change(function () {
         var procedureId = $(this).val();
+        options = null;
+        $('#id_clinic').empty().prop('disabled', true);
+        $('#id_doctor').empty().prop('disabled', true);
+        $('#id_appointment_date').empty().prop('disabled', true);
         if (procedureId) {
             $.ajax({
-                url: "/ajax/load-clinics/",
+                url: "/ajax/booking-options/",
                 data: {
                     'procedure_id': procedureId
                 },
                 success: function (data) {
-                    $('#id_clinic').empty().append('<option value="">Select a clinic</option>');
-                    $.each(data, function (key, value) {
-                        $('#id_clinic').append('<option value="' + value.id + '">' + value.name + '</option>');
-                    });
-                    $('#id_clinic').prop('disabled', false);
+                    if ($('#id_procedure').val() !== procedureId) {
+                        return;
+                    }
+                    options = data;
+                    fill('#id_clinic', 'Select a clinic', $.map(data.clinics, function (clinic) {
+                        return {value: clinic.id, label: clinic.name};
+                    }));
                 }
             });
-        } else {
-            $('#id_clinic').empty().prop('disabled', true);
-            $('#id_doctor').empty().prop('disabled', true);
-            $('#id_appointment_date').empty().prop('disabled', true);
         }
     });
 
-    // Load doctors based on the selected clinic and procedure
+    // List the doctors of the selected clinic
     $('#id_clinic').change(function () {
-        var procedureId = $('#id_procedure').val();
         var clinicId = $(this).val();
-        if (clinicId) {
-            $.ajax({
-                url: "/ajax/load-doctors/",
-                data: {
-                    'procedure_id': procedureId,
-                    'clinic_id': clinicId
-                },
-                success: function (data) {
-                    $('#id_doctor').empty().append('<option value="">Select a doctor</option>');
-                    $.each(data, function (key, value) {
-                        $('#id_doctor').append('<option value="' + value.id + '">' + value.name + '</option>');
-                    });
-                    $('#id_doctor').prop('disabled', false);
-                }
-            });
-        } else {
+        $('#id_appointment_date').empty().prop('disabled', true);
+        if (!clinicId || !options) {
             $('#id_doctor').empty().prop('disabled', true);
-            $('#id_appointment_date').empty().prop('disabled', true);
+            return;
         }
+        var names = {};
+        $.each(options.doctors, function (key, doctor) {
+            names[doctor.id] = doctor.name;
+        });
+        var clinic = $.grep(options.clinics, function (clinic) {
+            return String(clinic.id) === clinicId;
+        })[0];
+        fill('#id_doctor', 'Select a doctor', $.map(clinic ? clinic.doctors : [], function (doctorId) {
+            return {value: doctorId, label: names[doctorId]};
+        }));
     });
 
-    // Load available time slots based on the selected doctor and clinic
+    // List the free time slots of the selected doctor at the selected clinic
     $('#id_doctor').change(function () {
         var doctorId = $(this).val();
         var clinicId = $('#id_clinic').val();
-        if (doctorId) {
-            $.ajax({
-                url: "/ajax/load-timeslots/",
-                data: {
-                    'doctor_id': doctorId,
-                    'clinic_id': clinicId
-                },
-                success: function (data) {
-                    $('#id_appointment_date').empty().append('<option value="">Select a time slot</option>');
-                    $.each(data, function (key, value) {
-                        $('#id_appointment_date').append('<option value="' + value.start + '">' + value.start + ' - ' + value.end + '</option>');
-                    });
-                    $('#id_appointment_date').prop('disabled', false);
-                }
-            });
-        } else {
+        if (!doctorId || !options) {
             $('#id_appointment_date').empty().prop('disabled', true);
+            return;
         }
+        var days = (options.availability[clinicId] || {})[doctorId] || {};
+        var slots = [];
+        $.each(Object.keys(days).sort(), function (key, day) {
+            $.each(days[day], function (key, time) {
+                slots.push({value: day + 'T' + time, label: day + ' ' + time});
+            });
+        });
+        fill('#id_appointment_date', 'Select a time slot', slots);
     });
 });
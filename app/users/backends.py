@@ -1,13 +1,48 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.db.models import Q, Value
+from django.db.models.functions import Lower
 
 
 class EmailBackend(ModelBackend):
+    """Sign in with the email address, in any case, or the username."""
+
+    def get_login_user(self, login):
+        """Return the user ``login`` names, looked up with a single query.
+
+        An exact email wins over an email differing in case, which wins
+        over a username.
+        """
+        UserModel = get_user_model()
+        # Compared through LOWER() to use the user_email_lower_idx index,
+        # which email__iexact (LIKE or UPPER()) would not
+        users = list(
+            UserModel._default_manager.alias(email_lower=Lower("email"))
+            .filter(Q(email_lower=Lower(Value(login))) | Q(username=login))
+            .order_by("pk")[:3]
+        )
+        for matches in (
+            lambda user: user.email == login,
+            lambda user: user.email.lower() == login.lower(),
+            lambda user: user.username == login,
+        ):
+            for user in users:
+                if matches(user):
+                    return user
+        return None
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         UserModel = get_user_model()
-        user = UserModel.objects.filter(email=username).first()
-        if not user:
-            user = UserModel.objects.filter(username=username).first()
-        if user and user.check_password(password):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = self.get_login_user(username)
+        if user is None or not user.has_usable_password():
+            # Run the password hasher anyway, so that unknown logins and
+            # users without a password take as long as a wrong password
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
             return user
         return None
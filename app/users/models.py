@@ -1,9 +1,21 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractUser
 
+from core.search import PrefixIndex
+
 
 class User(AbstractUser):
     email = models.EmailField("email address", unique=True)
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["last_name", "first_name"], name="user_name_idx"),
+            # Case-insensitive last name search
+            PrefixIndex(Lower("last_name"), name="user_last_name_lower_idx"),
+            # Case-insensitive email lookups at login
+            models.Index(Lower("email"), name="user_email_lower_idx"),
+        ]
@@ -1,3 +1,63 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import authenticate, get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.testing import TestCase
+
+User = get_user_model()
+
+
+class EmailBackendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="janedoe", email="Jane.Doe@example.com", password="12345"
+        )
+
+    def test_login_with_email_in_any_case_or_username(self):
+        """Test the email matches case-insensitively, in one query"""
+        for login in ["Jane.Doe@example.com", "jane.doe@EXAMPLE.com", "janedoe"]:
+            with CaptureQueriesContext(connection) as queries:
+                user = authenticate(username=login, password="12345")
+            self.assertEqual(user, self.user, login)
+            self.assertEqual(len(queries), 1, login)
+            self.assertIn("LOWER", queries[0]["sql"])
+        self.assertIsNone(authenticate(username="janedoe", password="wrong"))
+
+    def test_exact_email_wins(self):
+        """Test an exact email match is preferred over other matches"""
+        other = User.objects.create_user(
+            username="jane.doe@example.com", email="jane@example.org", password="x"
+        )
+        exact = User.objects.create_user(
+            username="jane2", email="jane.doe@example.com", password="67890"
+        )
+        self.assertEqual(
+            authenticate(username="jane.doe@example.com", password="67890"), exact
+        )
+        self.assertEqual(
+            authenticate(username="JANE.DOE@example.com", password="12345"),
+            self.user,
+        )
+        self.assertIsNone(authenticate(username="jane.doe@example.com", password="x"))
+        self.assertEqual(authenticate(username="jane@example.org", password="x"), other)
+
+    def test_unknown_and_passwordless_users_run_the_hasher(self):
+        """Test every failed login costs one password hash"""
+        User.objects.create_user(username="invitee", email="invitee@example.com")
+        with mock.patch(
+            "django.contrib.auth.base_user.make_password",
+            side_effect=lambda password: "hashed",
+        ) as make_password:
+            self.assertIsNone(authenticate(username="nobody", password="12345"))
+            self.assertIsNone(
+                authenticate(username="invitee@example.com", password="12345")
+            )
+        self.assertEqual(make_password.call_count, 2)
+
+    def test_inactive_users_cannot_login(self):
+        """Test inactive users are refused even with the right password"""
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(authenticate(username="janedoe", password="12345"))